@@ -0,0 +1,135 @@
+import time
+from contextlib import asynccontextmanager
+
+import db
+import metrics
+from config import DB_CONFIG
+
+try:
+    import psycopg
+    from psycopg.conninfo import make_conninfo
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:  # psycopg 3 нужен только asyncio-режиму
+    psycopg = None
+    AsyncConnectionPool = None
+
+# ================================
+# АСИНХРОННЫЙ ПУЛ СОЕДИНЕНИЙ
+# ================================
+# В asyncio-режиме (async_bot.py) частые запросы - запись подходов, итоги
+# по упражнениям и экраны статистики - идут через psycopg 3 и
+# AsyncConnectionPool: ожидание БД не занимает поток, одновременных
+# запросов столько, сколько соединений в пуле. Параметры соединения те же,
+# что у db.py, размер пула задаётся отдельно (по умолчанию pool_min и
+# pool_max):
+#
+#   DB_CONFIG = {..., 'async_pool_min': 2, 'async_pool_max': 20}
+#
+# Параметры запросов (%s, %(name)s) у psycopg 3 те же, что у psycopg2,
+# поэтому SQL общий с синхронными модулями.
+
+Error = psycopg.Error if psycopg is not None else Exception
+
+_pool = None
+
+
+class Cursor:
+    """Курсор psycopg 3, который пишет время и ошибки запросов в метрики, как db.TimedCursor."""
+
+    __slots__ = ("_cur",)
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    async def execute(self, query, params=None):
+        label = db.statement_label(query)
+        started = time.perf_counter()
+        try:
+            await self._cur.execute(query, params)
+        except psycopg.Error:
+            metrics.DB_ERRORS.inc(label)
+            raise
+        finally:
+            metrics.DB_QUERY_SECONDS.observe(time.perf_counter() - started, label)
+        return self
+
+    async def fetchone(self):
+        return await self._cur.fetchone()
+
+    async def fetchall(self):
+        return await self._cur.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+
+def _conninfo():
+    params = db._connect_params()
+    params.pop("cursor_factory", None)
+    # psycopg2 понимает database, libpq - только dbname
+    if "database" in params:
+        params.setdefault("dbname", params.pop("database"))
+    return make_conninfo(**params)
+
+
+async def start():
+    """Открывает пул; вызывается из цикла событий при запуске."""
+    global _pool
+    if _pool is not None:
+        return
+    if AsyncConnectionPool is None:
+        raise RuntimeError("Для asyncio-режима нужен psycopg 3: pip install 'psycopg[binary]' psycopg-pool")
+    pool = AsyncConnectionPool(
+        _conninfo(),
+        min_size=int(DB_CONFIG.get("async_pool_min", DB_CONFIG.get("pool_min", 1))),
+        max_size=int(DB_CONFIG.get("async_pool_max", DB_CONFIG.get("pool_max", 10))),
+        # Соединение проверяется перед выдачей, оборванное пересоздаётся
+        check=AsyncConnectionPool.check_connection,
+        name="gym-async",
+        open=False,
+    )
+    await pool.open()
+    _pool = pool
+
+
+async def stop():
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+
+@asynccontextmanager
+async def transaction():
+    """Как db.transaction: своё соединение из пула, commit при успехе, rollback при ошибке."""
+    if _pool is None:
+        raise RuntimeError("Асинхронный пул не открыт (adb.start)")
+    async with _pool.connection() as conn:
+        async with conn.cursor() as cur:
+            yield Cursor(cur)
+
+
+async def insert_values(cur, query, rows, fetch=False):
+    """execute_values для psycopg 3: запрос с VALUES %s, все строки - одним INSERT."""
+    row = "(" + ", ".join(["%s"] * len(rows[0])) + ")"
+    query = query.replace("VALUES %s", "VALUES " + ", ".join([row] * len(rows)), 1)
+    await cur.execute(query, [value for r in rows for value in r])
+    return await cur.fetchall() if fetch else None
+
+
+async def fetchall(query, params=None):
+    async with transaction() as cur:
+        await cur.execute(query, params)
+        return await cur.fetchall()
+
+
+async def fetchone(query, params=None):
+    async with transaction() as cur:
+        await cur.execute(query, params)
+        return await cur.fetchone()
+
+
+async def execute(query, params=None):
+    async with transaction() as cur:
+        await cur.execute(query, params)
@@ -0,0 +1,306 @@
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+import psycopg2
+
+import adb
+import catalog
+import db
+import stats
+
+# ================================
+# АНАЛИТИКА ПРОГРЕССА
+# ================================
+# История упражнения чата (одиночные подходы и обе половины суперсетов)
+# хранится в памяти массивами NumPy. Из БД дочитываются только новые строки
+# (см. ниже), поэтому показ прогресса - один запрос по индексу свежих секций,
+# сколько бы лет истории ни было у пользователя. Отчёт считается
+# векторно по массивам и кэшируется до появления новых строк, то есть по
+# ключу (чат, упражнение, последний id).
+#
+# Id строк выдаются при вставке, а видны строки после commit, поэтому
+# строка с меньшим id может появиться позже прочитанной большей. Дочитывание
+# каждый раз захватывает последние RECHECK_IDS id ещё раз и пропускает уже
+# загруженные. Кроме того, оно ограничено датами от RECHECK_DAYS дней до
+# предыдущего чтения: в плане остаются только свежие месячные секции.
+# Подходы за более ранние дни появляются только при загрузке CSV, а она
+# сбрасывает историю чата целиком (forget_chat).
+#
+# Расчётный максимум на одно повторение (1ПМ) - по формуле Эпли
+# w * (1 + reps / 30), для одного повторения - сам вес. Подходы больше чем
+# на E1RM_MAX_REPS повторений в 1ПМ и рекордах не участвуют: для них формула
+# слишком неточна.
+
+CACHE_SIZE = 5000
+E1RM_MAX_REPS = 12
+ROLLING_SESSIONS = 4
+TREND_WEEKS = 12
+WEEKS_SHOWN = 8
+RECHECK_IDS = 100000
+# Журнал записи (writer.py) может донести подходы прошлых дней после
+# недоступности БД: столько дней назад от прошлого чтения они ещё будут найдены
+RECHECK_DAYS = 7
+# Понедельник, от которого отсчитываются номера недель
+_MONDAY = np.datetime64("1969-12-29", "D")
+
+HISTORY_SQL = """
+    SELECT FALSE, id, date, created_at, weight_kg, reps_count
+    FROM gym.workout_stats
+    WHERE chat_id = %(chat_id)s AND exercise_id = %(ex_id)s AND id > %(after_set)s AND date >= %(since)s
+    UNION ALL
+    SELECT TRUE, id, date, created_at, first_weight_kg, first_reps_count
+    FROM gym.supersets
+    WHERE chat_id = %(chat_id)s AND first_exercise_id = %(ex_id)s AND id > %(after_superset)s AND date >= %(since)s
+    UNION ALL
+    SELECT TRUE, id, date, created_at, second_weight_kg, second_reps_count
+    FROM gym.supersets
+    WHERE chat_id = %(chat_id)s AND second_exercise_id = %(ex_id)s AND id > %(after_superset)s AND date >= %(since)s
+    ORDER BY 3, 4
+"""
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # (chat_id, exercise_id) -> History
+
+log = logging.getLogger(__name__)
+
+
+class History:
+    __slots__ = (
+        "lock", "loaded", "loaded_on", "recent", "last_set_id", "last_superset_id", "dates", "weights", "reps",
+        "best_e1rm", "best_weight", "report", "report_day",
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.loaded_on = None  # дата прошлого чтения
+        self.recent = set()  # (суперсет?, id) последних RECHECK_IDS id, уже загруженные
+        self.last_set_id = 0
+        self.last_superset_id = 0
+        self.dates = np.empty(0, dtype="datetime64[D]")
+        self.weights = np.empty(0)
+        self.reps = np.empty(0)
+        self.best_e1rm = None
+        self.best_weight = None
+        self.report = None
+        self.report_day = None
+
+    def query_params(self, chat_id, ex_id):
+        return {
+            "chat_id": chat_id,
+            "ex_id": ex_id,
+            "after_set": max(0, self.last_set_id - RECHECK_IDS),
+            "after_superset": max(0, self.last_superset_id - RECHECK_IDS),
+            "since": self.loaded_on - timedelta(days=RECHECK_DAYS) if self.loaded_on else date.min,
+        }
+
+    def load_new(self, chat_id, ex_id):
+        """Дочитывает новые строки; возвращает True, если они были."""
+        today = date.today()
+        return self.add_rows(db.fetchall(HISTORY_SQL, self.query_params(chat_id, ex_id)), today)
+
+    def add_rows(self, rows, today):
+        """Добавляет строки HISTORY_SQL, прочитанные на дату today."""
+        self.loaded = True
+        self.loaded_on = today
+        rows = [row for row in rows if (row[0], row[1]) not in self.recent]
+        if not rows:
+            return False
+        is_superset, ids, dates, _, weights, reps = zip(*rows)
+        ids = np.array(ids)
+        is_superset = np.array(is_superset, dtype=bool)
+        if (~is_superset).any():
+            self.last_set_id = max(self.last_set_id, int(ids[~is_superset].max()))
+        if is_superset.any():
+            self.last_superset_id = max(self.last_superset_id, int(ids[is_superset].max()))
+        self.recent.update((bool(s), int(i)) for s, i in zip(is_superset, ids))
+        self.recent = {
+            (s, i) for s, i in self.recent
+            if i > (self.last_superset_id if s else self.last_set_id) - RECHECK_IDS
+        }
+        new_dates = np.array(dates, dtype="datetime64[D]")
+        new_weights = np.array([np.nan if w is None else float(w) for w in weights])
+        new_reps = np.array([np.nan if r is None else r for r in reps], dtype=float)
+        # Загруженная история может оказаться старше уже прочитанной
+        in_order = not len(self.dates) or new_dates[0] >= self.dates[-1]
+        self.dates = np.concatenate((self.dates, new_dates))
+        self.weights = np.concatenate((self.weights, new_weights))
+        self.reps = np.concatenate((self.reps, new_reps))
+        if not in_order:
+            order = np.argsort(self.dates, kind="stable")
+            self.dates, self.weights, self.reps = self.dates[order], self.weights[order], self.reps[order]
+        self._update_bests(e1rm(new_weights, new_reps), new_weights)
+        self.report = None
+        return True
+
+    def _update_bests(self, values, weights):
+        # Лучшие результаты только растут: их мог поднять и подход, который
+        # ещё не дошёл до БД (см. check_record)
+        if np.isfinite(values).any():
+            self.best_e1rm = max(self.best_e1rm or 0.0, float(np.nanmax(values)))
+        if np.isfinite(weights).any():
+            self.best_weight = max(self.best_weight or 0.0, float(np.nanmax(weights)))
+
+
+def e1rm(weights, reps):
+    """Расчётный 1ПМ по подходам (массивы); NaN, где он не определён."""
+    weights = np.asarray(weights, dtype=float)
+    reps = np.asarray(reps, dtype=float)
+    with np.errstate(invalid="ignore"):
+        valid = (weights > 0) & (reps >= 1) & (reps <= E1RM_MAX_REPS)
+        values = np.where(reps == 1, weights, weights * (1 + reps / 30.0))
+    return np.where(valid, values, np.nan)
+
+
+def _history(chat_id, ex_id):
+    key = (chat_id, ex_id)
+    with _lock:
+        h = _cache.get(key)
+        if h is None:
+            h = _cache[key] = History()
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+        else:
+            _cache.move_to_end(key)
+    return h
+
+
+def _compute(h, today):
+    dates, weights, reps = h.dates, h.weights, h.reps
+    values = e1rm(weights, reps)
+    tonnage = np.nan_to_num(weights) * np.nan_to_num(reps)
+    # Даты отсортированы: тренировки - непрерывные отрезки массива
+    starts = np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]])
+    session_dates = dates[starts]
+    session_tonnage = np.add.reduceat(tonnage, starts)
+    session_best = np.fmax.reduceat(values, starts)
+
+    report = {
+        "sets": len(dates),
+        "sessions": len(starts),
+        "last_date": session_dates[-1].item(),
+        "last_tonnage": float(session_tonnage[-1]),
+        "best_e1rm": None,
+        "best_weight": None,
+        "current_e1rm": None,
+        "trend": None,
+        "records": 0,
+        "last_record": None,
+    }
+    if np.isfinite(values).any():
+        i = int(np.nanargmax(values))
+        report["best_e1rm"] = (float(values[i]), dates[i].item())
+        # Рекорд - подход, превысивший все предыдущие (первый подход не в счёт)
+        filled = np.where(np.isfinite(values), values, -np.inf)
+        previous = np.r_[-np.inf, np.maximum.accumulate(filled)[:-1]]
+        records = np.flatnonzero((filled > previous) & np.isfinite(previous))
+        report["records"] = len(records)
+        if len(records):
+            report["last_record"] = dates[records[-1]].item()
+    if np.isfinite(weights).any():
+        i = int(np.nanargmax(weights))
+        report["best_weight"] = (float(weights[i]), dates[i].item())
+
+    # Текущий 1ПМ - скользящее среднее лучших 1ПМ последних тренировок
+    best = session_best[np.isfinite(session_best)]
+    if len(best):
+        report["current_e1rm"] = float(best[-ROLLING_SESSIONS:].mean())
+
+    # Тренд - наклон прямой по лучшим 1ПМ тренировок за TREND_WEEKS недель
+    day_numbers = (session_dates - np.datetime64(today, "D")).astype(int)
+    recent = np.isfinite(session_best) & (day_numbers > -TREND_WEEKS * 7)
+    if recent.sum() >= 3 and np.ptp(day_numbers[recent]) > 0:
+        slope = np.polyfit(day_numbers[recent], session_best[recent], 1)[0]
+        report["trend"] = float(slope * 7)
+
+    # Объём по неделям (с понедельника), последние WEEKS_SHOWN недель
+    weeks = (dates - _MONDAY).astype(int) // 7
+    this_week = (np.datetime64(today, "D") - _MONDAY).astype(int) // 7
+    offset = weeks - (this_week - WEEKS_SHOWN + 1)
+    shown = offset >= 0
+    weekly = np.bincount(offset[shown], weights=tonnage[shown], minlength=WEEKS_SHOWN)[:WEEKS_SHOWN]
+    first_monday = _MONDAY + np.timedelta64(int(this_week - WEEKS_SHOWN + 1) * 7, "D")
+    report["weekly"] = [
+        ((first_monday + np.timedelta64(7 * n, "D")).item(), float(v)) for n, v in enumerate(weekly)
+    ]
+    return report
+
+
+def progress(chat_id, ex_id):
+    """Отчёт о прогрессе по упражнению; None, если подходов нет."""
+    h = _history(chat_id, ex_id)
+    with h.lock:
+        h.load_new(chat_id, ex_id)
+        if not len(h.dates):
+            return None
+        today = date.today()
+        if h.report is None or h.report_day != today:
+            h.report = _compute(h, today)
+            h.report_day = today
+        return h.report
+
+
+def check_record(chat_id, ex_id, weight, reps):
+    """Проверяет новый подход на рекорд до его записи.
+
+    Сравнение идёт с лучшими результатами в памяти, история читается из БД
+    только при первом обращении к упражнению. Возвращает список побитых
+    рекордов: ("e1rm", значение) и/или ("weight", значение). Если история
+    не прочитана из-за недоступной БД, рекорды не проверяются: запись
+    подхода (через журнал) от БД не зависит.
+    """
+    h = _history(chat_id, ex_id)
+    with h.lock:
+        if not h.loaded:
+            try:
+                h.load_new(chat_id, ex_id)
+            except psycopg2.Error as e:
+                log.warning("Рекорды не проверены chat=%s упражнение_id=%s: %s", chat_id, ex_id, e)
+                return []
+        return _check(h, weight, reps)
+
+
+async def check_record_async(chat_id, ex_id, weight, reps):
+    """check_record для asyncio-режима: история читается через adb.py."""
+    h = _history(chat_id, ex_id)
+    if not h.loaded:
+        today = date.today()
+        try:
+            rows = await adb.fetchall(HISTORY_SQL, h.query_params(chat_id, ex_id))
+        except adb.Error as e:
+            log.warning("Рекорды не проверены chat=%s упражнение_id=%s: %s", chat_id, ex_id, e)
+            return []
+        with h.lock:
+            # Пока шёл запрос, историю мог прочитать другой обработчик
+            if not h.loaded:
+                h.add_rows(rows, today)
+    with h.lock:
+        return _check(h, weight, reps)
+
+
+def _check(h, weight, reps):
+    value = float(e1rm([np.nan if weight is None else weight], [reps])[0])
+    records = []
+    if np.isfinite(value):
+        if h.best_e1rm is not None and value > h.best_e1rm + 1e-9:
+            records.append(("e1rm", value))
+        h.best_e1rm = max(h.best_e1rm or 0.0, value)
+    if weight:
+        weight = float(weight)
+        if h.best_weight is not None and weight > h.best_weight:
+            records.append(("weight", weight))
+        h.best_weight = max(h.best_weight or 0.0, weight)
+    return records
+
+
+def forget_chat(chat_id):
+    """Сбрасывает историю чата: после загрузки CSV лучшие результаты могли измениться."""
+    with _lock:
+        for key in [k for k in _cache if k[0] == chat_id]:
+            del _cache[key]
+
+
+catalog.subscribe(stats.CHAT_CHANNEL, lambda payload: forget_chat(int(payload)))
@@ -0,0 +1,368 @@
+import argparse
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from aiohttp import web
+from telebot import asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+
+import adb
+import analytics
+import bot as handlers
+import catalog
+import config
+import flow
+import keyboards
+import metrics
+import router
+import sessions
+import stats
+import writer
+from config import TOKEN, DB_CONFIG
+
+# ================================
+# ASYNCIO-РЕЖИМ
+# ================================
+# Обмен с Telegram идёт через AsyncTeleBot в одном цикле событий, поэтому
+# ожидание ответа API не занимает поток. Самые частые нажатия - запись
+# подхода и экраны статистики - обрабатываются прямо в цикле событий (см.
+# ниже), а их запросы к БД идут через асинхронный пул psycopg 3 (adb.py):
+# тысячи одновременных нажатий ждут БД и Telegram без потоков. Остальные
+# обработчики из bot.py выполняются в пуле потоков размером с пул
+# соединений БД. Вызовы bot.send_message / bot.edit_message_text из любых
+# обработчиков ставятся в цикл событий и сразу возвращаются; исходящие
+# запросы одного чата уходят строго по порядку.
+#
+#   python async_bot.py              # long polling
+#   python async_bot.py --webhook    # HTTP-сервер для вебхука
+#
+# Настройки вебхука в config.py:
+#
+#   WEBHOOK = {
+#       'url': 'https://example.com/bot',  # публичный адрес, передаётся в setWebhook
+#       'path': '/bot',
+#       'listen': '0.0.0.0',
+#       'port': 8080,
+#       'secret_token': 'случайная строка',
+#   }
+
+WEBHOOK = getattr(config, "WEBHOOK", {})
+
+# Сколько обновлений обрабатывается одновременно на один поток пула
+IN_FLIGHT_PER_WORKER = 4
+
+_routes = {}  # действие -> (async-обработчик, типы аргументов)
+
+log = logging.getLogger("async_bot")
+
+
+class LoopBot:
+    """Синхронный фасад над AsyncTeleBot для обработчиков из bot.py."""
+
+    def __init__(self, abot, loop):
+        self._abot = abot
+        self._loop = loop
+        self._tails = {}
+
+    def __getattr__(self, name):
+        method = getattr(self._abot, name)
+        if not asyncio.iscoroutinefunction(method):
+            return method
+
+        def call(*args, **kwargs):
+            chat_id = kwargs.get("chat_id")
+            if chat_id is None:
+                # У edit_message_text первым аргументом идёт текст
+                pos = 1 if name == "edit_message_text" else 0
+                chat_id = args[pos] if len(args) > pos else None
+            return asyncio.run_coroutine_threadsafe(
+                self._ordered(chat_id, name, method(*args, **kwargs)), self._loop
+            )
+        return call
+
+    async def _ordered(self, chat_id, name, coro):
+        prev = self._tails.get(chat_id)
+        task = asyncio.current_task()
+        self._tails[chat_id] = task
+        try:
+            if prev is not None:
+                await asyncio.wait([prev])
+            started = time.perf_counter()
+            try:
+                return await coro
+            finally:
+                metrics.TELEGRAM_SECONDS.observe(time.perf_counter() - started, name)
+        except Exception as e:
+            code = getattr(e, "error_code", None) or type(e).__name__
+            metrics.TELEGRAM_ERRORS.inc(name, str(code))
+            log.warning("Ошибка Telegram API %s chat=%s: %s", name, chat_id, e)
+            # Ошибку получит тот, кто ждёт результата (очередь исходящих повторит запрос)
+            raise
+        finally:
+            if self._tails.get(chat_id) is task:
+                del self._tails[chat_id]
+
+
+# ================================
+# ЧАСТЫЕ НАЖАТИЯ В ЦИКЛЕ СОБЫТИЙ
+# ================================
+# Обработчики ниже заменяют одноимённые из bot.py: вместо блокирующих
+# вызовов psycopg2 они ждут БД через adb.py. Тексты, клавиатуры и контекст
+# сценария общие с bot.py. В потоке остаются только редкие случаи: новое
+# значение веса, сброс журнала или очереди отложенной записи и состояние
+# чата в sqlite/postgres.
+
+def route(action, *arg_types):
+    def decorator(func):
+        _routes[action] = (func, arg_types)
+        return func
+    return decorator
+
+
+def resolve(update):
+    """(действие, обработчик, call, аргументы) для нажатия с async-обработчиком, иначе None."""
+    call = update.callback_query
+    if call is None or call.message is None:
+        return None
+    action, raw_args = router.parse(call.data)
+    entry = _routes.get(action)
+    if entry is None or len(raw_args) != len(entry[1]):
+        return None
+    try:
+        args = [t(a) for t, a in zip(entry[1], raw_args)]
+    except ValueError:
+        # Некорректный callback разберёт и запишет в лог router.dispatch
+        return None
+    return action, entry[0], call, args
+
+
+async def ensure_weight(weight):
+    # Вес с клавиатуры уже есть в справочнике, новый записывается в потоке
+    if not catalog.has_weight(weight):
+        await asyncio.to_thread(catalog.save_values, weights=[weight])
+
+
+@route("w", float, flow.decode)
+async def choose_weight(call, weight, ctx):
+    await ensure_weight(weight)
+    await finish_set(call, ctx.replace(weight=weight))
+
+
+@route("no_weight", flow.decode)
+async def no_weight(call, ctx):
+    await finish_set(call, ctx.replace(weight=None))
+
+
+async def finish_set(call, ctx):
+    chat_id = call.message.chat.id
+    records = await analytics.check_record_async(chat_id, ctx["exercise_id"], ctx["weight"], ctx["reps"])
+    await writer.add_set_async(
+        chat_id, date.today(), ctx["exercise_id"], ctx["set_number"], ctx["weight"], ctx["reps"],
+        message_id=call.message.message_id, flow_id=ctx["flow_id"],
+    )
+    handlers.set_saved(call, ctx, records)
+
+
+@route("sw2", float, flow.decode)
+async def s_choose_weight2(call, weight, ctx):
+    await ensure_weight(weight)
+    await finish_superset(call, ctx.replace(s2_weight=weight))
+
+
+@route("sno_weight2", flow.decode)
+async def s_no_weight2(call, ctx):
+    await finish_superset(call, ctx.replace(s2_weight=None))
+
+
+async def finish_superset(call, ctx):
+    chat_id = call.message.chat.id
+    records = []
+    for ex_id, weight, reps in handlers.superset_halves(ctx):
+        records += [(ex_id, kind, value) for kind, value in await analytics.check_record_async(chat_id, ex_id, weight, reps)]
+    await writer.add_superset_async(
+        chat_id, date.today(), ctx["s1_exercise_id"], ctx["s2_exercise_id"], ctx["set_number"],
+        ctx["s1_weight"], ctx["s1_reps"], ctx["s2_weight"], ctx["s2_reps"],
+        message_id=call.message.message_id, flow_id=ctx["flow_id"],
+    )
+    handlers.superset_saved(call, ctx, records)
+
+
+@route("stats_day")
+async def stats_day(call):
+    today = datetime.today()
+    await show_calendar(call, today.year, today.month)
+
+
+@route("cal", int, int)
+async def stats_calendar_nav(call, y, m):
+    await show_calendar(call, y, m)
+
+
+async def show_calendar(call, year, month):
+    chat_id = call.message.chat.id
+    await writer.flush_chat_async(chat_id)
+    kb = keyboards.calendar_menu(year, month, await stats.trained_days_async(chat_id, year, month))
+    handlers.bot.edit_message_text("Выберите день:", chat_id, call.message.message_id, reply_markup=kb)
+
+
+@route("day", int, int, int)
+async def stats_day_pick(call, y, m, d):
+    chat_id = call.message.chat.id
+    await writer.flush_chat_async(chat_id)
+    text = await stats.day_summary_async(chat_id, date(y, m, d))
+    handlers.bot.edit_message_text(text, chat_id, call.message.message_id, reply_markup=keyboards.back("stats_day"))
+
+
+@route("stat_ex", int)
+async def stats_exercise_show(call, ex_id):
+    await show_exercise_stats(call, ex_id, 30)
+
+
+@route("stat_exw", int, int)
+async def stats_exercise_window(call, ex_id, days):
+    if days in stats.WINDOWS:
+        await show_exercise_stats(call, ex_id, days)
+
+
+async def show_exercise_stats(call, ex_id, days):
+    chat_id = call.message.chat.id
+    await writer.flush_chat_async(chat_id)
+    res = await stats.exercise_stats_async(chat_id, ex_id, days)
+    kb = keyboards.stats_windows(ex_id, days)
+    handlers.bot.edit_message_text(handlers.exercise_stats_text(ex_id, days, res), chat_id, call.message.message_id, reply_markup=kb)
+
+
+# ================================
+# ЗАПУСК
+# ================================
+
+class AsyncRuntime:
+    def __init__(self):
+        workers = int(DB_CONFIG.get("pool_max", 10))
+        self.loop = asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="handler")
+        self.slots = asyncio.Semaphore(workers * IN_FLIGHT_PER_WORKER)
+        self.abot = AsyncTeleBot(TOKEN)
+        # Синхронный TeleBot остаётся реестром обработчиков и фильтров,
+        # а все исходящие вызовы уходят через цикл событий
+        self.dispatcher = handlers.bot
+        self.dispatcher.threaded = False
+        handlers.bot = LoopBot(self.abot, self.loop)
+
+    async def handle(self, update):
+        resolved = resolve(update)
+        if resolved is not None:
+            await self.handle_callback(*resolved)
+            return
+        async with self.slots:
+            try:
+                await self.loop.run_in_executor(self.executor, self.dispatcher.process_new_updates, [update])
+            except Exception as e:
+                log.exception("Ошибка обработки обновления %s: %s", update.update_id, e)
+
+    async def sessions_call(self, func, chat_id):
+        # Состояние в sqlite или postgres читается и пишется в потоке
+        if sessions.PERSISTENT:
+            await self.loop.run_in_executor(self.executor, func, chat_id)
+        else:
+            func(chat_id)
+
+    async def handle_callback(self, action, func, call, args):
+        """Как bot.on_callback и router.dispatch, но обработчик - корутина из _routes."""
+        chat_id = call.message.chat.id
+        try:
+            handlers.bot.answer_callback_query(call.id)
+        except Exception as e:
+            log.warning("Не удалось ответить на callback chat=%s: %s", chat_id, e)
+        started = time.perf_counter()
+        try:
+            await self.sessions_call(sessions.get, chat_id)
+            await func(call, *args)
+        except Exception as e:
+            metrics.CALLBACK_ERRORS.inc(action)
+            if isinstance(e, catalog.Unknown):
+                handlers.stale_button(call, e)
+            else:
+                log.exception("Ошибка обработки callback %r chat=%s: %s", call.data, chat_id, e)
+        finally:
+            metrics.CALLBACK_SECONDS.observe(time.perf_counter() - started, action)
+            try:
+                await self.sessions_call(sessions.save, chat_id)
+            except Exception as e:
+                log.error("Состояние чата %s не сохранено: %s", chat_id, e)
+
+    def submit(self, update):
+        self.loop.create_task(self.handle(update))
+
+    async def poll(self):
+        await self.abot.delete_webhook()
+        offset = None
+        while True:
+            try:
+                updates = await self.abot.get_updates(offset=offset, timeout=20, request_timeout=30)
+            except Exception as e:
+                log.warning("Ошибка получения обновлений: %s", e)
+                await asyncio.sleep(3)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                self.submit(update)
+
+    async def serve_webhook(self):
+        secret = WEBHOOK.get("secret_token")
+        path = WEBHOOK.get("path", "/bot")
+
+        async def receive(request):
+            if secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+                return web.Response(status=403)
+            self.submit(types.Update.de_json(await request.json()))
+            return web.Response()
+
+        app = web.Application()
+        app.router.add_post(path, receive)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, WEBHOOK.get("listen", "0.0.0.0"), int(WEBHOOK.get("port", 8080))).start()
+        await self.abot.set_webhook(url=WEBHOOK["url"], secret_token=secret)
+        log.info("Вебхук слушает %s:%s%s", WEBHOOK.get("listen", "0.0.0.0"), WEBHOOK.get("port", 8080), path)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    async def close(self):
+        self.executor.shutdown(wait=True)
+        # Очередь исходящих дописывается через цикл событий, поэтому
+        # остановка выполняется в отдельном потоке, пока цикл ещё работает
+        await self.loop.run_in_executor(None, handlers.shutdown)
+        await adb.stop()
+        await self.abot.close_session()
+
+
+async def main(use_webhook):
+    if handlers.API_URL:
+        asyncio_helper.API_URL = handlers.API_URL
+    runtime = AsyncRuntime()
+    handlers.startup()
+    await adb.start()
+    log.info("Бот запущен (asyncio).")
+    try:
+        if use_webhook:
+            await runtime.serve_webhook()
+        else:
+            await runtime.poll()
+    finally:
+        await runtime.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Запуск бота в asyncio-режиме")
+    parser.add_argument("--webhook", action="store_true", help="принимать обновления через вебхук")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.webhook))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,321 @@
+import argparse
+import email.parser
+import email.policy
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import urllib.request
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+# ================================
+# ПОДДЕЛЬНЫЙ TELEGRAM BOT API
+# ================================
+# HTTP-сервер с теми методами Bot API, которыми пользуется бот: getUpdates
+# (long polling), setWebhook/deleteWebhook (обновления тогда доставляются
+# POST-запросами на адрес вебхука), sendMessage, editMessageText,
+# answerCallbackQuery, answerInlineQuery, sendDocument. Бот направляется сюда
+# без изменений кода, настройкой в config.py:
+#
+#   API_URL = 'http://127.0.0.1:8081/bot{0}/{1}'
+#
+# Исходящие методы можно замедлять (latency + случайная добавка до jitter)
+# и портить: с вероятностью rate_429 ответ - 429 Too Many Requests с
+# retry_after, с вероятностью fail_rate - 500. Сам по себе сервер только
+# принимает вызовы; обновления ему подаёт нагрузочный тест (bench/load.py)
+# через push, а ответы бота получает через on_message.
+#
+#   python bench/fake_api.py --port 8081 --latency-ms 40 --rate-429 0.01
+
+# Методы, к которым применяются задержка и ошибки: остальные (getUpdates,
+# setWebhook, ...) - служебные, их сбои мешали бы измерению
+FAULTY = frozenset(("sendmessage", "editmessagetext", "answercallbackquery", "answerinlinequery", "senddocument"))
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Gym Bot", "username": "gym_load_bot"}
+MAX_UPDATES = 100
+
+log = logging.getLogger("fake_api")
+
+
+class ApiError(Exception):
+    def __init__(self, code, description, retry_after=None):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.retry_after = retry_after
+
+
+def _body_params(content_type, body):
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    if content_type.startswith("multipart/form-data"):
+        # Файлы (sendDocument) не нужны: берутся только текстовые поля
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+        )
+        return {
+            part.get_param("name", header="content-disposition"): part.get_content()
+            for part in message.iter_parts() if part.get_filename() is None
+        }
+    return dict(parse_qsl(body.decode("utf-8")))
+
+
+class FakeTelegram:
+    def __init__(self, latency=0.0, jitter=0.0, rate_429=0.0, fail_rate=0.0, retry_after=1, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.fail_rate = fail_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.cond = threading.Condition()
+        self.updates = deque()  # (update_id, обновление), ещё не подтверждённые offset
+        self.next_update_id = 1
+        self.message_ids = Counter()
+        self.webhook = None
+        self.deliveries = queue.SimpleQueue()
+        self.delivery_threads = []
+        self.calls = Counter()
+        self.injected = Counter()  # (метод, код ошибки)
+        self.webhook_errors = 0
+        self.connected = threading.Event()
+        # on_message(method, chat_id, message) - ответы бота для нагрузочного теста
+        self.on_message = None
+        self.methods = {
+            "getme": lambda p: BOT_USER,
+            "getupdates": self.get_updates,
+            "setwebhook": self.set_webhook,
+            "deletewebhook": self.delete_webhook,
+            "getwebhookinfo": self.webhook_info,
+            "sendmessage": self.send_message,
+            "editmessagetext": self.edit_message_text,
+            "senddocument": self.send_document,
+        }
+
+    # ---------- обновления ----------
+
+    def push(self, update):
+        """Добавляет обновление (без update_id); возвращает присвоенный update_id."""
+        with self.cond:
+            update_id = self.next_update_id
+            self.next_update_id += 1
+            update = dict(update, update_id=update_id)
+            if self.webhook is not None:
+                self.deliveries.put(update)
+            else:
+                self.updates.append((update_id, update))
+                self.cond.notify_all()
+        return update_id
+
+    def get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        limit = min(int(params.get("limit") or MAX_UPDATES), MAX_UPDATES)
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+        self.connected.set()
+        with self.cond:
+            if self.webhook is not None:
+                raise ApiError(409, "Conflict: can't use getUpdates method while webhook is active")
+            while self.updates and self.updates[0][0] < offset:
+                self.updates.popleft()
+            while not self.updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self.cond.wait(remaining)
+            return [update for _, update in list(self.updates)[:limit]]
+
+    def set_webhook(self, params):
+        url = params.get("url")
+        if not url:
+            return self.delete_webhook(params)
+        with self.cond:
+            self.webhook = (url, params.get("secret_token"))
+            # Недоставленные обновления переходят к вебхуку
+            for _, update in self.updates:
+                self.deliveries.put(update)
+            self.updates.clear()
+            connections = int(params.get("max_connections") or 40)
+            while len(self.delivery_threads) < connections:
+                t = threading.Thread(target=self._deliver, name=f"webhook-{len(self.delivery_threads)}", daemon=True)
+                self.delivery_threads.append(t)
+                t.start()
+        self.connected.set()
+        return True
+
+    def delete_webhook(self, params):
+        with self.cond:
+            self.webhook = None
+        return True
+
+    def webhook_info(self, params):
+        with self.cond:
+            url = self.webhook[0] if self.webhook else ""
+        return {"url": url, "has_custom_certificate": False, "pending_update_count": len(self.updates)}
+
+    def _deliver(self):
+        while True:
+            update = self.deliveries.get()
+            with self.cond:
+                hook = self.webhook
+            if hook is None:
+                with self.cond:
+                    self.updates.append((update["update_id"], update))
+                    self.cond.notify_all()
+                continue
+            url, secret = hook
+            request = urllib.request.Request(url, data=json.dumps(update).encode(), method="POST")
+            request.add_header("Content-Type", "application/json")
+            if secret:
+                request.add_header("X-Telegram-Bot-Api-Secret-Token", secret)
+            try:
+                urllib.request.urlopen(request, timeout=30).read()
+            except Exception as e:
+                # Telegram повторяет доставку; здесь - тоже, с паузой
+                with self.cond:
+                    self.webhook_errors += 1
+                log.warning("Вебхук не принял обновление %s: %s", update["update_id"], e)
+                time.sleep(1)
+                self.deliveries.put(update)
+
+    # ---------- сообщения ----------
+
+    def _message(self, chat_id, message_id, params):
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text") or params.get("caption") or "",
+        }
+        markup = params.get("reply_markup")
+        if markup:
+            message["reply_markup"] = json.loads(markup) if isinstance(markup, str) else markup
+        return message
+
+    def _notify(self, method, chat_id, message):
+        if self.on_message is not None:
+            self.on_message(method, chat_id, message)
+
+    def send_message(self, params):
+        chat_id = int(params["chat_id"])
+        with self.cond:
+            self.message_ids[chat_id] += 1
+            message_id = self.message_ids[chat_id]
+        message = self._message(chat_id, message_id, params)
+        self._notify("sendMessage", chat_id, message)
+        return message
+
+    def edit_message_text(self, params):
+        chat_id = int(params["chat_id"])
+        message_id = int(params["message_id"])
+        if message_id > self.message_ids[chat_id]:
+            raise ApiError(400, "Bad Request: message to edit not found")
+        message = self._message(chat_id, message_id, params)
+        self._notify("editMessageText", chat_id, message)
+        return message
+
+    def send_document(self, params):
+        return self.send_message(params)
+
+    # ---------- вызов метода ----------
+
+    def call(self, method, params):
+        """Выполняет метод; возвращает (HTTP-код, ответ в формате Bot API)."""
+        name = method.lower()
+        with self.cond:
+            self.calls[method] += 1
+        try:
+            if name in FAULTY:
+                delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+                if delay:
+                    time.sleep(delay)
+                roll = self.random.random()
+                if roll < self.rate_429:
+                    raise ApiError(429, f"Too Many Requests: retry after {self.retry_after}", self.retry_after)
+                if roll < self.rate_429 + self.fail_rate:
+                    raise ApiError(500, "Internal Server Error")
+            handler = self.methods.get(name)
+            result = handler(params) if handler else True
+            return 200, {"ok": True, "result": result}
+        except ApiError as e:
+            with self.cond:
+                self.injected[(method, e.code)] += 1
+            response = {"ok": False, "error_code": e.code, "description": e.description}
+            if e.retry_after is not None:
+                response["parameters"] = {"retry_after": e.retry_after}
+            return e.code, response
+
+    def serve(self, host="127.0.0.1", port=8081):
+        """Запускает HTTP-сервер в фоновом потоке; возвращает его."""
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self):
+                url = urlsplit(self.path)
+                parts = url.path.strip("/").split("/")
+                if len(parts) != 2 or not parts[0].startswith("bot"):
+                    self.send_error(404)
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                params = dict(parse_qsl(url.query))
+                params.update(_body_params(self.headers.get("Content-Type", ""), body))
+                status, response = api.call(parts[1], params)
+                data = json.dumps(response, ensure_ascii=False).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="fake-api", daemon=True).start()
+        return server
+
+
+def add_arguments(parser):
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="задержка исходящих методов")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="случайная добавка к задержке, до")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="доля ответов 429 Too Many Requests")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429, секунд")
+
+
+def from_args(args):
+    return FakeTelegram(
+        latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+        rate_429=args.rate_429, fail_rate=args.fail_rate, retry_after=args.retry_after, seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поддельный Telegram Bot API")
+    add_arguments(parser)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    api = from_args(args)
+    server = api.serve(args.host, args.port)
+    print(f"Bot API: http://{args.host}:{args.port}/bot{{0}}/{{1}}")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"Вызовы: {dict(api.calls)}; ошибки: {dict(api.injected)}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
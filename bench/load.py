@@ -0,0 +1,294 @@
+import argparse
+import heapq
+import json
+import os
+import random
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_api  # noqa: E402
+
+# ================================
+# НАГРУЗОЧНЫЙ ТЕСТ ЧЕРЕЗ ПОДДЕЛЬНЫЙ BOT API
+# ================================
+# Сквозной тест: настоящий бот (bot.py, async_bot.py или cluster.py) с
+# настоящей БД получает обновления от поддельного Bot API (fake_api.py), а
+# этот скрипт изображает тысячи пользователей. Каждый чат проходит сценарии
+# одиночного подхода, суперсета и статистики, нажимая кнопки из последней
+# полученной клавиатуры, с паузой на «раздумье» между нажатиями. Время шага -
+# от передачи обновления боту до его ответа (sendMessage/editMessageText в
+# этот чат); шаг без ответа за --step-timeout считается ошибкой.
+#
+# В config.py бота (с тестовой БД - тест пишет подходы!):
+#
+#   API_URL = 'http://127.0.0.1:8081/bot{0}/{1}'
+#
+#   python bench/load.py --chats 2000 --duration 120 --bot-cmd "python bot.py"
+#   python bench/load.py --chats 5000 --think 3 --latency-ms 40 --rate-429 0.01 \
+#       --bot-cmd "python cluster.py --workers 4"
+#
+# Без --bot-cmd скрипт ждёт, пока бот подключится сам (первый getUpdates или
+# setWebhook). Итог - пропускная способность, p50/p95/p99 по шагам и доля
+# ошибок, с --json - также в файл.
+
+FIRST_CHAT_ID = 900000000
+CONNECT_TIMEOUT = 60.0
+TICK = 0.05
+
+# Шаг - действие кнопки (нажимается случайная кнопка с таким действием),
+# команда "/..." или текст "text:..."
+def single_flow(rng, sets):
+    steps = ["/start", "single", "muscle", "exercise"]
+    for i in range(sets):
+        steps += (["next_set"] if i else []) + ["reps", "w"]
+    return steps + ["main_menu"]
+
+
+def superset_flow(rng, sets):
+    steps = ["/start", "superset", "s1_muscle", "s1_ex", "s2_muscle", "s2_ex"]
+    for i in range(sets):
+        steps += (["s_next_set"] if i else []) + ["sreps1", "sw1", "sreps2", "sw2"]
+    return steps + ["main_menu"]
+
+
+def stats_flow(rng, sets):
+    steps = ["/start", "stats", "stats_exercise", "stat_muscle", "stat_ex", "stat_exw", "progress"]
+    return steps + ["/start", "stats", "stats_day", "day", "stats_day"]
+
+
+SCENARIOS = {"single": single_flow, "superset": superset_flow, "stats": stats_flow}
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[int(round(p / 100 * (len(ordered) - 1)))]
+
+
+class Chat:
+    __slots__ = ("chat_id", "steps", "pos", "message_id", "markup", "waiting", "sent_at")
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.steps = []
+        self.pos = 0
+        self.message_id = None
+        self.markup = None
+        self.waiting = None  # действие шага, ответа на который ждём
+        self.sent_at = 0.0
+
+
+class Driver:
+    def __init__(self, api, args):
+        self.api = api
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.scenarios = [name for name in args.scenarios.split(",") if name]
+        self.lock = threading.Lock()
+        self.chats = {}
+        self.due = []  # (время, chat_id)
+        self.samples = defaultdict(list)  # действие -> [секунды]
+        self.errors = Counter()
+        self.stopping = False
+        api.on_message = self.on_message
+
+    def start_chat(self, chat, at):
+        name = self.rng.choice(self.scenarios)
+        chat.steps = SCENARIOS[name](self.rng, self.args.sets)
+        chat.pos = 0
+        heapq.heappush(self.due, (at, chat.chat_id))
+
+    def think(self):
+        return self.rng.expovariate(1 / self.args.think) if self.args.think else 0.0
+
+    def _update(self, chat, step):
+        user = {"id": chat.chat_id, "is_bot": False, "first_name": "load"}
+        chat_info = {"id": chat.chat_id, "type": "private"}
+        if step.startswith("/") or step.startswith("text:"):
+            text = step[len("text:"):] if step.startswith("text:") else step
+            message = {"message_id": 0, "date": int(time.time()), "chat": chat_info, "from": user, "text": text}
+            if step.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+            return {"message": message}
+        buttons = [
+            button["callback_data"]
+            for row in (chat.markup or {}).get("inline_keyboard", ())
+            for button in row
+            if "callback_data" in button
+            and (button["callback_data"] == step or button["callback_data"].startswith(step + ":"))
+        ]
+        if not buttons:
+            return None
+        message = {"message_id": chat.message_id, "date": int(time.time()), "chat": chat_info, "from": fake_api.BOT_USER}
+        return {"callback_query": {
+            "id": str(self.rng.getrandbits(63)), "from": user, "message": message,
+            "chat_instance": str(chat.chat_id), "data": self.rng.choice(buttons),
+        }}
+
+    def step(self, chat, now):
+        if chat.pos >= len(chat.steps):
+            self.start_chat(chat, now + self.think())
+            return
+        step = chat.steps[chat.pos]
+        update = self._update(chat, step)
+        if update is None:
+            # Нужной кнопки нет: бот ответил не тем экраном - сценарий заново
+            self.errors[f"нет кнопки {step}"] += 1
+            self.start_chat(chat, now + self.think())
+            return
+        chat.waiting = step if step.startswith("/") else step.split(":")[0]
+        chat.sent_at = time.perf_counter()
+        self.api.push(update)
+
+    def on_message(self, method, chat_id, message):
+        now = time.perf_counter()
+        with self.lock:
+            chat = self.chats.get(chat_id)
+            if chat is None:
+                return
+            if "reply_markup" in message:
+                chat.markup = message["reply_markup"]
+                chat.message_id = message["message_id"]
+            if chat.waiting is None:
+                return
+            self.samples[chat.waiting].append(now - chat.sent_at)
+            chat.waiting = None
+            chat.pos += 1
+            if not self.stopping:
+                heapq.heappush(self.due, (time.monotonic() + self.think(), chat_id))
+
+    def run(self):
+        args = self.args
+        started = time.monotonic()
+        with self.lock:
+            for n in range(args.chats):
+                chat = Chat(FIRST_CHAT_ID + n)
+                self.chats[chat.chat_id] = chat
+                self.start_chat(chat, started + self.rng.uniform(0, args.ramp))
+        end = started + args.duration
+        while True:
+            now = time.monotonic()
+            with self.lock:
+                if now >= end:
+                    self.stopping = True
+                    if not any(c.waiting for c in self.chats.values()):
+                        break
+                while not self.stopping and self.due and self.due[0][0] <= now:
+                    _, chat_id = heapq.heappop(self.due)
+                    self.step(self.chats[chat_id], now)
+                # Ответа нет слишком долго: шаг - ошибка, чат начинает заново
+                limit = time.perf_counter() - args.step_timeout
+                for chat in self.chats.values():
+                    if chat.waiting and chat.sent_at < limit:
+                        self.errors[f"нет ответа на {chat.waiting}"] += 1
+                        chat.waiting = None
+                        if not self.stopping:
+                            self.start_chat(chat, now + self.think())
+            time.sleep(TICK)
+        return time.monotonic() - started
+
+
+def report(driver, api, seconds):
+    steps = sum(len(v) for v in driver.samples.values())
+    errors = sum(driver.errors.values())
+    everything = [s for v in driver.samples.values() for s in v]
+    result = {
+        "chats": driver.args.chats,
+        "seconds": round(seconds, 1),
+        "steps": steps,
+        "steps_per_sec": round(steps / seconds, 1) if seconds else 0.0,
+        "error_rate": round(errors / (steps + errors), 4) if steps + errors else 0.0,
+        "p50_ms": round(percentile(everything, 50) * 1000, 1) if everything else None,
+        "p95_ms": round(percentile(everything, 95) * 1000, 1) if everything else None,
+        "p99_ms": round(percentile(everything, 99) * 1000, 1) if everything else None,
+        "actions": {},
+        "errors": dict(driver.errors),
+        "api_calls": dict(api.calls),
+        "api_injected": {f"{method} {code}": n for (method, code), n in api.injected.items()},
+        "webhook_errors": api.webhook_errors,
+    }
+    for action, values in sorted(driver.samples.items()):
+        times = [v * 1000 for v in values]
+        result["actions"][action] = {
+            "n": len(values),
+            "p50_ms": round(percentile(times, 50), 1),
+            "p95_ms": round(percentile(times, 95), 1),
+            "p99_ms": round(percentile(times, 99), 1),
+            "max_ms": round(max(times), 1),
+        }
+    return result
+
+
+def print_report(result):
+    print(f"Чатов: {result['chats']}, {result['seconds']} с; шагов: {result['steps']} "
+          f"({result['steps_per_sec']} шаг/с), ошибок: {result['error_rate']:.2%}")
+    print(f"Время ответа: p50 {result['p50_ms']} мс, p95 {result['p95_ms']} мс, p99 {result['p99_ms']} мс")
+    print()
+    print(f"{'действие':<16}{'n':>8}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'max мс':>10}")
+    for action, a in result["actions"].items():
+        print(f"{action:<16}{a['n']:>8}{a['p50_ms']:>10}{a['p95_ms']:>10}{a['p99_ms']:>10}{a['max_ms']:>10}")
+    if result["errors"]:
+        print()
+        print("Ошибки сценариев:")
+        for name, count in sorted(result["errors"].items(), key=lambda kv: -kv[1]):
+            print(f"  {name:<32}{count:>8}")
+    print()
+    print("Вызовы Bot API:")
+    for name, count in sorted(result["api_calls"].items()):
+        print(f"  {name:<32}{count:>8}")
+    if result["api_injected"]:
+        print("Подстроенные ошибки Bot API:")
+        for name, count in sorted(result["api_injected"].items()):
+            print(f"  {name:<32}{count:>8}")
+    if result["webhook_errors"]:
+        print(f"Ошибок доставки на вебхук: {result['webhook_errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозной нагрузочный тест бота через поддельный Bot API")
+    fake_api.add_arguments(parser)
+    parser.add_argument("--chats", type=int, default=1000, help="число одновременных чатов")
+    parser.add_argument("--duration", type=float, default=60.0, help="длительность теста, секунд")
+    parser.add_argument("--ramp", type=float, default=10.0, help="за сколько секунд подключаются все чаты")
+    parser.add_argument("--think", type=float, default=2.0, help="средняя пауза между нажатиями, секунд")
+    parser.add_argument("--sets", type=int, default=3, help="подходов в тренировке")
+    parser.add_argument("--scenarios", default="single,superset,stats", help="сценарии через запятую")
+    parser.add_argument("--step-timeout", type=float, default=15.0, help="сколько ждать ответа бота, секунд")
+    parser.add_argument("--bot-cmd", help="команда запуска бота (иначе бот запускается отдельно)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить результат в файл")
+    args = parser.parse_args()
+
+    api = fake_api.from_args(args)
+    server = api.serve(args.host, args.port)
+    print(f"Bot API: http://{args.host}:{args.port}/bot{{0}}/{{1}}")
+    proc = subprocess.Popen(shlex.split(args.bot_cmd), cwd=ROOT) if args.bot_cmd else None
+    try:
+        if not api.connected.wait(CONNECT_TIMEOUT):
+            sys.exit("Бот не подключился: проверьте API_URL в config.py")
+        driver = Driver(api, args)
+        seconds = driver.run()
+    finally:
+        if proc is not None:
+            proc.send_signal(signal.SIGINT)
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        server.shutdown()
+    result = report(driver, api, seconds)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
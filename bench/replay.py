@@ -0,0 +1,543 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import types
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# ================================
+# ОФЛАЙН-БЕНЧМАРК ОБРАБОТЧИКОВ
+# ================================
+# Прогоняет синтетические потоки обновлений через обработчики bot.py без
+# Telegram и без Postgres: обновления разбираются самим telebot, исходящие
+# вызовы API записываются, а БД заменена хранилищем в памяти, которое
+# понимает запросы бота и считает обращения к БД.
+#
+#   python bench/replay.py --chats 200 --threads 4
+#   python bench/replay.py --write-behind --db-latency-ms 2
+#   python bench/replay.py --json result.json
+#   python bench/replay.py --baseline result.json --tolerance 0.25   # код 1 при регрессии
+
+GROUPS = ["Грудь", "Спина", "Ноги", "Плечи", "Бицепс", "Трицепс", "Пресс"]
+EXERCISES_PER_GROUP = 10
+REPS = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 12, 15, 18, 20, 25, 30, 40, 50, 60]
+WEIGHTS = [0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 4.0, 5.0, 6.0, 7.5, 8.0, 9.0, 10.0, 12.5, 15.0,
+           17.5, 20.0, 22.5, 25.0, 27.5, 30.0, 35.0, 40.0, 45.0, 50.0, 55.0, 60.0, 65.0,
+           70.0, 75.0, 80.0]
+
+
+def install_config(args):
+    cfg = types.ModuleType("config")
+    cfg.TOKEN = "123456:BENCHMARK"
+    cfg.DB_CONFIG = {"pool_max": args.threads}
+    cfg.WRITE_BEHIND = {"enabled": args.write_behind, "max_delay": 0.05}
+    if args.journal:
+        cfg.WRITE_JOURNAL = {"enabled": True, "path": args.journal}
+    cfg.SESSIONS = {"backend": "memory"}
+    sys.modules["config"] = cfg
+
+
+# ================================
+# БД В ПАМЯТИ
+# ================================
+
+class FakeDatabase:
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.statements = defaultdict(int)
+        self.groups = [(i + 1, name) for i, name in enumerate(GROUPS)]
+        self.exercises = [
+            (gid * 100 + j, gid, f"{gname}: упражнение {j}")
+            for gid, gname in self.groups for j in range(1, EXERCISES_PER_GROUP + 1)
+        ]
+        self.reps = list(REPS)
+        self.weights = list(WEIGHTS)
+        self.sets = []
+        self.supersets = []
+        self.keys = set()  # (таблица, chat_id, message_id, flow_id, set_number)
+        self.days = {}
+        self.rollups = {}
+
+    def round_trip(self, label):
+        self.local.count = getattr(self.local, "count", 0) + 1
+        with self.lock:
+            self.statements[label] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def take_count(self):
+        count = getattr(self.local, "count", 0)
+        self.local.count = 0
+        return count
+
+    @staticmethod
+    def label(query):
+        verb = query.split(None, 1)[0].upper()
+        tables = re.findall(r"gym\.(\w+)", query)
+        if "pg_notify" in query:
+            return "NOTIFY"
+        return f"{verb} {tables[0] if tables else ''}".strip()
+
+    def select(self, query, params):
+        if "FROM gym.muscle_groups" in query:
+            return list(self.groups)
+        if "FROM gym.exercises" in query:
+            return list(self.exercises)
+        if "FROM gym.repetitions" in query:
+            return [(r,) for r in self.reps]
+        if "FROM gym.weights" in query:
+            return [(w,) for w in self.weights]
+        if "FROM gym.training_days" in query:
+            chat_id, month = params
+            mask = self.days.get((chat_id, month))
+            return [(mask,)] if mask is not None else []
+        if "FROM gym.exercise_daily" in query:
+            chat_id, ex_id, since = params
+            # Итоги дополняются из других потоков: читаем снимок под блокировкой
+            with self.lock:
+                rows = [v for (c, e, d), v in self.rollups.items() if c == chat_id and e == ex_id and d >= since]
+            weights = [v[3] for v in rows if v[3] is not None]
+            return [(
+                sum(v[0] for v in rows), sum(v[1] for v in rows), sum(v[2] for v in rows),
+                max(weights) if weights else None, sum(v[4] for v in rows),
+            )]
+        if "after_set" in (params or {}):
+            # История упражнения для analytics.py; id строки - её номер в списке + 1
+            chat_id, ex_id = params["chat_id"], params["ex_id"]
+            rows = [
+                (False, n + 1, d, n, w, r)
+                for n, (c, d, ex, _, w, r) in enumerate(self.sets)
+                if c == chat_id and ex == ex_id and n + 1 > params["after_set"]
+            ]
+            for n, (c, d, ex1, ex2, _, w1, r1, w2, r2) in enumerate(self.supersets):
+                if c == chat_id and n + 1 > params["after_superset"]:
+                    if ex1 == ex_id:
+                        rows.append((True, n + 1, d, n, w1, r1))
+                    if ex2 == ex_id:
+                        rows.append((True, n + 1, d, n, w2, r2))
+            return sorted(rows, key=lambda row: (row[2], row[3]))
+        if "FROM gym.workout_stats" in query and "UNION ALL" in query:
+            chat_id, day = params["chat_id"], params["day"]
+            singles = [
+                (n, False, ex, None, set_no, w, r, None, None)
+                for n, (c, d, ex, set_no, w, r) in enumerate(self.sets) if c == chat_id and d == day
+            ]
+            supers = [
+                (n, True, ex1, ex2, set_no, w1, r1, w2, r2)
+                for n, (c, d, ex1, ex2, set_no, w1, r1, w2, r2) in enumerate(self.supersets) if c == chat_id and d == day
+            ]
+            return sorted(singles + supers, key=lambda row: row[0])
+        return []
+
+    def _insert_new(self, table, target, rows, width, set_pos):
+        inserted = []
+        for row in rows:
+            key = (table, row[0], row[-2], row[-1], row[set_pos])
+            if row[-2] is not None and key in self.keys:
+                continue
+            self.keys.add(key)
+            target.append(row[:width])
+            inserted.append(row[:width])
+        return inserted
+
+    def insert_rows(self, query, rows):
+        """Применяет многострочную вставку; возвращает вставленные строки (как RETURNING)."""
+        with self.lock:
+            if "INSERT INTO gym.workout_stats" in query:
+                return self._insert_new("sets", self.sets, rows, 6, 3)
+            elif "INSERT INTO gym.supersets" in query:
+                return self._insert_new("supersets", self.supersets, rows, 9, 4)
+            elif "INSERT INTO gym.training_days" in query:
+                for chat_id, month, mask in rows:
+                    self.days[(chat_id, month)] = self.days.get((chat_id, month), 0) | mask
+            elif "INSERT INTO gym.exercise_daily" in query:
+                for chat_id, ex_id, day, n, reps, wsum, wmax, volume in rows:
+                    old = self.rollups.get((chat_id, ex_id, day), (0, 0, 0.0, None, 0.0))
+                    top = max([w for w in (old[3], wmax) if w is not None], default=None)
+                    self.rollups[(chat_id, ex_id, day)] = (old[0] + n, old[1] + reps, old[2] + wsum, top, old[4] + volume)
+            elif "INSERT INTO gym.repetitions" in query:
+                self.reps = sorted(set(self.reps) | {r for (r,) in rows})
+            elif "INSERT INTO gym.weights" in query:
+                self.weights = sorted(set(self.weights) | {w for (w,) in rows})
+            return []
+
+
+class FakeCursor:
+    def __init__(self, fake):
+        self.fake = fake
+        self.result = []
+        self.rowcount = 0
+
+    def execute(self, query, params=None):
+        self.fake.round_trip(self.fake.label(query.strip()))
+        self.result = self.fake.select(query, params) if query.lstrip().upper().startswith("SELECT") else []
+        self.rowcount = len(self.result)
+
+    def fetchall(self):
+        return self.result
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+
+def install_fake_db(fake):
+    import catalog
+    import db
+    import stats
+    import writer
+
+    @contextmanager
+    def transaction():
+        yield FakeCursor(fake)
+
+    def execute_values(cur, query, rows, template=None, page_size=100, fetch=False):
+        fake.round_trip(fake.label(query.strip()))
+        inserted = fake.insert_rows(query, list(rows))
+        return inserted if fetch else None
+
+    db.transaction = transaction
+    for module in (catalog, stats, writer):
+        module.execute_values = execute_values
+
+
+# ================================
+# ЗАПИСЬ ИСХОДЯЩИХ ВЫЗОВОВ
+# ================================
+
+class RecordingBot:
+    """Подменяет bot в bot.py: запоминает вызовы Telegram API вместо отправки.
+
+    Последняя клавиатура каждого чата сохраняется: кнопки сценариев несут
+    контекст (flow.py), и шаг берёт callback_data из показанной кнопки.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.calls = defaultdict(int)
+        self.markups = {}
+
+    def press(self, chat_id, step):
+        """callback_data кнопки "step" или "step:..." из последней клавиатуры чата."""
+        markup = self.markups.get(chat_id)
+        if markup:
+            for row in json.loads(markup)["inline_keyboard"]:
+                for button in row:
+                    data = button.get("callback_data", "")
+                    if data == step or data.startswith(step + ":"):
+                        return data
+        return step
+
+    def take_count(self):
+        count = getattr(self.local, "count", 0)
+        self.local.count = 0
+        return count
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.local.count = getattr(self.local, "count", 0) + 1
+            with self.lock:
+                self.calls[name] += 1
+            markup = kwargs.get("reply_markup")
+            if markup is not None:
+                chat_id = args[1] if name == "edit_message_text" else args[0]
+                self.markups[chat_id] = markup
+            return types.SimpleNamespace(message_id=1)
+        return call
+
+
+# ================================
+# СЦЕНАРИИ
+# ================================
+
+def weight_label(w):
+    return f"{w:.2f}".rstrip('0').rstrip('.')
+
+
+def group_exercises(fake, gid):
+    """Упражнения группы с первой страницы меню: сценарий не листает меню."""
+    import catalog
+    import keyboards
+    items = sorted(((e[0], e[2]) for e in fake.exercises if e[1] == gid), key=catalog.sort_key)
+    return [ex_id for ex_id, _ in items[:keyboards.PAGE_SIZE]]
+
+
+def single_flow(rng, fake, sets):
+    gid = rng.choice(fake.groups)[0]
+    ex_id = rng.choice(group_exercises(fake, gid))
+    steps = ["/start", "single", f"muscle:{gid}", f"exercise:{ex_id}"]
+    for i in range(sets):
+        if i:
+            steps.append("next_set")
+        steps += [f"reps:{rng.choice(REPS)}", f"w:{weight_label(rng.choice(WEIGHTS))}"]
+    return steps + ["main_menu"]
+
+
+# Те же подходы одним сообщением (bulk.py): шаг "text:..." - обычный текст
+def single_text_flow(rng, fake, sets):
+    gid = rng.choice(fake.groups)[0]
+    ex_id = rng.choice(group_exercises(fake, gid))
+    entry = ", ".join(f"{rng.choice(REPS)}x{weight_label(rng.choice(WEIGHTS))}" for _ in range(sets))
+    return ["/start", "single", f"muscle:{gid}", f"exercise:{ex_id}", f"text:{entry}", "main_menu"]
+
+
+def superset_flow(rng, fake, sets):
+    g1, g2 = rng.choice(fake.groups)[0], rng.choice(fake.groups)[0]
+    ex1 = rng.choice(group_exercises(fake, g1))
+    ex2 = rng.choice(group_exercises(fake, g2))
+    steps = ["/start", "superset", f"s1_muscle:{g1}", f"s1_ex:{ex1}", f"s2_muscle:{g2}", f"s2_ex:{ex2}"]
+    for i in range(sets):
+        if i:
+            steps.append("s_next_set")
+        steps += [
+            f"sreps1:{rng.choice(REPS)}", f"sw1:{weight_label(rng.choice(WEIGHTS))}",
+            f"sreps2:{rng.choice(REPS)}", f"sw2:{weight_label(rng.choice(WEIGHTS))}",
+        ]
+    return steps + ["main_menu"]
+
+
+def calendar_flow(rng, fake, pages):
+    today = date.today()
+    steps = ["/start", "stats", "stats_day"]
+    month = today.replace(day=1)
+    for _ in range(pages):
+        month = (month - timedelta(days=1)).replace(day=1)
+        steps.append(f"cal:{month.year}:{month.month}")
+    return steps + [f"cal:{today.year}:{today.month}", "main_menu"]
+
+
+def summary_flow(rng, fake, picks):
+    today = date.today()
+    steps = ["/start", "stats", "stats_day"]
+    for _ in range(picks):
+        day = rng.randint(1, today.day)
+        steps += [f"day:{today.year}:{today.month}:{day}", "stats_day"]
+    return steps + ["main_menu"]
+
+
+def exercise_stats_flow(rng, fake, picks):
+    gid = rng.choice(fake.groups)[0]
+    steps = ["/start", "stats", "stats_exercise", f"stat_muscle:{gid}"]
+    for _ in range(picks):
+        ex_id = rng.choice(group_exercises(fake, gid))
+        steps += [
+            f"stat_ex:{ex_id}", f"stat_exw:{ex_id}:{rng.choice([7, 30, 90, 365, 0])}", f"progress:{ex_id}",
+        ]
+    return steps + ["main_menu"]
+
+
+SCENARIOS = {
+    "single": single_flow,
+    "superset": superset_flow,
+    "single_text": single_text_flow,
+    "calendar": calendar_flow,
+    "summary": summary_flow,
+    "exercise_stats": exercise_stats_flow,
+}
+
+
+def build_streams(args, fake):
+    rng = random.Random(args.seed)
+    streams = {}
+    for n in range(args.chats):
+        chat_id = 1000000 + n
+        steps = []
+        for _ in range(args.sessions):
+            # Сначала тренировка, чтобы экраны статистики было из чего строить
+            for name in (["single", "superset"] + [rng.choice(list(SCENARIOS))]):
+                steps += SCENARIOS[name](rng, fake, args.sets)
+        streams[chat_id] = steps
+    return streams
+
+
+# ================================
+# ПРОГОН
+# ================================
+
+def make_update(update_id, chat_id, step):
+    chat = {"id": chat_id, "type": "private"}
+    user = {"id": chat_id, "is_bot": False, "first_name": "bench"}
+    message = {"message_id": 1, "date": 0, "chat": chat, "from": user, "text": "Выберите режим:"}
+    if step.startswith("/"):
+        message["text"] = step
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(step)}]
+        return {"update_id": update_id, "message": message}
+    if step.startswith("text:"):
+        message["text"] = step[len("text:"):]
+        return {"update_id": update_id, "message": message}
+    return {
+        "update_id": update_id,
+        "callback_query": {"id": str(update_id), "from": user, "message": message, "chat_instance": "0", "data": step},
+    }
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[int(round(p / 100 * (len(ordered) - 1)))]
+
+
+def run(args):
+    install_config(args)
+    fake = FakeDatabase(args.db_latency_ms / 1000)
+    install_fake_db(fake)
+
+    import bot as handlers
+    import catalog
+    import router
+    import writer
+    from telebot import types as tg
+
+    dispatcher = handlers.bot
+    dispatcher.threaded = False
+    recorder = RecordingBot()
+    handlers.bot = recorder
+    catalog.load()
+    writer.start()
+
+    streams = build_streams(args, fake)
+    samples = defaultdict(list)  # действие -> [(секунды, обращений к БД, вызовов API)]
+    lock = threading.Lock()
+    counter = iter(range(1, 10 ** 9))
+
+    def worker(chat_ids):
+        cursors = {chat_id: 0 for chat_id in chat_ids}
+        local = []
+        # Чаты потока чередуются, порядок обновлений внутри чата сохраняется
+        while cursors:
+            for chat_id in list(cursors):
+                pos = cursors[chat_id]
+                step = streams[chat_id][pos]
+                with lock:
+                    update_id = next(counter)
+                typed = step.startswith(("/", "text:"))
+                data = step if typed else recorder.press(chat_id, step)
+                update = tg.Update.de_json(make_update(update_id, chat_id, data))
+                fake.take_count()
+                recorder.take_count()
+                started = time.perf_counter()
+                dispatcher.process_new_updates([update])
+                elapsed = time.perf_counter() - started
+                action = step if step.startswith("/") else router.parse(step)[0]
+                local.append((action, elapsed, fake.take_count(), recorder.take_count()))
+                if pos + 1 == len(streams[chat_id]):
+                    del cursors[chat_id]
+                else:
+                    cursors[chat_id] = pos + 1
+        with lock:
+            for action, elapsed, queries, api_calls in local:
+                samples[action].append((elapsed, queries, api_calls))
+
+    chat_ids = sorted(streams)
+    threads = [
+        threading.Thread(target=worker, args=(chat_ids[i::args.threads],))
+        for i in range(args.threads)
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        writer.stop()
+        total_time = time.perf_counter() - started
+
+    total = sum(len(v) for v in samples.values())
+    result = {
+        "updates": total,
+        "seconds": round(total_time, 3),
+        "updates_per_sec": round(total / total_time, 1),
+        "db_per_update": round(sum(s[1] for v in samples.values() for s in v) / total, 3),
+        "actions": {},
+        "statements": dict(fake.statements),
+        "api_calls": dict(recorder.calls),
+    }
+    for action, values in sorted(samples.items()):
+        times = [s[0] * 1000 for s in values]
+        result["actions"][action] = {
+            "n": len(values),
+            "p50_ms": round(percentile(times, 50), 3),
+            "p95_ms": round(percentile(times, 95), 3),
+            "p99_ms": round(percentile(times, 99), 3),
+            "db_per_update": round(sum(s[1] for s in values) / len(values), 3),
+            "api_per_update": round(sum(s[2] for s in values) / len(values), 3),
+        }
+    return result
+
+
+def print_report(result):
+    print(f"Обновлений: {result['updates']} за {result['seconds']} с "
+          f"({result['updates_per_sec']} обн/с), запросов к БД на обновление: {result['db_per_update']}")
+    print()
+    print(f"{'действие':<16}{'n':>7}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'БД/обн':>9}{'API/обн':>9}")
+    for action, a in result["actions"].items():
+        print(f"{action:<16}{a['n']:>7}{a['p50_ms']:>10}{a['p95_ms']:>10}{a['p99_ms']:>10}"
+              f"{a['db_per_update']:>9}{a['api_per_update']:>9}")
+    print()
+    print("Запросы к БД:")
+    for label, count in sorted(result["statements"].items(), key=lambda kv: -kv[1]):
+        print(f"  {label:<32}{count:>8}")
+    print("Вызовы Telegram API:")
+    for name, count in sorted(result["api_calls"].items()):
+        print(f"  {name:<32}{count:>8}")
+
+
+def compare(result, baseline, tolerance):
+    """Сравнивает с сохранённым прогоном; возвращает список регрессий."""
+    problems = []
+    for action, base in baseline["actions"].items():
+        cur = result["actions"].get(action)
+        if cur is None:
+            continue
+        if cur["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            problems.append(f"{action}: p95 {base['p95_ms']} -> {cur['p95_ms']} мс")
+        if cur["db_per_update"] > base["db_per_update"]:
+            problems.append(f"{action}: запросов к БД {base['db_per_update']} -> {cur['db_per_update']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк обработчиков бота")
+    parser.add_argument("--chats", type=int, default=100, help="число имитируемых чатов")
+    parser.add_argument("--sessions", type=int, default=2, help="сколько раз каждый чат проходит сценарии")
+    parser.add_argument("--sets", type=int, default=3, help="подходов в тренировке / страниц в статистике")
+    parser.add_argument("--threads", type=int, default=2, help="рабочих потоков (как num_threads у TeleBot)")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="имитируемая задержка запроса к БД")
+    parser.add_argument("--write-behind", action="store_true", help="включить отложенную запись подходов")
+    parser.add_argument("--journal", help="писать подходы через журнал в этом файле (SQLite)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить результат в файл")
+    parser.add_argument("--baseline", help="файл прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимый рост p95 при сравнении")
+    args = parser.parse_args()
+
+    result = run(args)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(result, json.load(f), args.tolerance)
+        if problems:
+            print()
+            print("Регрессии:")
+            for p in problems:
+                print(f"  {p}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
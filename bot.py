@@ -1,19 +1,32 @@
+import logging
+import tempfile
+import time
 import telebot
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
-import psycopg2
-from config import TOKEN, DB_CONFIG
+import analytics
+import bulk
+import catalog
+import config
+import db
+import digest
+import flow
+import keyboards
+import logs
+import metrics
+import migrate
+import outbox
+import router
+import search
+import sessions
+import stats
+import transfer
+import writer
+from concurrent.futures import Future
+from config import TOKEN
 from datetime import date
-import calendar
-from datetime import datetime, timedelta
+from datetime import datetime
 
 bot = telebot.TeleBot(TOKEN)
-
-# Подключение к базе
-conn = psycopg2.connect(**DB_CONFIG)
-cursor = conn.cursor()
-
-# Состояния пользователя
-user_state = {}
+log = logging.getLogger("bot")
 
 # ================================
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
@@ -21,124 +34,103 @@ user_state = {}
 
 def ensure_state(chat_id):
     """Создаёт состояние для пользователя, если его нет."""
-    if chat_id not in user_state:
-        user_state[chat_id] = {}
-    return user_state[chat_id]
-
-def get_muscle_groups():
-    cursor.execute("SELECT id, name FROM gym.muscle_groups ORDER BY name;")
-    return cursor.fetchall()
-
-def get_exercises_by_group(group_id):
-    cursor.execute("SELECT id, name FROM gym.exercises WHERE muscle_group_id = %s ORDER BY name;", (group_id,))
-    return cursor.fetchall()
-
-def build_keyboard(items, callback_prefix, back_callback=None):
-    kb = InlineKeyboardMarkup()
-    for item_id, name in items:
-        kb.add(InlineKeyboardButton(name, callback_data=f"{callback_prefix}:{item_id}"))
-    if back_callback:
-        kb.add(InlineKeyboardButton("🔙 Назад", callback_data=back_callback))
-    return kb
-
-def build_grid_keyboard(labels, callback_prefix, back_callback=None, columns=3, extra_buttons=None):
-    kb = InlineKeyboardMarkup()
-    row = []
-    for label in labels:
-        row.append(InlineKeyboardButton(str(label), callback_data=f"{callback_prefix}:{label}"))
-        if len(row) == columns:
-            kb.row(*row)
-            row = []
-    if row:
-        kb.row(*row)
-    if extra_buttons:
-        kb.row(*extra_buttons)
-    if back_callback:
-        kb.add(InlineKeyboardButton("🔙 Назад", callback_data=back_callback))
-    return kb
+    return sessions.get(chat_id)
 
+# Значения из клавиатуры уже есть в справочнике: проверка идёт по кэшу,
+# а в БД пишутся только действительно новые значения.
 def ensure_weight_exists(weight_value):
     if weight_value is None:
         return None
-    cursor.execute("INSERT INTO gym.weights (weight_kg) VALUES (%s) ON CONFLICT DO NOTHING;", (weight_value,))
-    conn.commit()
+    catalog.save_values(weights=[weight_value])
     return weight_value
 
 def ensure_reps_exists(reps_count):
     if reps_count is None:
         return None
-    cursor.execute("INSERT INTO gym.repetitions (reps_count) VALUES (%s) ON CONFLICT DO NOTHING;", (reps_count,))
-    conn.commit()
+    catalog.save_values(reps=[reps_count])
     return reps_count
 
-def get_all_reps():
-    cursor.execute("SELECT reps_count FROM gym.repetitions ORDER BY reps_count;")
-    return [row[0] for row in cursor.fetchall()]
+# Подход однозначно определяется чатом, сообщением с кнопками, сеансом
+# ввода (flow_id) и номером подхода: повторное нажатие той же кнопки не
+# создаёт вторую запись. flow_id нужен, потому что новый суперсет в том же
+# сообщении снова начинает нумерацию с 1.
+def new_flow_id():
+    return flow.new_id()
+
+# Контекст сценария (группа, упражнение, номер подхода, выбранные
+# повторения и вес) передаётся в кнопках - см. flow.py. Обработчики получают
+# его аргументом ctx и передают дальше, не обращаясь к состоянию чата.
+def flow_markup(markup, ctx):
+    try:
+        return keyboards.with_flow(markup, flow.encode(ctx))
+    except flow.TooLong as e:
+        # Записанное уже сохранено: вместо ошибки в обработчике сценарий
+        # заканчивается главным меню
+        log.error("%s: %s", e, dict(ctx))
+        return keyboards.main_menu()
+
+# Выбранное упражнение (или пара суперсета) запоминается в состоянии чата:
+# подходы можно отправить текстом, а у сообщения нет кнопки с контекстом.
+# Контекст хранится со следующим номером подхода и действует до конца дня,
+# выхода в меню или /start.
+def remember_flow(chat_id, ctx):
+    state = ensure_state(chat_id)
+    try:
+        state["active_flow"] = flow.encode(ctx)
+        state["active_day"] = date.today().isoformat()
+    except flow.TooLong:
+        forget_flow(chat_id)
 
-def get_all_weights():
-    cursor.execute("SELECT weight_kg FROM gym.weights ORDER BY weight_kg;")
-    return [float(row[0]) for row in cursor.fetchall()]
+def forget_flow(chat_id):
+    state = ensure_state(chat_id)
+    if state.get("active_flow"):
+        state["active_flow"] = None
+        state["active_day"] = None
 
-def show_groups_menu(call, send_new=False):
-    groups = get_muscle_groups()
-    plus_btn = InlineKeyboardButton("➕", callback_data="add_group")
-    kb = build_keyboard(groups, "muscle", "main_menu")
-    kb.row(plus_btn)
-    if send_new:
-        bot.send_message(call.message.chat.id, "Выберите группу мышц:", reply_markup=kb)
-    else:
-        bot.edit_message_text(
-            "Выберите группу мышц:",
-            call.message.chat.id,
-            call.message.message_id,
-            reply_markup=kb
-        )
+def active_flow(chat_id):
+    """Контекст для подходов текстом; None, если упражнение не выбрано сегодня."""
+    state = ensure_state(chat_id)
+    if state.get("active_day") != date.today().isoformat():
+        forget_flow(chat_id)
+        return None
+    try:
+        return flow.decode(state.get("active_flow") or "")
+    except ValueError:
+        return None
 
-def show_exercises_menu(call, send_new=False):
-    state = ensure_state(call.message.chat.id)
-    exercises = get_exercises_by_group(state["muscle_group_id"])
-    plus_btn = InlineKeyboardButton("➕", callback_data="add_exercise")
-    kb = build_keyboard(exercises, "exercise", "single")
-    kb.row(plus_btn)
-    if send_new:
-        bot.send_message(call.message.chat.id, "Выберите упражнение:", reply_markup=kb)
-    else:
-        bot.edit_message_text(
-            "Выберите упражнение:",
-            call.message.chat.id,
-            call.message.message_id,
-            reply_markup=kb
-        )
+# Контекст следующего подхода: номер на единицу больше, повторения и вес не выбраны
+def next_set_ctx(ctx):
+    if ctx.kind == flow.SUPERSET:
+        return ctx.replace(set_number=ctx["set_number"] + 1, s1_reps=None, s1_weight=None, s2_reps=None, s2_weight=None)
+    return ctx.replace(set_number=ctx["set_number"] + 1, reps=None, weight=None)
 
-def show_reps_menu(call, send_new=False):
-    chat_id = call.message.chat.id
-    reps = get_all_reps()
-    plus_btn = InlineKeyboardButton("➕", callback_data="add_reps_menu")
-    kb = build_grid_keyboard(reps, "reps", back_callback="exercise_back", columns=4, extra_buttons=[plus_btn])
-    current_set = ensure_state(chat_id).get("set_number", 1)
+def show(call, text, kb, send_new=False):
     if send_new:
-        bot.send_message(chat_id, f"Подход {current_set}: выберите количество повторений:", reply_markup=kb)
+        bot.send_message(call.message.chat.id, text, reply_markup=kb)
     else:
-        bot.edit_message_text(f"Подход {current_set}: выберите количество повторений:", chat_id, call.message.message_id, reply_markup=kb)
+        bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=kb)
 
-def show_weight_menu(call, send_new=False):
-    chat_id = call.message.chat.id
-    weights = [f"{w:.2f}".rstrip('0').rstrip('.') for w in get_all_weights()]
-    plus_btn = InlineKeyboardButton("➕", callback_data="add_weight_menu")
-    no_weight_btn = InlineKeyboardButton("⚪ Без веса", callback_data="no_weight")
-    kb = build_grid_keyboard(weights, "w", back_callback="reps_back", columns=4, extra_buttons=[plus_btn, no_weight_btn])
-    current_set = ensure_state(chat_id).get("set_number", 1)
-    if send_new:
-        bot.send_message(chat_id, f"Подход {current_set}: выберите вес (кг):", reply_markup=kb)
-    else:
-        bot.edit_message_text(f"Подход {current_set}: выберите вес (кг):", chat_id, call.message.message_id, reply_markup=kb)
+# Меню групп и упражнений листаются кнопками "pg:меню:anchor:контекст",
+# меню - код из PAGERS (короткий, чтобы callback_data уложился в 64 байта)
+def show_groups_menu(call, ctx, send_new=False, anchor=0):
+    kb = flow_markup(keyboards.groups_menu("muscle", "main_menu", "pg:g", flow=True, anchor=anchor), ctx)
+    show(call, "Выберите группу мышц:", kb, send_new)
+
+def show_exercises_menu(call, ctx, send_new=False, anchor=0):
+    kb = flow_markup(
+        keyboards.exercises_menu(ctx["muscle_group_id"], "exercise", "single", "pg:e", flow=True, anchor=anchor), ctx
+    )
+    show(call, "Выберите упражнение:", kb, send_new)
 
-def main_menu():
-    kb = InlineKeyboardMarkup()
-    kb.add(InlineKeyboardButton("🏋️‍♂️ Одиночное упражнение", callback_data="single"))
-    kb.add(InlineKeyboardButton("🔥 Суперсет", callback_data="superset"))
-    kb.add(InlineKeyboardButton("📊 Статистика", callback_data="stats"))
-    return kb
+def show_reps_menu(call, ctx, send_new=False):
+    kb = flow_markup(keyboards.reps_menu("reps", back_callback=f"exercise_back:{keyboards.FLOW}"), ctx)
+    show(call, f"Подход {ctx['set_number']}: выберите количество повторений:", kb, send_new)
+
+def show_weight_menu(call, ctx, send_new=False):
+    kb = flow_markup(
+        keyboards.weights_menu("w", f"no_weight:{keyboards.FLOW}", back_callback=f"reps_back:{keyboards.FLOW}"), ctx
+    )
+    show(call, f"Подход {ctx['set_number']}: выберите вес (кг):", kb, send_new)
 
 # ================================
 # START
@@ -146,571 +138,497 @@ def main_menu():
 
 @bot.message_handler(commands=["start"])
 def start(message):
-    ensure_state(message.chat.id)
-    print(f"/start от {message.chat.id}")
-    bot.send_message(message.chat.id, "Выберите режим:", reply_markup=main_menu())
+    forget_flow(message.chat.id)
+    log.debug("/start от %s", message.chat.id)
+    bot.send_message(message.chat.id, "Выберите режим:", reply_markup=keyboards.main_menu())
+    sessions.save(message.chat.id)
+
+# ================================
+# ВЫГРУЗКА ИСТОРИИ
+# ================================
+
+# /export - CSV, /export json - JSON Lines. Файл пишется потоком во
+# временный файл на диске и отправляется документом.
+@bot.message_handler(commands=["export"])
+def export_history(message):
+    chat_id = message.chat.id
+    as_json = "json" in (message.text or "").lower().split()[1:]
+    with tempfile.TemporaryFile() as f:
+        count = transfer.export_json(chat_id, f) if as_json else transfer.export_csv(chat_id, f)
+        log.info("Выгрузка истории chat=%s строк=%s", chat_id, count)
+        if not count:
+            bot.send_message(chat_id, "Нет записанных подходов.")
+            return
+        f.seek(0)
+        name = f"workouts_{date.today():%Y%m%d}.{'jsonl' if as_json else 'csv'}"
+        sent = bot.send_document(chat_id, telebot.types.InputFile(f, file_name=name), caption=f"Записей: {count}")
+        # В asyncio-режиме отправка идёт в цикле событий: файл нужен до её конца
+        if isinstance(sent, Future):
+            sent.result()
+
+# ================================
+# ЕЖЕНЕДЕЛЬНАЯ СВОДКА
+# ================================
+
+# /digest отключает сводку за неделю (digest.py) и включает её обратно
+@bot.message_handler(commands=["digest"])
+def toggle_digest(message):
+    if digest.toggle(message.chat.id):
+        bot.send_message(message.chat.id, "Еженедельная сводка включена.")
+    else:
+        bot.send_message(message.chat.id, "Еженедельная сводка отключена. Включить снова: /digest")
+
+# ================================
+# CALLBACK-ЗАПРОСЫ
+# ================================
+
+# Единая точка входа: действие из call.data ищется в таблице router
+@bot.callback_query_handler(func=lambda call: True)
+def on_callback(call):
+    # Сразу снимаем «часики» с кнопки: до ответа клиент считает нажатие
+    # необработанным, и пользователь нажимает ещё раз
+    try:
+        bot.answer_callback_query(call.id)
+    except Exception as e:
+        log.warning("Не удалось ответить на callback chat=%s: %s", call.message.chat.id, e)
+    try:
+        router.dispatch(call)
+    except catalog.Unknown as e:
+        stale_button(call, e)
+    finally:
+        sessions.save(call.message.chat.id)
+
+# Кнопка из старого сообщения ссылается на группу или упражнение, которых
+# больше нет: сценарий начинается заново
+def stale_button(call, error):
+    log.warning("Устаревший callback %r chat=%s: нет %s", call.data, call.message.chat.id, error.args[0])
+    forget_flow(call.message.chat.id)
+    bot.send_message(call.message.chat.id, "Кнопка устарела. Выберите режим:", reply_markup=keyboards.main_menu())
 
 # ================================
 # ОДИНОЧНОЕ УПРАЖНЕНИЕ
 # ================================
 
-@bot.callback_query_handler(func=lambda call: call.data == "single")
+@router.route("single")
 def single_mode(call):
-    state = ensure_state(call.message.chat.id)
-    state["mode"] = "single"
-    print(f"Режим single выбран chat={call.message.chat.id}")
-    show_groups_menu(call)
+    log.debug("Режим single выбран chat=%s", call.message.chat.id)
+    forget_flow(call.message.chat.id)
+    show_groups_menu(call, flow.Flow(flow.SINGLE, flow_id=new_flow_id(), set_number=1))
 
-@bot.callback_query_handler(func=lambda call: call.data == "superset")
+@router.route("superset")
 def superset_mode(call):
-    state = ensure_state(call.message.chat.id)
-    state.clear()
-    state["mode"] = "superset"
-    state["set_number"] = 1
-    print(f"Режим superset выбран chat={call.message.chat.id}")
-    show_groups_menu_superset(call, step=1)
-
-def show_groups_menu_superset(call, step, send_new=False):
-    groups = get_muscle_groups()
-    plus_btn = InlineKeyboardButton("➕", callback_data="add_group")
+    log.debug("Режим superset выбран chat=%s", call.message.chat.id)
+    forget_flow(call.message.chat.id)
+    show_groups_menu_superset(call, 1, flow.Flow(flow.SUPERSET, flow_id=new_flow_id(), set_number=1))
+
+# Шаг суперсета, на котором выбираются группа и упражнение: второй
+# начинается, когда выбрано первое упражнение
+def superset_step(ctx):
+    return 1 if ctx["s1_exercise_id"] is None else 2
+
+def show_groups_menu_superset(call, step, ctx, send_new=False, anchor=0):
     prefix = "s1_muscle" if step == 1 else "s2_muscle"
-    kb = build_keyboard(groups, prefix, "main_menu")
-    kb.row(plus_btn)
+    kb = flow_markup(keyboards.groups_menu(prefix, "main_menu", f"pg:g{step}", flow=True, anchor=anchor), ctx)
     text = "Выберите группу мышц для первого упражнения:" if step == 1 else "Выберите группу мышц для второго упражнения:"
-    if send_new:
-        bot.send_message(call.message.chat.id, text, reply_markup=kb)
-    else:
-        bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=kb)
+    show(call, text, kb, send_new)
 
-def show_exercises_menu_superset(call, step, send_new=False):
-    state = ensure_state(call.message.chat.id)
-    group_id = state["s1_muscle_group_id"] if step == 1 else state["s2_muscle_group_id"]
-    exercises = get_exercises_by_group(group_id)
-    plus_btn = InlineKeyboardButton("➕", callback_data="add_exercise")
+def show_exercises_menu_superset(call, step, ctx, send_new=False, anchor=0):
+    group_id = ctx["s1_muscle_group_id"] if step == 1 else ctx["s2_muscle_group_id"]
     prefix = "s1_ex" if step == 1 else "s2_ex"
-    kb = build_keyboard(exercises, prefix, "single")
-    kb.row(plus_btn)
+    kb = flow_markup(
+        keyboards.exercises_menu(group_id, prefix, "single", f"pg:e{step}", flow=True, anchor=anchor), ctx
+    )
     text = "Выберите первое упражнение:" if step == 1 else "Выберите второе упражнение:"
-    if send_new:
-        bot.send_message(call.message.chat.id, text, reply_markup=kb)
-    else:
-        bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=kb)
+    show(call, text, kb, send_new)
 
-def show_reps_menu_superset(call, which, send_new=False):
-    chat_id = call.message.chat.id
-    reps = get_all_reps()
-    plus_btn = InlineKeyboardButton("➕", callback_data="add_reps_menu")
+def show_reps_menu_superset(call, which, ctx, send_new=False):
     prefix = "sreps1" if which == 1 else "sreps2"
-    kb = build_grid_keyboard(reps, prefix, columns=4, extra_buttons=[plus_btn])
-    current_set = ensure_state(chat_id).get("set_number", 1)
+    kb = flow_markup(keyboards.reps_menu(prefix), ctx)
     which_text = "первого" if which == 1 else "второго"
-    ensure_state(chat_id)["awaiting_superset"] = "first_reps" if which == 1 else "second_reps"
-    if send_new:
-        bot.send_message(chat_id, f"Суперсет {current_set}: выберите повторения для {which_text} упражнения:", reply_markup=kb)
-    else:
-        bot.edit_message_text(f"Суперсет {current_set}: выберите повторения для {which_text} упражнения:", chat_id, call.message.message_id, reply_markup=kb)
+    show(call, f"Суперсет {ctx['set_number']}: выберите повторения для {which_text} упражнения:", kb, send_new)
 
-def show_weight_menu_superset(call, which, send_new=False):
-    chat_id = call.message.chat.id
-    weights = [f"{w:.2f}".rstrip('0').rstrip('.') for w in get_all_weights()]
-    plus_btn = InlineKeyboardButton("➕", callback_data="add_weight_menu")
-    no_weight_btn = InlineKeyboardButton("⚪ Без веса", callback_data="sno_weight1" if which == 1 else "sno_weight2")
+def show_weight_menu_superset(call, which, ctx, send_new=False):
     prefix = "sw1" if which == 1 else "sw2"
-    kb = build_grid_keyboard(weights, prefix, columns=4, extra_buttons=[plus_btn, no_weight_btn])
-    current_set = ensure_state(chat_id).get("set_number", 1)
+    no_weight = f"sno_weight1:{keyboards.FLOW}" if which == 1 else f"sno_weight2:{keyboards.FLOW}"
+    kb = flow_markup(keyboards.weights_menu(prefix, no_weight), ctx)
     which_text = "первого" if which == 1 else "второго"
-    ensure_state(chat_id)["awaiting_superset"] = "first_weight" if which == 1 else "second_weight"
-    if send_new:
-        bot.send_message(chat_id, f"Суперсет {current_set}: выберите вес для {which_text} упражнения:", reply_markup=kb)
-    else:
-        bot.edit_message_text(f"Суперсет {current_set}: выберите вес для {which_text} упражнения:", chat_id, call.message.message_id, reply_markup=kb)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("muscle:"))
-def choose_exercise(call):
-    state = ensure_state(call.message.chat.id)
-    group_id = int(call.data.split(":")[1])
-    state["muscle_group_id"] = group_id
-    cursor.execute("SELECT name FROM gym.muscle_groups WHERE id = %s", (group_id,))
-    group_name = cursor.fetchone()[0]
-    print(f"Выбрана группа: {group_name} (id={group_id}) chat={call.message.chat.id}")
-    show_exercises_menu(call)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("s1_muscle:"))
-def s1_choose_group(call):
-    state = ensure_state(call.message.chat.id)
-    gid = int(call.data.split(":")[1])
-    state["s1_muscle_group_id"] = gid
-    cursor.execute("SELECT name FROM gym.muscle_groups WHERE id = %s", (gid,))
-    gname = cursor.fetchone()[0]
-    print(f"Superset: выбрана группа 1: {gname} (id={gid}) chat={call.message.chat.id}")
-    show_exercises_menu_superset(call, step=1)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("s2_muscle:"))
-def s2_choose_group(call):
-    state = ensure_state(call.message.chat.id)
-    gid = int(call.data.split(":")[1])
-    state["s2_muscle_group_id"] = gid
-    cursor.execute("SELECT name FROM gym.muscle_groups WHERE id = %s", (gid,))
-    gname = cursor.fetchone()[0]
-    print(f"Superset: выбрана группа 2: {gname} (id={gid}) chat={call.message.chat.id}")
-    show_exercises_menu_superset(call, step=2)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("s1_ex:"))
-def s1_choose_ex(call):
-    state = ensure_state(call.message.chat.id)
-    ex_id = int(call.data.split(":")[1])
-    state["s1_exercise_id"] = ex_id
-    cursor.execute("SELECT name FROM gym.exercises WHERE id = %s", (ex_id,))
-    ex_name = cursor.fetchone()[0]
-    state["s1_exercise_name"] = ex_name
-    print(f"Superset: выбрано упражнение 1: {ex_name} chat={call.message.chat.id}")
-    show_groups_menu_superset(call, step=2)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("s2_ex:"))
-def s2_choose_ex(call):
-    state = ensure_state(call.message.chat.id)
-    ex_id = int(call.data.split(":")[1])
-    state["s2_exercise_id"] = ex_id
-    cursor.execute("SELECT name FROM gym.exercises WHERE id = %s", (ex_id,))
-    ex_name = cursor.fetchone()[0]
-    state["s2_exercise_name"] = ex_name
-    print(f"Superset: выбрано упражнение 2: {ex_name} chat={call.message.chat.id}")
-    show_reps_menu_superset(call, which=1)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("exercise:"))
-def start_set(call):
-    state = ensure_state(call.message.chat.id)
-    ex_id = int(call.data.split(":")[1])
-    state["exercise_id"] = ex_id
-    cursor.execute("SELECT name FROM gym.exercises WHERE id = %s", (ex_id,))
-    ex_name = cursor.fetchone()[0]
-    state["exercise_name"] = ex_name
-    state["set_number"] = state.get("set_number", 1)
-    print(f"Выбрано упражнение: {ex_name} chat={call.message.chat.id}")
-    show_reps_menu(call)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("reps:"))
-def choose_reps(call):
-    state = ensure_state(call.message.chat.id)
-    reps = int(call.data.split(":")[1])
-    state["reps"] = reps
+    show(call, f"Суперсет {ctx['set_number']}: выберите вес для {which_text} упражнения:", kb, send_new)
+
+PAGERS = {
+    "g": lambda call, ctx, anchor: show_groups_menu(call, ctx, anchor=anchor),
+    "e": lambda call, ctx, anchor: show_exercises_menu(call, ctx, anchor=anchor),
+    "g1": lambda call, ctx, anchor: show_groups_menu_superset(call, 1, ctx, anchor=anchor),
+    "g2": lambda call, ctx, anchor: show_groups_menu_superset(call, 2, ctx, anchor=anchor),
+    "e1": lambda call, ctx, anchor: show_exercises_menu_superset(call, 1, ctx, anchor=anchor),
+    "e2": lambda call, ctx, anchor: show_exercises_menu_superset(call, 2, ctx, anchor=anchor),
+}
+
+@router.route("pg", str, int, flow.decode)
+def page_menu(call, menu, anchor, ctx):
+    show_page = PAGERS.get(menu)
+    if show_page:
+        show_page(call, ctx, anchor)
+
+@router.route("muscle", int, flow.decode)
+def choose_exercise(call, group_id, ctx):
+    log.debug("Выбрана группа: %s (id=%s) chat=%s", catalog.group_name(group_id), group_id, call.message.chat.id)
+    show_exercises_menu(call, ctx.replace(muscle_group_id=group_id))
+
+@router.route("s1_muscle", int, flow.decode)
+def s1_choose_group(call, gid, ctx):
+    log.debug("Superset: выбрана группа 1: %s (id=%s) chat=%s", catalog.group_name(gid), gid, call.message.chat.id)
+    show_exercises_menu_superset(call, 1, ctx.replace(s1_muscle_group_id=gid))
+
+@router.route("s2_muscle", int, flow.decode)
+def s2_choose_group(call, gid, ctx):
+    log.debug("Superset: выбрана группа 2: %s (id=%s) chat=%s", catalog.group_name(gid), gid, call.message.chat.id)
+    show_exercises_menu_superset(call, 2, ctx.replace(s2_muscle_group_id=gid))
+
+@router.route("s1_ex", int, flow.decode)
+def s1_choose_ex(call, ex_id, ctx):
+    log.debug("Superset: выбрано упражнение 1: %s chat=%s", catalog.exercise_name(ex_id), call.message.chat.id)
+    show_groups_menu_superset(call, 2, ctx.replace(s1_exercise_id=ex_id))
+
+@router.route("s2_ex", int, flow.decode)
+def s2_choose_ex(call, ex_id, ctx):
+    log.debug("Superset: выбрано упражнение 2: %s chat=%s", catalog.exercise_name(ex_id), call.message.chat.id)
+    ctx = ctx.replace(s2_exercise_id=ex_id)
+    remember_flow(call.message.chat.id, ctx)
+    show_reps_menu_superset(call, 1, ctx)
+
+@router.route("exercise", int, flow.decode)
+def start_set(call, ex_id, ctx):
+    log.debug("Выбрано упражнение: %s chat=%s", catalog.exercise_name(ex_id), call.message.chat.id)
+    ctx = ctx.replace(exercise_id=ex_id)
+    remember_flow(call.message.chat.id, ctx)
+    show_reps_menu(call, ctx)
+
+@router.route("reps", int, flow.decode)
+def choose_reps(call, reps, ctx):
     ensure_reps_exists(reps)
-    print(f"Выбраны повторения: {reps} chat={call.message.chat.id}")
-    show_weight_menu(call)
-
-@bot.callback_query_handler(func=lambda call: call.data in ["set_weight", "no_weight"])
-def get_weight(call):
-    state = ensure_state(call.message.chat.id)
-    if call.data == "no_weight":
-        state["weight"] = None
-        return finish_set(call)
-    show_weight_menu(call)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("w:"))
-def choose_weight(call):
-    state = ensure_state(call.message.chat.id)
-    weight = float(call.data.split(":")[1])
-    state["weight"] = weight
-    ensure_weight_exists(weight)
-    print(f"Выбран вес: {weight} кг chat={call.message.chat.id}")
-    finish_set(call)
+    log.debug("Выбраны повторения: %s chat=%s", reps, call.message.chat.id)
+    show_weight_menu(call, ctx.replace(reps=reps))
 
-def finish_superset(chat_id):
-    state = ensure_state(chat_id)
-    today = date.today()
-    cursor.execute(
-        """
-        INSERT INTO gym.supersets (
-            chat_id, date, first_exercise_id, second_exercise_id,
-            set_number, first_weight_kg, first_reps_count, second_weight_kg, second_reps_count
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);
-        """,
-        (
-            chat_id,
-            today,
-            state["s1_exercise_id"],
-            state["s2_exercise_id"],
-            state.get("set_number", 1),
-            state.get("s1_weight"),
-            state["s1_reps"],
-            state.get("s2_weight"),
-            state["s2_reps"],
-        ),
-    )
-    conn.commit()
+@router.route("no_weight", flow.decode)
+def no_weight(call, ctx):
+    finish_set(call, ctx.replace(weight=None))
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("sreps1:"))
-def s_choose_reps1(call):
-    st = ensure_state(call.message.chat.id)
-    st["s1_reps"] = int(call.data.split(":")[1])
-    ensure_reps_exists(st["s1_reps"])
-    print(f"Superset: повторения 1: {st['s1_reps']} chat={call.message.chat.id}")
-    show_weight_menu_superset(call, which=1)
+@router.route("w", float, flow.decode)
+def choose_weight(call, weight, ctx):
+    ensure_weight_exists(weight)
+    log.debug("Выбран вес: %s кг chat=%s", weight, call.message.chat.id)
+    finish_set(call, ctx.replace(weight=weight))
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("sreps2:"))
-def s_choose_reps2(call):
-    st = ensure_state(call.message.chat.id)
-    st["s2_reps"] = int(call.data.split(":")[1])
-    ensure_reps_exists(st["s2_reps"])
-    print(f"Superset: повторения 2: {st['s2_reps']} chat={call.message.chat.id}")
-    show_weight_menu_superset(call, which=2)
+RECORD_NAMES = {"e1rm": "расчётный 1ПМ", "weight": "рабочий вес"}
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("sw1:"))
-def s_choose_weight1(call):
-    st = ensure_state(call.message.chat.id)
-    st["s1_weight"] = float(call.data.split(":")[1])
-    ensure_weight_exists(st["s1_weight"])
-    print(f"Superset: вес 1: {st['s1_weight']} chat={call.message.chat.id}")
-    show_reps_menu_superset(call, which=2)
+# (упражнение, вес, повторения) обеих половин суперсета
+def superset_halves(ctx):
+    return [(ctx[f"s{i}_exercise_id"], ctx[f"s{i}_weight"], ctx[f"s{i}_reps"]) for i in (1, 2)]
 
-@bot.callback_query_handler(func=lambda call: call.data == "sno_weight1")
-def s_no_weight1(call):
-    st = ensure_state(call.message.chat.id)
-    st["s1_weight"] = None
-    print(f"Superset: без веса 1 chat={call.message.chat.id}")
-    show_reps_menu_superset(call, which=2)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("sw2:"))
-def s_choose_weight2(call):
-    st = ensure_state(call.message.chat.id)
-    st["s2_weight"] = float(call.data.split(":")[1])
-    ensure_weight_exists(st["s2_weight"])
-    print(f"Superset: вес 2: {st['s2_weight']} chat={call.message.chat.id}")
-    finish_superset(call.message.chat.id)
-    current_set = st.get("set_number", 1)
-    kb = InlineKeyboardMarkup()
-    kb.add(
-        InlineKeyboardButton("➕ Следующий сет", callback_data="s_next_set"),
-        InlineKeyboardButton("🏁 Закончить", callback_data="main_menu")
-    )
-    bot.edit_message_text(
-        f"Суперсет {current_set} сохранён: 1) {st['s1_reps']} повт, вес {st.get('s1_weight') or 'нет'} кг; 2) {st['s2_reps']} повт, вес {st.get('s2_weight') or 'нет'} кг",
-        call.message.chat.id,
-        call.message.message_id,
-        reply_markup=kb
+def finish_superset(call, ctx):
+    chat_id = call.message.chat.id
+    # Рекорды проверяются по обоим упражнениям до записи, как в finish_set
+    records = [
+        (ex_id, kind, value)
+        for ex_id, weight, reps in superset_halves(ctx)
+        for kind, value in analytics.check_record(chat_id, ex_id, weight, reps)
+    ]
+    writer.add_superset(
+        chat_id,
+        date.today(),
+        ctx["s1_exercise_id"],
+        ctx["s2_exercise_id"],
+        ctx["set_number"],
+        ctx["s1_weight"],
+        ctx["s1_reps"],
+        ctx["s2_weight"],
+        ctx["s2_reps"],
+        message_id=call.message.message_id,
+        flow_id=ctx["flow_id"],
     )
+    superset_saved(call, ctx, records)
 
-@bot.callback_query_handler(func=lambda call: call.data == "sno_weight2")
-def s_no_weight2(call):
-    st = ensure_state(call.message.chat.id)
-    st["s2_weight"] = None
-    print(f"Superset: без веса 2 chat={call.message.chat.id}")
-    finish_superset(call.message.chat.id)
-    current_set = st.get("set_number", 1)
-    kb = InlineKeyboardMarkup()
-    kb.add(
-        InlineKeyboardButton("➕ Следующий сет", callback_data="s_next_set"),
-        InlineKeyboardButton("🏁 Закончить", callback_data="main_menu")
-    )
+def superset_saved(call, ctx, records):
+    chat_id = call.message.chat.id
+    remember_flow(chat_id, next_set_ctx(ctx))
+    kb = flow_markup(keyboards.next_or_finish(f"s_next_set:{keyboards.FLOW}", "➕ Следующий сет"), ctx)
+    text = f"Суперсет {ctx['set_number']} сохранён: 1) {ctx['s1_reps']} повт, вес {ctx['s1_weight'] or 'нет'} кг; 2) {ctx['s2_reps']} повт, вес {ctx['s2_weight'] or 'нет'} кг"
+    for ex_id, kind, value in records:
+        text += f"\n🏆 Новый рекорд, {catalog.exercise_name(ex_id)}: {RECORD_NAMES[kind]} {keyboards.format_weight(value)} кг"
     bot.edit_message_text(
-        f"Суперсет {current_set} сохранён: 1) {st['s1_reps']} повт, вес {st.get('s1_weight') or 'нет'} кг; 2) {st['s2_reps']} повт, вес {st.get('s2_weight') or 'нет'} кг",
-        call.message.chat.id,
+        text,
+        chat_id,
         call.message.message_id,
         reply_markup=kb
     )
 
-@bot.callback_query_handler(func=lambda call: call.data == "s_next_set")
-def s_next_set(call):
-    st = ensure_state(call.message.chat.id)
-    st["set_number"] = st.get("set_number", 1) + 1
-    print(f"Следующий сет суперсета: {st['set_number']} chat={call.message.chat.id}")
-    show_reps_menu_superset(call, which=1)
+@router.route("sreps1", int, flow.decode)
+def s_choose_reps1(call, reps, ctx):
+    ensure_reps_exists(reps)
+    log.debug("Superset: повторения 1: %s chat=%s", reps, call.message.chat.id)
+    show_weight_menu_superset(call, 1, ctx.replace(s1_reps=reps))
+
+@router.route("sreps2", int, flow.decode)
+def s_choose_reps2(call, reps, ctx):
+    ensure_reps_exists(reps)
+    log.debug("Superset: повторения 2: %s chat=%s", reps, call.message.chat.id)
+    show_weight_menu_superset(call, 2, ctx.replace(s2_reps=reps))
+
+@router.route("sw1", float, flow.decode)
+def s_choose_weight1(call, weight, ctx):
+    ensure_weight_exists(weight)
+    log.debug("Superset: вес 1: %s chat=%s", weight, call.message.chat.id)
+    show_reps_menu_superset(call, 2, ctx.replace(s1_weight=weight))
+
+@router.route("sno_weight1", flow.decode)
+def s_no_weight1(call, ctx):
+    log.debug("Superset: без веса 1 chat=%s", call.message.chat.id)
+    show_reps_menu_superset(call, 2, ctx.replace(s1_weight=None))
 
-@bot.callback_query_handler(func=lambda call: call.data == "add_reps_menu")
-def add_reps_menu(call):
+@router.route("sw2", float, flow.decode)
+def s_choose_weight2(call, weight, ctx):
+    ensure_weight_exists(weight)
+    log.debug("Superset: вес 2: %s chat=%s", weight, call.message.chat.id)
+    finish_superset(call, ctx.replace(s2_weight=weight))
+
+@router.route("sno_weight2", flow.decode)
+def s_no_weight2(call, ctx):
+    log.debug("Superset: без веса 2 chat=%s", call.message.chat.id)
+    finish_superset(call, ctx.replace(s2_weight=None))
+
+@router.route("s_next_set", flow.decode)
+def s_next_set(call, ctx):
+    ctx = next_set_ctx(ctx)
+    remember_flow(call.message.chat.id, ctx)
+    log.debug("Следующий сет суперсета: %s chat=%s", ctx["set_number"], call.message.chat.id)
+    show_reps_menu_superset(call, 1, ctx)
+
+# Меню добавления значения возвращает в то же меню сценария. В суперсете
+# повторения и вес очищаются на каждом сете, поэтому по ним видно, для
+# какого упражнения открыто меню.
+@router.route("add_reps_menu", flow.decode)
+def add_reps_menu(call, ctx):
     candidates = [5, 8, 12, 16, 18, 25]
-    kb = build_grid_keyboard(candidates, "add_reps", back_callback=None, columns=3)
+    kb = flow_markup(keyboards.grid(tuple(candidates), "add_reps", columns=3, flow=True), ctx)
     bot.edit_message_text("Добавить новое значение повторений:", call.message.chat.id, call.message.message_id, reply_markup=kb)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("add_reps:"))
-def add_reps_value(call):
-    value = int(call.data.split(":")[1])
-    cursor.execute("INSERT INTO gym.repetitions (reps_count) VALUES (%s) ON CONFLICT DO NOTHING;", (value,))
-    conn.commit()
-    print(f"Добавлено значение повторений: {value}")
-    st = ensure_state(call.message.chat.id)
-    if st.get("mode") == "superset" and st.get("awaiting_superset") in ("first_reps", "second_reps"):
-        which = 1 if st["awaiting_superset"] == "first_reps" else 2
-        show_reps_menu_superset(call, which=which, send_new=True)
+@router.route("add_reps", int, flow.decode)
+def add_reps_value(call, value, ctx):
+    catalog.save_values(reps=[value])
+    log.info("Добавлено значение повторений: %s", value)
+    if ctx.kind == flow.SUPERSET:
+        show_reps_menu_superset(call, 1 if ctx["s1_reps"] is None else 2, ctx, send_new=True)
     else:
-        show_reps_menu(call, send_new=True)
+        show_reps_menu(call, ctx, send_new=True)
 
-@bot.callback_query_handler(func=lambda call: call.data == "add_weight_menu")
-def add_weight_menu(call):
+@router.route("add_weight_menu", flow.decode)
+def add_weight_menu(call, ctx):
     candidates = [1.25, 2.5, 5, 7.5, 12.5, 20]
     labels = [f"{c}" for c in candidates]
-    kb = build_grid_keyboard(labels, "add_weight", back_callback=None, columns=3)
+    kb = flow_markup(keyboards.grid(tuple(labels), "add_weight", columns=3, flow=True), ctx)
     bot.edit_message_text("Добавить новый вес (кг):", call.message.chat.id, call.message.message_id, reply_markup=kb)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("add_weight:"))
-def add_weight_value(call):
-    value = float(call.data.split(":")[1])
-    cursor.execute("INSERT INTO gym.weights (weight_kg) VALUES (%s) ON CONFLICT DO NOTHING;", (value,))
-    conn.commit()
-    print(f"Добавлен вес: {value} кг")
-    st = ensure_state(call.message.chat.id)
-    if st.get("mode") == "superset" and st.get("awaiting_superset") in ("first_weight", "second_weight"):
-        which = 1 if st["awaiting_superset"] == "first_weight" else 2
-        show_weight_menu_superset(call, which=which, send_new=True)
+@router.route("add_weight", float, flow.decode)
+def add_weight_value(call, value, ctx):
+    catalog.save_values(weights=[value])
+    log.info("Добавлен вес: %s кг", value)
+    if ctx.kind == flow.SUPERSET:
+        show_weight_menu_superset(call, 1 if ctx["s2_reps"] is None else 2, ctx, send_new=True)
     else:
-        show_weight_menu(call, send_new=True)
+        show_weight_menu(call, ctx, send_new=True)
 
-def finish_set(call_or_msg):
-    chat_id = call_or_msg.chat.id if hasattr(call_or_msg, "chat") else call_or_msg.message.chat.id
-    state = ensure_state(chat_id)
-    today = date.today()
-    cursor.execute(
-        """
-        INSERT INTO gym.workout_stats (
-            chat_id, date, exercise_id, set_number, weight_kg, reps_count
-        ) VALUES (%s, %s, %s, %s, %s, %s);
-        """,
-        (
-            chat_id,
-            today,
-            state["exercise_id"],
-            state.get("set_number", 1),
-            state.get("weight"),
-            state["reps"],
-        ),
-    )
-    conn.commit()
-    kb = InlineKeyboardMarkup()
-    kb.add(
-        InlineKeyboardButton("➕ Ещё подход", callback_data="next_set"),
-        InlineKeyboardButton("🏁 Закончить", callback_data="main_menu")
+def finish_set(call, ctx):
+    chat_id = call.message.chat.id
+    # Рекорд проверяется до записи: сравнение идёт с лучшими результатами в памяти
+    records = analytics.check_record(chat_id, ctx["exercise_id"], ctx["weight"], ctx["reps"])
+    writer.add_set(
+        chat_id,
+        date.today(),
+        ctx["exercise_id"],
+        ctx["set_number"],
+        ctx["weight"],
+        ctx["reps"],
+        message_id=call.message.message_id,
+        flow_id=ctx["flow_id"],
     )
-    current_set = state.get('set_number', 1)
-    print(f"Сохранён подход chat={chat_id} упражнение_id={state['exercise_id']} сет={current_set} повт={state['reps']} вес={state.get('weight')}")
+    set_saved(call, ctx, records)
+
+# Подход записан: следующий номер запоминается для ввода текстом, сообщение
+# становится подтверждением (общее для обоих режимов, см. async_bot.py)
+def set_saved(call, ctx, records):
+    chat_id = call.message.chat.id
+    remember_flow(chat_id, next_set_ctx(ctx))
+    kb = flow_markup(keyboards.next_or_finish(f"next_set:{keyboards.FLOW}", "➕ Ещё подход"), ctx)
+    log.info("Сохранён подход chat=%s упражнение_id=%s сет=%s повт=%s вес=%s", chat_id, ctx['exercise_id'], ctx['set_number'], ctx['reps'], ctx['weight'])
+    text = f"Подход {ctx['set_number']} сохранён: {ctx['reps']} повторений, вес: {ctx['weight'] or 'нет'} кг"
+    for kind, value in records:
+        text += f"\n🏆 Новый рекорд: {RECORD_NAMES[kind]} {keyboards.format_weight(value)} кг"
     bot.edit_message_text(
-        f"Подход {current_set} сохранён: {state['reps']} повторений, вес: {state.get('weight') or 'нет'} кг",
+        text,
         chat_id,
-        call_or_msg.message.message_id if hasattr(call_or_msg, 'message') else call_or_msg.message_id,
+        call.message.message_id,
         reply_markup=kb
     )
 
-@bot.callback_query_handler(func=lambda call: call.data == "next_set")
-def next_set(call):
-    chat_id = call.message.chat.id
-    state = ensure_state(chat_id)
-    state["set_number"] = state.get("set_number", 1) + 1
-    print(f"Следующий подход: {state['set_number']} chat={chat_id}")
-    show_reps_menu(call)
+@router.route("next_set", flow.decode)
+def next_set(call, ctx):
+    ctx = next_set_ctx(ctx)
+    remember_flow(call.message.chat.id, ctx)
+    log.debug("Следующий подход: %s chat=%s", ctx['set_number'], call.message.chat.id)
+    show_reps_menu(call, ctx)
 
-@bot.callback_query_handler(func=lambda call: call.data == "main_menu")
+@router.route("main_menu")
 def back_to_main(call):
-    ensure_state(call.message.chat.id)
-    print(f"Возврат в главное меню chat={call.message.chat.id}")
-    bot.edit_message_text("Выберите режим:", call.message.chat.id, call.message.message_id, reply_markup=main_menu())
+    forget_flow(call.message.chat.id)
+    log.debug("Возврат в главное меню chat=%s", call.message.chat.id)
+    bot.edit_message_text("Выберите режим:", call.message.chat.id, call.message.message_id, reply_markup=keyboards.main_menu())
 
-@bot.callback_query_handler(func=lambda call: call.data == "stats")
+@router.route("stats")
 def stats_menu(call):
-    kb = InlineKeyboardMarkup()
-    kb.add(
-        InlineKeyboardButton("📅 За день", callback_data="stats_day"),
-        InlineKeyboardButton("🏷 По упражнению", callback_data="stats_exercise"),
-    )
-    kb.add(InlineKeyboardButton("🔙 Назад", callback_data="main_menu"))
-    bot.edit_message_text("Что показать?", call.message.chat.id, call.message.message_id, reply_markup=kb)
+    forget_flow(call.message.chat.id)
+    bot.edit_message_text("Что показать?", call.message.chat.id, call.message.message_id, reply_markup=keyboards.stats_menu())
 
-@bot.callback_query_handler(func=lambda call: call.data == "exercise_back")
-def back_to_exercises(call):
-    print(f"Назад к упражнениям chat={call.message.chat.id}")
-    show_exercises_menu(call)
+@router.route("exercise_back", flow.decode)
+def back_to_exercises(call, ctx):
+    log.debug("Назад к упражнениям chat=%s", call.message.chat.id)
+    show_exercises_menu(call, ctx)
 
-@bot.callback_query_handler(func=lambda call: call.data == "reps_back")
-def back_to_reps(call):
-    print(f"Назад к повторениям chat={call.message.chat.id}")
-    show_reps_menu(call)
+@router.route("reps_back", flow.decode)
+def back_to_reps(call, ctx):
+    log.debug("Назад к повторениям chat=%s", call.message.chat.id)
+    show_reps_menu(call, ctx)
 
 def build_calendar(chat_id, year, month):
-    cal = calendar.Calendar(firstweekday=0)
-    weeks = cal.monthdayscalendar(year, month)
-    kb = InlineKeyboardMarkup()
-    prev_month = (datetime(year, month, 15) - timedelta(days=31)).replace(day=1)
-    next_month = (datetime(year, month, 15) + timedelta(days=31)).replace(day=1)
-    ru_months = {
-        1: "Январь", 2: "Февраль", 3: "Март", 4: "Апрель", 5: "Май", 6: "Июнь",
-        7: "Июль", 8: "Август", 9: "Сентябрь", 10: "Октябрь", 11: "Ноябрь", 12: "Декабрь"
-    }
-    kb.row(
-        InlineKeyboardButton("◀️", callback_data=f"cal:{prev_month.year}:{prev_month.month}"),
-        InlineKeyboardButton(f"{ru_months[month]} {year}", callback_data="noop"),
-        InlineKeyboardButton("▶️", callback_data=f"cal:{next_month.year}:{next_month.month}")
-    )
-    cursor.execute(
-        """
-        SELECT DISTINCT date FROM (
-            SELECT date FROM gym.workout_stats WHERE chat_id = %s AND date >= %s AND date < %s
-            UNION ALL
-            SELECT date FROM gym.supersets WHERE chat_id = %s AND date >= %s AND date < %s
-        ) t
-        """,
-        (
-            chat_id, datetime(year, month, 1).date(), (datetime(year, month, 1) + timedelta(days=32)).replace(day=1).date(),
-            chat_id, datetime(year, month, 1).date(), (datetime(year, month, 1) + timedelta(days=32)).replace(day=1).date(),
-        )
-    )
-    trained = {d[0].day for d in cursor.fetchall()}
-    kb.row(*[InlineKeyboardButton(x, callback_data="noop") for x in ["Пн","Вт","Ср","Чт","Пт","Сб","Вс"]])
-    for week in weeks:
-        row = []
-        for day in week:
-            if day == 0:
-                row.append(InlineKeyboardButton(" ", callback_data="noop"))
-            else:
-                label = f"{day}{'⭐' if day in trained else ''}"
-                row.append(InlineKeyboardButton(label, callback_data=f"day:{year}:{month}:{day}"))
-        kb.row(*row)
-    kb.add(InlineKeyboardButton("🔙 Назад", callback_data="stats"))
-    return kb
-
-@bot.callback_query_handler(func=lambda call: call.data == "stats_day")
+    writer.flush_chat(chat_id)
+    trained = stats.trained_days(chat_id, year, month)
+    return keyboards.calendar_menu(year, month, trained)
+
+@router.route("stats_day")
 def stats_day(call):
     today = datetime.today()
     kb = build_calendar(call.message.chat.id, today.year, today.month)
     bot.edit_message_text("Выберите день:", call.message.chat.id, call.message.message_id, reply_markup=kb)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("cal:"))
-def stats_calendar_nav(call):
-    _, y, m = call.data.split(":")
-    y = int(y); m = int(m)
+@router.route("cal", int, int)
+def stats_calendar_nav(call, y, m):
     kb = build_calendar(call.message.chat.id, y, m)
     bot.edit_message_text("Выберите день:", call.message.chat.id, call.message.message_id, reply_markup=kb)
 
 def build_day_summary(chat_id, y, m, d):
-    the_day = date(y, m, d)
-    def format_weight_text(w):
-        if w is None:
-            return "нет кг"
-        s = ("{:g}".format(w)).replace('.', ',')
-        return f"{s} кг"
-    def format_pair(reps, weight):
-        reps_txt = f"{reps}" if reps is not None else "–"
-        weight_txt = format_weight_text(weight)
-        return f"{reps_txt} x {weight_txt}"
-    cursor.execute(
-        """
-        SELECT mg.name AS group_name, ex.name AS ex_name, ws.set_number, ws.weight_kg, ws.reps_count, ws.created_at
-        FROM gym.workout_stats ws
-        JOIN gym.exercises ex ON ex.id = ws.exercise_id
-        JOIN gym.muscle_groups mg ON mg.id = ex.muscle_group_id
-        WHERE ws.chat_id = %s AND ws.date = %s
-        ORDER BY ws.created_at
-        """,
-        (chat_id, the_day)
-    )
-    singles_rows = cursor.fetchall()
-    singles_grouped = {}
-    for gname, exname, set_no, w, r, created in singles_rows:
-        key = (gname or "", exname or "")
-        singles_grouped.setdefault(key, []).append((set_no, r, w))
-    cursor.execute(
-        """
-        SELECT mg1.name, ex1.name, mg2.name, ex2.name, s.set_number,
-               s.first_weight_kg, s.first_reps_count, s.second_weight_kg, s.second_reps_count, s.created_at
-        FROM gym.supersets s
-        JOIN gym.exercises ex1 ON ex1.id = s.first_exercise_id
-        JOIN gym.muscle_groups mg1 ON mg1.id = ex1.muscle_group_id
-        JOIN gym.exercises ex2 ON ex2.id = s.second_exercise_id
-        JOIN gym.muscle_groups mg2 ON mg2.id = ex2.muscle_group_id
-        WHERE s.chat_id = %s AND s.date = %s
-        ORDER BY s.created_at
-        """,
-        (chat_id, the_day)
-    )
-    supers = cursor.fetchall()
-    lines = [f"Статистика за {the_day.strftime('%d.%m.%Y')}:\n"]
-    if singles_grouped:
-        lines.append("Одиночные упражнения:")
-        for (gname, exname), sets in singles_grouped.items():
-            lines.append(f"- ({gname}) {exname}:")
-            for set_no, r, w in sets:
-                lines.append(f"{set_no}) {format_pair(r, w)}")
-            lines.append("")
-    if supers:
-        lines.append("Суперсеты:\n")
-        for g1, n1, g2, n2, set_no, w1, r1, w2, r2, created in supers:
-            lines.append(f"- Сет {set_no}:")
-            lines.append(f"1) ({g1}) {n1}: {format_pair(r1, w1)};")
-            lines.append(f"2) ({g2}) {n2}: {format_pair(r2, w2)}")
-    if not singles_grouped and not supers:
-        lines.append("Нет данных за выбранный день.")
-    return "\n".join(lines).rstrip()
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("day:"))
-def stats_day_pick(call):
-    _, y, m, d = call.data.split(":")
-    y = int(y); m = int(m); d = int(d)
+    writer.flush_chat(chat_id)
+    return stats.day_summary(chat_id, date(y, m, d))
+
+@router.route("day", int, int, int)
+def stats_day_pick(call, y, m, d):
     text = build_day_summary(call.message.chat.id, y, m, d)
-    kb = InlineKeyboardMarkup()
-    kb.add(InlineKeyboardButton("🔙 Назад", callback_data="stats_day"))
+    kb = keyboards.back("stats_day")
     bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=kb)
 
-@bot.callback_query_handler(func=lambda call: call.data == "stats_exercise")
-def stats_exercise_entry(call):
+@router.route("stats_exercise")
+def stats_exercise_entry(call, anchor=0):
     st = ensure_state(call.message.chat.id)
     st["mode"] = "stats_exercise"
-    groups = get_muscle_groups()
-    kb = build_keyboard(groups, "stat_muscle", "stats")
+    kb = keyboards.groups_menu("stat_muscle", "stats", "pgs:0", with_add=False, anchor=anchor)
     bot.edit_message_text("Выберите группу:", call.message.chat.id, call.message.message_id, reply_markup=kb)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("stat_muscle:"))
-def stats_exercise_choose_group(call):
+@router.route("stat_muscle", int)
+def stats_exercise_choose_group(call, gid, anchor=0):
     st = ensure_state(call.message.chat.id)
-    gid = int(call.data.split(":")[1])
     st["stat_group_id"] = gid
-    exs = get_exercises_by_group(gid)
-    kb = build_keyboard(exs, "stat_ex", "stats_exercise")
+    kb = keyboards.exercises_menu(gid, "stat_ex", "stats_exercise", f"pgs:{gid}", with_add=False, anchor=anchor)
     bot.edit_message_text("Выберите упражнение:", call.message.chat.id, call.message.message_id, reply_markup=kb)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("stat_ex:"))
-def stats_exercise_show(call):
-    st = ensure_state(call.message.chat.id)
-    ex_id = int(call.data.split(":")[1])
-    since = (datetime.today() - timedelta(days=30)).date()
-    cursor.execute(
-        """
-        SELECT ws.date, ws.reps_count, ws.weight_kg
-        FROM gym.workout_stats ws
-        WHERE ws.chat_id = %s AND ws.exercise_id = %s AND ws.date >= %s
-        ORDER BY ws.date, ws.set_number
-        """,
-        (call.message.chat.id, ex_id, since)
-    )
-    rows = cursor.fetchall()
-    num_sets = len(rows)
-    avg_reps = round(sum([r[1] or 0 for r in rows]) / num_sets, 2) if num_sets else 0
-    avg_weight = round(sum([(r[2] or 0.0) for r in rows]) / num_sets, 2) if num_sets else 0
-    cursor.execute("SELECT name FROM gym.exercises WHERE id = %s", (ex_id,))
-    ex_name = cursor.fetchone()[0]
-    text = (
-        f"Статистика за месяц по: {ex_name}\n"
-        f"Подходов: {num_sets}\n"
-        f"Средние повторы: {avg_reps}\n"
-        f"Средний вес: {avg_weight} кг"
+# Страницы меню статистики: "pgs:группа:anchor", группа 0 - список групп
+@router.route("pgs", int, int)
+def stats_page(call, gid, anchor):
+    if gid:
+        stats_exercise_choose_group(call, gid, anchor)
+    else:
+        stats_exercise_entry(call, anchor)
+
+def show_exercise_stats(call, ex_id, days):
+    chat_id = call.message.chat.id
+    writer.flush_chat(chat_id)
+    res = stats.exercise_stats(chat_id, ex_id, days)
+    kb = keyboards.stats_windows(ex_id, days)
+    bot.edit_message_text(exercise_stats_text(ex_id, days, res), chat_id, call.message.message_id, reply_markup=kb)
+
+def exercise_stats_text(ex_id, days, res):
+    ex_name = catalog.exercise_name(ex_id)
+    max_weight = f"{keyboards.format_weight(res['max_weight'])} кг" if res["max_weight"] is not None else "нет"
+    return (
+        f"Статистика за {stats.WINDOWS[days]} по: {ex_name}\n"
+        f"Подходов: {res['sets']}\n"
+        f"Средние повторы: {res['avg_reps']}\n"
+        f"Средний вес: {res['avg_weight']} кг\n"
+        f"Максимальный вес: {max_weight}\n"
+        f"Объём: {keyboards.format_weight(res['volume'])} кг"
     )
-    kb = InlineKeyboardMarkup()
-    kb.add(InlineKeyboardButton("🔙 Назад", callback_data="stats_exercise"))
-    bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=kb)
 
-@bot.callback_query_handler(func=lambda call: call.data == "add_group")
-def add_group_prompt(call):
+@router.route("stat_ex", int)
+def stats_exercise_show(call, ex_id):
+    show_exercise_stats(call, ex_id, 30)
+
+@router.route("stat_exw", int, int)
+def stats_exercise_window(call, ex_id, days):
+    if days in stats.WINDOWS:
+        show_exercise_stats(call, ex_id, days)
+
+def render_progress(ex_name, report):
+    lines = [f"Прогресс: {ex_name}", f"Тренировок: {report['sessions']}, подходов: {report['sets']}"]
+    if report["current_e1rm"] is not None:
+        lines.append(f"Расчётный 1ПМ: {keyboards.format_weight(report['current_e1rm'])} кг (среднее за {analytics.ROLLING_SESSIONS} тренировки)")
+    if report["best_e1rm"] is not None:
+        value, day = report["best_e1rm"]
+        lines.append(f"Лучший 1ПМ: {keyboards.format_weight(value)} кг ({day:%d.%m.%Y})")
+    if report["best_weight"] is not None:
+        value, day = report["best_weight"]
+        lines.append(f"Максимальный вес: {keyboards.format_weight(value)} кг ({day:%d.%m.%Y})")
+    if report["trend"] is not None:
+        lines.append(f"Тренд за {analytics.TREND_WEEKS} недель: {report['trend']:+.1f} кг/нед")
+    lines.append(f"Последняя тренировка {report['last_date']:%d.%m.%Y}: тоннаж {keyboards.format_weight(report['last_tonnage'])} кг")
+    if report["records"]:
+        lines.append(f"Рекордов 1ПМ: {report['records']}, последний {report['last_record']:%d.%m.%Y}")
+    top = max(v for _, v in report["weekly"]) or 1
+    lines.append("\nОбъём по неделям:")
+    for monday, volume in report["weekly"]:
+        lines.append(f"{monday:%d.%m} {'▇' * round(10 * volume / top)} {keyboards.format_weight(volume)}")
+    return "\n".join(lines)
+
+@router.route("progress", int)
+def stats_progress(call, ex_id):
+    chat_id = call.message.chat.id
+    writer.flush_chat(chat_id)
+    report = analytics.progress(chat_id, ex_id)
+    ex_name = catalog.exercise_name(ex_id)
+    text = render_progress(ex_name, report) if report else f"Нет подходов по: {ex_name}"
+    bot.edit_message_text(text, chat_id, call.message.message_id, reply_markup=keyboards.back(f"stat_ex:{ex_id}"))
+
+# Название группы или упражнения приходит обычным сообщением, поэтому
+# контекст сценария до его получения хранится в состоянии чата
+@router.route("add_group", flow.decode)
+def add_group_prompt(call, ctx):
     chat_id = call.message.chat.id
     state = ensure_state(chat_id)
     state["awaiting_input"] = "group"
-    print(f"Запрос ввода новой группы chat={chat_id}")
+    state["flow"] = flow.encode(ctx)
+    log.debug("Запрос ввода новой группы chat=%s", chat_id)
     bot.send_message(chat_id, "Отправьте название новой группы мышц сообщением.")
 
-@bot.callback_query_handler(func=lambda call: call.data == "add_exercise")
-def add_exercise_prompt(call):
+@router.route("add_exercise", flow.decode)
+def add_exercise_prompt(call, ctx):
     chat_id = call.message.chat.id
     state = ensure_state(chat_id)
     state["awaiting_input"] = "exercise"
-    print(f"Запрос ввода нового упражнения chat={chat_id}")
+    state["flow"] = flow.encode(ctx)
+    log.debug("Запрос ввода нового упражнения chat=%s", chat_id)
     bot.send_message(chat_id, "Отправьте название нового упражнения сообщением.")
 
-@bot.message_handler(func=lambda m: ensure_state(m.chat.id).get("awaiting_input") in ("group", "exercise"))
+def is_awaiting_name(message):
+    state = sessions.peek(message.chat.id)
+    return state is not None and state.get("awaiting_input") in ("group", "exercise")
+
+@bot.message_handler(func=is_awaiting_name)
 def receive_new_names(message):
     chat_id = message.chat.id
     state = ensure_state(chat_id)
@@ -718,30 +636,248 @@ def receive_new_names(message):
     if not text:
         bot.send_message(chat_id, "Пустое название. Отправьте корректный текст.")
         return
+    try:
+        ctx = flow.decode(state.get("flow") or "")
+    except ValueError:
+        state["awaiting_input"] = None
+        sessions.save(chat_id)
+        bot.send_message(chat_id, "Выберите режим:", reply_markup=keyboards.main_menu())
+        return
+    dummy_call = type('obj', (), { 'message': message })()
+    step = superset_step(ctx) if ctx.kind == flow.SUPERSET else None
     if state["awaiting_input"] == "group":
-        cursor.execute("INSERT INTO gym.muscle_groups (name) VALUES (%s) ON CONFLICT DO NOTHING RETURNING id;", (text,))
-        row = cursor.fetchone()
-        if not row:
-            cursor.execute("SELECT id FROM gym.muscle_groups WHERE name = %s;", (text,))
-            row = cursor.fetchone()
-        conn.commit()
-        print(f"Добавлена/найдена группа: {text} id={row[0]} chat={chat_id}")
-        dummy_call = type('obj', (), { 'message': message })()
-        show_groups_menu(dummy_call, send_new=True)
+        with db.transaction() as cur:
+            cur.execute("INSERT INTO gym.muscle_groups (name) VALUES (%s) ON CONFLICT DO NOTHING RETURNING id;", (text,))
+            row = cur.fetchone()
+            if not row:
+                cur.execute("SELECT id FROM gym.muscle_groups WHERE name = %s;", (text,))
+                row = cur.fetchone()
+            catalog.notify(cur)
+        catalog.add_group(row[0], text)
+        log.info("Добавлена/найдена группа: %s id=%s chat=%s", text, row[0], chat_id)
+        if step:
+            show_groups_menu_superset(dummy_call, step, ctx, send_new=True)
+        else:
+            show_groups_menu(dummy_call, ctx, send_new=True)
     else:
-        group_id = state.get("muscle_group_id")
+        group_id = ctx[f"s{step}_muscle_group_id"] if step else ctx["muscle_group_id"]
         if not group_id:
             bot.send_message(chat_id, "Сначала выберите группу мышц.")
             return
-        cursor.execute(
-            "INSERT INTO gym.exercises (muscle_group_id, name) VALUES (%s, %s) ON CONFLICT DO NOTHING;",
-            (group_id, text)
-        )
-        conn.commit()
-        print(f"Добавлено упражнение: {text} для группы_id {group_id} chat={chat_id}")
-        dummy_call = type('obj', (), { 'message': message })()
-        show_exercises_menu(dummy_call, send_new=True)
+        with db.transaction() as cur:
+            cur.execute(
+                "INSERT INTO gym.exercises (muscle_group_id, name) VALUES (%s, %s) ON CONFLICT DO NOTHING RETURNING id;",
+                (group_id, text)
+            )
+            row = cur.fetchone()
+            if not row:
+                cur.execute("SELECT id FROM gym.exercises WHERE muscle_group_id = %s AND name = %s;", (group_id, text))
+                row = cur.fetchone()
+            catalog.notify(cur)
+        catalog.add_exercise(row[0], group_id, text)
+        log.info("Добавлено упражнение: %s для группы_id %s chat=%s", text, group_id, chat_id)
+        if step:
+            show_exercises_menu_superset(dummy_call, step, ctx, send_new=True)
+        else:
+            show_exercises_menu(dummy_call, ctx, send_new=True)
     state["awaiting_input"] = None
+    state["flow"] = None
+    sessions.save(chat_id)
+
+# ================================
+# ПОДХОДЫ ТЕКСТОМ
+# ================================
+
+def format_set(reps, weight):
+    return f"{reps} × {keyboards.format_weight(weight)} кг" if weight is not None else f"{reps} повт без веса"
+
+def log_sets(message, ctx, sets):
+    """Записывает подходы одиночного упражнения; возвращает текст подтверждения."""
+    chat_id = message.chat.id
+    first = ctx["set_number"]
+    catalog.save_values(reps=[r for r, _ in sets], weights=[w for _, w in sets if w is not None])
+    best = {}
+    for reps, weight in sets:
+        for kind, value in analytics.check_record(chat_id, ctx["exercise_id"], weight, reps):
+            best[kind] = max(best.get(kind, 0.0), value)
+    writer.add_sets(
+        chat_id, date.today(), ctx["exercise_id"],
+        [(first + n, weight, reps) for n, (reps, weight) in enumerate(sets)],
+        message_id=message.message_id, flow_id=ctx["flow_id"],
+    )
+    log.info("Сохранено подходов текстом chat=%s упражнение_id=%s: %s", chat_id, ctx["exercise_id"], len(sets))
+    lines = [f"{catalog.exercise_name(ctx['exercise_id'])}: сохранено подходов {len(sets)}"]
+    lines += [f"{first + n}) {format_set(reps, weight)}" for n, (reps, weight) in enumerate(sets)]
+    for kind, value in best.items():
+        lines.append(f"🏆 Новый рекорд: {RECORD_NAMES[kind]} {keyboards.format_weight(value)} кг")
+    return "\n".join(lines)
+
+def log_supersets(message, ctx, sets):
+    """Записывает сеты суперсета; возвращает текст подтверждения."""
+    chat_id = message.chat.id
+    first = ctx["set_number"]
+    values = [side for pair in sets for side in pair]
+    catalog.save_values(reps=[r for r, _ in values], weights=[w for _, w in values if w is not None])
+    ex_ids = ctx["s1_exercise_id"], ctx["s2_exercise_id"]
+    best = {}
+    for pair in sets:
+        for ex_id, (reps, weight) in zip(ex_ids, pair):
+            for kind, value in analytics.check_record(chat_id, ex_id, weight, reps):
+                best[ex_id, kind] = max(best.get((ex_id, kind), 0.0), value)
+    writer.add_supersets(
+        chat_id, date.today(), ctx["s1_exercise_id"], ctx["s2_exercise_id"],
+        [(first + n, w1, r1, w2, r2) for n, ((r1, w1), (r2, w2)) in enumerate(sets)],
+        message_id=message.message_id, flow_id=ctx["flow_id"],
+    )
+    log.info("Сохранено суперсетов текстом chat=%s: %s", chat_id, len(sets))
+    names = catalog.exercise_name(ctx["s1_exercise_id"]), catalog.exercise_name(ctx["s2_exercise_id"])
+    lines = [f"{names[0]} + {names[1]}: сохранено сетов {len(sets)}"]
+    lines += [
+        f"{first + n}) {format_set(*first_side)} + {format_set(*second_side)}"
+        for n, (first_side, second_side) in enumerate(sets)
+    ]
+    for (ex_id, kind), value in best.items():
+        lines.append(f"🏆 Новый рекорд, {catalog.exercise_name(ex_id)}: {RECORD_NAMES[kind]} {keyboards.format_weight(value)} кг")
+    return "\n".join(lines)
+
+def is_sets_text(message):
+    return bool(message.text) and bulk.looks_like(message.text)
+
+# Подходы выбранного упражнения одним сообщением: "10x50, 8x55" или
+# "3x10@40" (формат - в bulk.py). Все подходы записываются одним INSERT,
+# ответ - одно сообщение. Обработчик стоит перед поиском: текст из цифр
+# не ищется как название.
+@bot.message_handler(func=is_sets_text)
+def receive_sets(message):
+    chat_id = message.chat.id
+    ctx = active_flow(chat_id)
+    if ctx is None:
+        bot.send_message(chat_id, f"Сначала выберите упражнение, затем отправьте подходы. {bulk.HELP}")
+        sessions.save(chat_id)
+        return
+    try:
+        sets = bulk.parse(message.text, superset=ctx.kind == flow.SUPERSET)
+    except ValueError as e:
+        bot.send_message(chat_id, f"{e}\n{bulk.HELP}")
+        return
+    if ctx.kind == flow.SUPERSET:
+        text = log_supersets(message, ctx, sets)
+        next_callback, next_text = f"s_next_set:{keyboards.FLOW}", "➕ Следующий сет"
+    else:
+        text = log_sets(message, ctx, sets)
+        next_callback, next_text = f"next_set:{keyboards.FLOW}", "➕ Ещё подход"
+    # Кнопка продолжает нумерацию после последнего записанного подхода,
+    # следующее сообщение с подходами - тоже
+    last = ctx.replace(set_number=ctx["set_number"] + len(sets) - 1)
+    remember_flow(chat_id, next_set_ctx(last))
+    sessions.save(chat_id)
+    bot.send_message(chat_id, text, reply_markup=flow_markup(keyboards.next_or_finish(next_callback, next_text), last))
+
+# ================================
+# ПОИСК УПРАЖНЕНИЙ
+# ================================
+
+INLINE_RESULTS = 20
+INLINE_CACHE_SECONDS = 60
+
+# Кнопка результата поиска: упражнение выбрано, сразу к подходу
+@router.route("found", int, flow.decode)
+def choose_found(call, ex_id, ctx):
+    start_set(call, ex_id, ctx.replace(muscle_group_id=catalog.exercise_group(ex_id)))
+
+def is_search_text(message):
+    return bool(message.text) and not message.text.startswith("/")
+
+# Любой другой текст - поиск упражнения. Сюда же приходит название,
+# выбранное в inline-режиме (@бот жим): оно совпадает точно, и сразу
+# начинается подход.
+@bot.message_handler(func=is_search_text)
+def search_exercise(message):
+    chat_id = message.chat.id
+    found = search.search(message.text, limit=keyboards.PAGE_SIZE)
+    if not found:
+        bot.send_message(chat_id, "Упражнение не найдено. Выберите режим:", reply_markup=keyboards.main_menu())
+        return
+    ctx = flow.Flow(flow.SINGLE, flow_id=new_flow_id(), set_number=1)
+    if len(found) == 1 or search.is_exact(message.text, found[0]):
+        ex_id, group_id, _ = found[0]
+        ctx = ctx.replace(muscle_group_id=group_id, exercise_id=ex_id)
+        remember_flow(chat_id, ctx)
+        sessions.save(chat_id)
+        dummy_call = type('obj', (), { 'message': message })()
+        show_reps_menu(dummy_call, ctx, send_new=True)
+        return
+    bot.send_message(chat_id, "Найденные упражнения:", reply_markup=flow_markup(keyboards.search_results(found), ctx))
+
+@bot.inline_handler(func=lambda query: True)
+def inline_search(query):
+    text = query.query.strip()
+    found = search.search(text, limit=INLINE_RESULTS) if text else search.browse(INLINE_RESULTS)
+    results = [
+        telebot.types.InlineQueryResultArticle(
+            str(ex_id), name, telebot.types.InputTextMessageContent(name),
+            description=catalog.group_name(group_id),
+        )
+        for ex_id, group_id, name in found
+    ]
+    bot.answer_inline_query(query.id, results, cache_time=INLINE_CACHE_SECONDS)
+
+# ================================
+# ЗАПУСК
+# ================================
 
-print("Бот запущен.")
-bot.infinity_polling()
\ No newline at end of file
+def timed_request(method, url, **kwargs):
+    """Отправитель запросов telebot: пишет время и ошибки вызовов API в метрики."""
+    name = url.rsplit("/", 1)[-1]
+    started = time.perf_counter()
+    try:
+        response = telebot.apihelper._get_req_session().request(method, url, **kwargs)
+    except Exception as e:
+        metrics.TELEGRAM_ERRORS.inc(name, type(e).__name__)
+        raise
+    finally:
+        metrics.TELEGRAM_SECONDS.observe(time.perf_counter() - started, name)
+    if response.status_code != 200:
+        metrics.TELEGRAM_ERRORS.inc(name, str(response.status_code))
+    return response
+
+# Адрес Bot API можно переопределить в config.py, например для
+# нагрузочного теста с поддельным сервером (bench/load.py):
+#   API_URL = 'http://127.0.0.1:8081/bot{0}/{1}'
+API_URL = getattr(config, "API_URL", None)
+
+def startup():
+    global bot
+    logs.setup()
+    telebot.apihelper.CUSTOM_REQUEST_SENDER = timed_request
+    if API_URL:
+        telebot.apihelper.API_URL = API_URL
+    address = metrics.start()
+    if address:
+        log.info("Метрики: http://%s:%s/metrics", *address)
+    migrate.startup()
+    direct = bot
+    if outbox.ENABLED and not isinstance(bot, outbox.Outbox):
+        bot = outbox.Outbox(bot)
+        bot.start()
+    catalog.start_listener()
+    writer.start()
+    # Сводка идёт мимо очереди исходящих: она сама соблюдает свой лимит и
+    # по ответу Telegram считает отправленные и заблокированные чаты
+    digest.start(direct.send_message)
+
+def shutdown():
+    digest.stop()
+    writer.stop()
+    if isinstance(bot, outbox.Outbox):
+        bot.stop()
+    metrics.stop()
+    db.close_all()
+
+if __name__ == "__main__":
+    startup()
+    log.info("Бот запущен.")
+    try:
+        bot.infinity_polling()
+    finally:
+        shutdown()
\ No newline at end of file
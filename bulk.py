@@ -0,0 +1,98 @@
+import re
+
+# ================================
+# ЗАПИСЬ ПОДХОДОВ ТЕКСТОМ
+# ================================
+# Вместо трёх нажатий на подход (повторения, вес, «ещё подход») все подходы
+# выбранного упражнения можно отправить одним сообщением:
+#
+#   10x50, 8x55, 6x60     # повторения x вес, через запятую, ";" или пробел
+#   3x10@40               # 3 подхода по 10 повторений с весом 40 кг
+#   12, 10, 8             # без веса
+#   3x15@0                # 3 подхода по 15 повторений без веса
+#   10x50+12x20, 8x55+12  # суперсет: первое + второе упражнение
+#
+# Вес можно писать с точкой или запятой (52.5, 52,5); вместо x подходят
+# русская х, × и *. Сообщение разбирается целиком: при любой ошибке не
+# записывается ничего.
+
+MAX_SETS = 30
+MAX_REPS = 1000
+MAX_WEIGHT = 1000
+
+HELP = "Формат: 10x50, 8x55 (повторения x вес) или 3x10@40 (подходы x повторения @ вес)."
+
+_X = r"\s*[xXхХ×*]\s*"
+# Запятая - разделитель подходов, поэтому дробной частью она считается,
+# только если за цифрами не начинается следующий подход: "10x50,8x55"
+_NUM = r"\d+(?:\.\d+|,\d+(?!\d*\s*[xXхХ×*@]))?"
+_PART = re.compile(
+    rf"\s*(?:(?:(?P<count>\d+){_X})?(?P<reps>\d+)\s*@\s*(?P<at>{_NUM})"
+    rf"|(?P<single>\d+)(?:{_X}(?P<weight>{_NUM}))?)"
+)
+_PLUS = re.compile(r"\s*[+/]")
+_SEP = re.compile(r"\s*[,;]\s*|\s+")
+_START = re.compile(r"\s*\d")
+
+
+def looks_like(text):
+    """Похоже ли сообщение на подходы (а не на название упражнения)."""
+    return bool(_START.match(text)) and not any(c.isalpha() and c not in "xXхХ" for c in text)
+
+
+def _weight(raw):
+    if raw is None:
+        return None
+    value = float(raw.replace(",", "."))
+    if value > MAX_WEIGHT or round(value, 2) != value:
+        raise ValueError(f"Некорректный вес: {raw}")
+    return value or None
+
+
+def _part(text, pos):
+    m = _PART.match(text, pos)
+    if not m:
+        raise ValueError(f"Не понял: «{text[pos:].strip()[:20]}»")
+    if m["reps"] is not None:
+        count, reps, weight = int(m["count"] or 1), int(m["reps"]), _weight(m["at"])
+    else:
+        count, reps, weight = 1, int(m["single"]), _weight(m["weight"])
+    if not 1 <= reps <= MAX_REPS:
+        raise ValueError(f"Некорректное число повторений: {reps}")
+    if count < 1:
+        raise ValueError("Число подходов должно быть больше нуля")
+    return m.end(), count, (reps, weight)
+
+
+def parse(text, superset=False):
+    """Разбирает подходы из сообщения.
+
+    Возвращает [(повторения, вес)], для суперсета - [((повт1, вес1), (повт2, вес2))];
+    вес None - без веса. ValueError с пояснением для пользователя, если
+    сообщение не разобрано или подходов слишком много.
+    """
+    sets = []
+    pos, end = 0, len(text.rstrip())
+    while pos < end:
+        pos, count, first = _part(text, pos)
+        if superset:
+            m = _PLUS.match(text, pos)
+            if not m:
+                raise ValueError("В суперсете укажите оба упражнения через +: 10x50+12x20")
+            pos, count2, second = _part(text, m.end())
+            if count != count2 and min(count, count2) != 1:
+                raise ValueError("Разное число подходов у упражнений суперсета")
+            count, item = max(count, count2), (first, second)
+        else:
+            item = first
+        if len(sets) + count > MAX_SETS:
+            raise ValueError(f"Не больше {MAX_SETS} подходов в одном сообщении")
+        sets += [item] * count
+        if pos < end:
+            m = _SEP.match(text, pos)
+            if not m:
+                raise ValueError(f"Не понял: «{text[pos:].strip()[:20]}»")
+            pos = m.end()
+    if not sets:
+        raise ValueError("Не найдено ни одного подхода")
+    return sets
@@ -0,0 +1,341 @@
+import bisect
+import logging
+import os
+import select
+import threading
+import time
+import uuid
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+import db
+
+# ================================
+# КЭШ СПРАВОЧНИКОВ
+# ================================
+# Группы мышц, упражнения, повторения и веса почти не меняются, поэтому
+# держим их в памяти процесса. Изменения из этого процесса применяются на
+# месте, а остальные процессы узнают о них через LISTEN/NOTIFY.
+
+NOTIFY_CHANNEL = "gym_catalog"
+
+# Промах по id (кнопка из старого сообщения или подделанный callback)
+# перечитывает справочники не чаще раза в MISS_RELOAD_INTERVAL секунд
+MISS_RELOAD_INTERVAL = 10
+
+# Метка процесса: свои уведомления не вызывают перезагрузку
+_instance_id = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_lock = threading.RLock()
+_loaded = False
+_miss_reload_at = float("-inf")
+_listener = None
+# Другие модули получают уведомления своих каналов через тот же слушатель
+_subscribers = {}  # канал -> [функция(payload), ...]
+
+log = logging.getLogger(__name__)
+
+
+class Unknown(KeyError):
+    """Группы или упражнения с таким id нет (и после перезагрузки)."""
+
+
+# Версия растёт при каждом изменении справочников
+version = 0
+
+_group_names = {}
+_groups = []
+_exercise_names = {}
+_exercise_groups = {}
+_exercises_by_group = {}
+_reps = []
+_weights = []
+_reps_set = frozenset()
+_weights_set = frozenset()
+
+
+def sort_key(item):
+    """Ключ сортировки меню для (id, название): без регистра, ё = е."""
+    name = item[1]
+    return name.casefold().replace("ё", "е"), name
+
+
+def load():
+    """Полностью перечитывает справочники из БД."""
+    global _loaded, version, _group_names, _groups, _exercise_names
+    global _exercise_groups, _exercises_by_group, _reps, _weights, _reps_set, _weights_set
+    with db.transaction() as cur:
+        cur.execute("SELECT id, name FROM gym.muscle_groups;")
+        groups = cur.fetchall()
+        cur.execute("SELECT id, muscle_group_id, name FROM gym.exercises;")
+        exercises = cur.fetchall()
+        cur.execute("SELECT reps_count FROM gym.repetitions ORDER BY reps_count;")
+        reps = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT weight_kg FROM gym.weights ORDER BY weight_kg;")
+        weights = [float(row[0]) for row in cur.fetchall()]
+    by_group = {}
+    for ex_id, group_id, name in exercises:
+        by_group.setdefault(group_id, []).append((ex_id, name))
+    for items in by_group.values():
+        items.sort(key=sort_key)
+    with _lock:
+        _group_names = dict(groups)
+        _groups = sorted(groups, key=sort_key)
+        _exercise_names = {ex_id: name for ex_id, _, name in exercises}
+        _exercise_groups = {ex_id: group_id for ex_id, group_id, _ in exercises}
+        _exercises_by_group = by_group
+        _reps = reps
+        _weights = weights
+        _reps_set = frozenset(reps)
+        _weights_set = frozenset(weights)
+        version += 1
+        _loaded = True
+
+
+def _ensure_loaded():
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                load()
+
+
+def invalidate():
+    global _loaded
+    with _lock:
+        _loaded = False
+
+
+# ================================
+# ЧТЕНИЕ
+# ================================
+
+def get_muscle_groups():
+    _ensure_loaded()
+    return _groups
+
+
+def get_exercises_by_group(group_id):
+    _ensure_loaded()
+    return _exercises_by_group.get(group_id, [])
+
+
+def get_all_exercises():
+    """Все упражнения: [(id, группа, название)] в произвольном порядке."""
+    _ensure_loaded()
+    with _lock:
+        return [(ex_id, _exercise_groups[ex_id], name) for ex_id, name in _exercise_names.items()]
+
+
+def page(items, anchor, before, size):
+    """Keyset-страница списка, отсортированного как меню, относительно anchor.
+
+    anchor - (id, название) элемента, после которого (или перед которым, если
+    before) начинается страница; None - первая страница. Позиция ищется по
+    ключу сортировки, поэтому добавление элементов не сдвигает страницы.
+    Возвращает (элементы, есть_раньше, есть_дальше).
+    """
+    if anchor is None:
+        start = 0
+    elif before:
+        start = max(0, bisect.bisect_left(items, sort_key(anchor), key=sort_key) - size)
+    else:
+        start = bisect.bisect_right(items, sort_key(anchor), key=sort_key)
+        if start >= len(items):
+            start = max(0, len(items) - size)
+    end = start + size
+    return items[start:end], start > 0, end < len(items)
+
+
+def get_all_reps():
+    _ensure_loaded()
+    return _reps
+
+
+def get_all_weights():
+    _ensure_loaded()
+    return _weights
+
+
+def has_reps(value):
+    _ensure_loaded()
+    return value in _reps_set
+
+
+def has_weight(value):
+    _ensure_loaded()
+    return float(value) in _weights_set
+
+
+def _reload_on_miss():
+    """Перечитывает справочники после промаха, если с прошлого раза прошло MISS_RELOAD_INTERVAL."""
+    global _miss_reload_at
+    with _lock:
+        now = time.monotonic()
+        if now - _miss_reload_at < MISS_RELOAD_INTERVAL:
+            return
+        _miss_reload_at = now
+    load()
+
+
+def group_name(group_id):
+    _ensure_loaded()
+    name = _group_names.get(group_id)
+    if name is None:
+        # Группа могла появиться в другом процессе, а уведомление потеряться
+        _reload_on_miss()
+        name = _group_names.get(group_id)
+        if name is None:
+            raise Unknown(f"группа мышц id={group_id}")
+    return name
+
+
+def exercise_name(ex_id):
+    _ensure_loaded()
+    name = _exercise_names.get(ex_id)
+    if name is None:
+        _reload_on_miss()
+        name = _exercise_names.get(ex_id)
+        if name is None:
+            raise Unknown(f"упражнение id={ex_id}")
+    return name
+
+
+def exercise_group(ex_id):
+    _ensure_loaded()
+    group_id = _exercise_groups.get(ex_id)
+    if group_id is None:
+        _reload_on_miss()
+        group_id = _exercise_groups.get(ex_id)
+        if group_id is None:
+            raise Unknown(f"упражнение id={ex_id}")
+    return group_id
+
+
+# ================================
+# ОБНОВЛЕНИЕ НА МЕСТЕ
+# ================================
+# Списки не меняются, а заменяются целиком: читатели в других потоках
+# всегда видят согласованный снимок без блокировок.
+
+def add_group(group_id, name):
+    global version, _groups
+    _ensure_loaded()
+    with _lock:
+        if group_id in _group_names:
+            return
+        _group_names[group_id] = name
+        _groups = sorted(_groups + [(group_id, name)], key=sort_key)
+        version += 1
+
+
+def add_exercise(ex_id, group_id, name):
+    global version
+    _ensure_loaded()
+    with _lock:
+        if ex_id in _exercise_names:
+            return
+        _exercise_names[ex_id] = name
+        _exercise_groups[ex_id] = group_id
+        items = _exercises_by_group.get(group_id, []) + [(ex_id, name)]
+        _exercises_by_group[group_id] = sorted(items, key=sort_key)
+        version += 1
+
+
+def add_reps(value):
+    global version, _reps, _reps_set
+    _ensure_loaded()
+    with _lock:
+        if value in _reps_set:
+            return
+        _reps = sorted(_reps + [value])
+        _reps_set = _reps_set | {value}
+        version += 1
+
+
+def add_weight(value):
+    global version, _weights, _weights_set
+    _ensure_loaded()
+    value = float(value)
+    with _lock:
+        if value in _weights_set:
+            return
+        _weights = sorted(_weights + [value])
+        _weights_set = _weights_set | {value}
+        version += 1
+
+
+def save_values(reps=(), weights=()):
+    """Записывает в справочники только новые значения, одной транзакцией на всю пачку."""
+    new_reps = sorted({v for v in reps if v is not None and not has_reps(v)})
+    new_weights = sorted({float(v) for v in weights if v is not None and not has_weight(v)})
+    if not new_reps and not new_weights:
+        return
+    with db.transaction() as cur:
+        if new_reps:
+            execute_values(cur, "INSERT INTO gym.repetitions (reps_count) VALUES %s ON CONFLICT DO NOTHING;", [(v,) for v in new_reps])
+        if new_weights:
+            execute_values(cur, "INSERT INTO gym.weights (weight_kg) VALUES %s ON CONFLICT DO NOTHING;", [(v,) for v in new_weights])
+        notify(cur)
+    for v in new_reps:
+        add_reps(v)
+    for v in new_weights:
+        add_weight(v)
+
+
+def notify(cur):
+    """Сообщает другим процессам об изменении справочников (внутри транзакции записи)."""
+    cur.execute("SELECT pg_notify(%s, %s);", (NOTIFY_CHANNEL, _instance_id))
+
+
+# ================================
+# LISTEN/NOTIFY
+# ================================
+
+def subscribe(channel, func):
+    """Вызывать func(payload) на каждое уведомление канала (до start_listener)."""
+    _subscribers.setdefault(channel, []).append(func)
+
+
+def _listen_forever():
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(**db._connect_params())
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                for channel in (NOTIFY_CHANNEL, *_subscribers):
+                    cur.execute(f"LISTEN {channel};")
+            # Пока слушателя не было, уведомления могли пропасть
+            invalidate()
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                foreign = False
+                while conn.notifies:
+                    n = conn.notifies.pop(0)
+                    if n.channel != NOTIFY_CHANNEL:
+                        for func in _subscribers.get(n.channel, ()):
+                            try:
+                                func(n.payload)
+                            except Exception as e:
+                                log.error("Ошибка обработки уведомления %s: %s", n.channel, e)
+                    elif n.payload != _instance_id:
+                        foreign = True
+                if foreign:
+                    log.info("Справочники изменены другим процессом, перезагрузка")
+                    load()
+        except Exception as e:
+            log.error("Ошибка слушателя справочников: %s", e)
+            time.sleep(5)
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def start_listener():
+    global _listener
+    if _listener is None:
+        _listener = threading.Thread(target=_listen_forever, name="catalog-listener", daemon=True)
+        _listener.start()
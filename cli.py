@@ -0,0 +1,93 @@
+import argparse
+import sys
+
+import db
+import migrate
+import stats
+import transfer
+
+# ================================
+# СЛУЖЕБНЫЕ КОМАНДЫ
+# ================================
+#   python cli.py backfill-days       # заполнить индекс тренировочных дней по истории
+#   python cli.py backfill-rollups    # пересчитать итоги по упражнениям по истории
+#   python cli.py migrate [--status]   # применить миграции схемы
+#   python cli.py export --chat-id 123 [--format json] [-o файл]
+#   python cli.py import --chat-id 123 файл.csv [--dry-run]
+
+
+def cmd_backfill_days(args):
+    count = stats.backfill_days()
+    print(f"Индекс тренировочных дней заполнен: {count} месяцев")
+
+
+def cmd_backfill_rollups(args):
+    count = stats.backfill_rollups()
+    print(f"Итоги по упражнениям пересчитаны: {count} строк")
+
+
+def cmd_migrate(args):
+    if args.status:
+        done = migrate.applied()
+        for version, name, _ in migrate.available():
+            print(f"{'+' if version in done else ' '} {version:04d}_{name}")
+        return
+    versions = migrate.apply()
+    print(f"Применено миграций: {len(versions)}" + (f" ({', '.join(map(str, versions))})" if versions else ""))
+    print(f"Создано секций: {migrate.ensure_partitions()}")
+
+
+def cmd_export(args):
+    export = transfer.export_json if args.format == "json" else transfer.export_csv
+    if args.output:
+        with open(args.output, "wb") as f:
+            count = export(args.chat_id, f)
+        print(f"Выгружено строк: {count}", file=sys.stderr)
+    else:
+        export(args.chat_id, sys.stdout.buffer)
+
+
+def cmd_import(args):
+    with open(args.file, "rb") as f:
+        result = transfer.import_csv(args.chat_id, f, dry_run=args.dry_run)
+    prefix = "Проверка: " if args.dry_run else ""
+    print(f"{prefix}строк в файле: {result['rows']}, подходов: {result['sets']}, суперсетов: {result['supersets']}")
+    if result["unknown"]:
+        print("Нет в справочнике (строки пропущены): " + ", ".join(result["unknown"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Служебные команды бота")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("backfill-days", help="заполнить gym.training_days по истории тренировок")
+    p.set_defaults(func=cmd_backfill_days)
+
+    p = sub.add_parser("backfill-rollups", help="пересчитать gym.exercise_daily по истории тренировок")
+    p.set_defaults(func=cmd_backfill_rollups)
+
+    p = sub.add_parser("migrate", help="применить миграции схемы из migrations/")
+    p.add_argument("--status", action="store_true", help="только показать, какие миграции применены")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("export", help="выгрузить историю чата в CSV или JSON Lines")
+    p.add_argument("--chat-id", type=int, required=True)
+    p.add_argument("--format", choices=("csv", "json"), default="csv")
+    p.add_argument("-o", "--output", help="файл (по умолчанию stdout)")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("import", help="загрузить подходы чата из CSV")
+    p.add_argument("--chat-id", type=int, required=True)
+    p.add_argument("file")
+    p.add_argument("--dry-run", action="store_true", help="проверить файл без записи")
+    p.set_defaults(func=cmd_import)
+
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    finally:
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
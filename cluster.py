@@ -0,0 +1,270 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import apihelper, types
+
+import config
+import logs
+import metrics
+from config import TOKEN
+
+# ================================
+# НЕСКОЛЬКО РАБОЧИХ ПРОЦЕССОВ
+# ================================
+# Один процесс-приёмник получает обновления (long polling или вебхук) и по
+# chat_id раскладывает их по N рабочим процессам: чат всегда попадает в один
+# и тот же процесс, а внутри него - в один и тот же поток, поэтому порядок
+# обновлений чата сохраняется. Каждый рабочий процесс - обычный bot.py со
+# своим пулом соединений БД, очередью записи и очередью исходящих; общий
+# лимит отправки делится между процессами поровну.
+#
+# Общее между процессами лежит в Postgres: справочник и кэши статистики
+# сбрасываются через LISTEN/NOTIFY (см. catalog.subscribe). Ход тренировки
+# передаётся в кнопках (flow.py), а ожидание текстового ввода при постоянном
+# хранилище (SESSIONS backend postgres) переживает и перезапуск, и изменение
+# числа процессов. Настройки в config.py:
+#
+#   CLUSTER = {
+#       'workers': 4,         # рабочих процессов (по умолчанию - число ядер)
+#       'threads': 4,         # потоков обработки в каждом процессе
+#       'queue_size': 10000,  # очередь процесса; при переполнении приёмник ждёт
+#   }
+#
+#   python cluster.py              # long polling
+#   python cluster.py --webhook    # вебхук (настройки WEBHOOK, как у async_bot.py)
+#
+# Метрики приёмника - на порту METRICS['port'], рабочего процесса i - на
+# порту METRICS['port'] + 1 + i.
+
+SETTINGS = getattr(config, "CLUSTER", {})
+WORKERS = int(SETTINGS.get("workers", os.cpu_count() or 2))
+THREADS = int(SETTINGS.get("threads", 4))
+QUEUE_SIZE = int(SETTINGS.get("queue_size", 10000))
+WEBHOOK = getattr(config, "WEBHOOK", {})
+API_URL = getattr(config, "API_URL", None)
+
+# Как часто приёмник проверяет, живы ли рабочие процессы
+HEALTH_INTERVAL = 5.0
+STOP_TIMEOUT = 30.0
+
+# Где в обновлении искать чат: первый найденный путь и задаёт шард
+_CHAT_PATHS = (
+    ("message", "chat"),
+    ("edited_message", "chat"),
+    ("callback_query", "message", "chat"),
+    ("callback_query", "from"),
+    ("inline_query", "from"),
+    ("chosen_inline_result", "from"),
+    ("my_chat_member", "chat"),
+    ("chat_member", "chat"),
+)
+
+ROUTED = metrics.Counter("gym_ingress_updates_total", "Обновлений передано рабочим процессам", ("worker",))
+RESTARTS = metrics.Counter("gym_ingress_worker_restarts_total", "Перезапусков упавших рабочих процессов", ("worker",))
+
+log = logging.getLogger("cluster")
+
+
+def chat_of(update):
+    """chat_id обновления (словарь из Bot API); 0, если чата в нём нет."""
+    for path in _CHAT_PATHS:
+        node = update
+        for key in path:
+            node = node.get(key) if isinstance(node, dict) else None
+        if node and "id" in node:
+            return node["id"]
+    return 0
+
+
+# ================================
+# РАБОЧИЙ ПРОЦЕСС
+# ================================
+
+def _worker_main(index, count, inbox):
+    import bot as handlers
+    import outbox
+    import writer
+
+    # Ctrl+C получает вся группа процессов, а останавливает рабочих приёмник
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    outbox.GLOBAL_RATE = outbox.GLOBAL_RATE / count
+    if metrics.SETTINGS.get("enabled"):
+        metrics.SETTINGS = dict(metrics.SETTINGS, port=int(metrics.SETTINGS.get("port", 9108)) + 1 + index)
+    # Журнал записи у каждого процесса свой: перезапущенный процесс с тем же
+    # номером дописывает в БД то, что осталось от предыдущего
+    writer.JOURNAL_PATH = f"{writer.JOURNAL_PATH}.{index}"
+    dispatcher = handlers.bot
+    dispatcher.threaded = False
+    handlers.startup()
+
+    def run(lane):
+        while True:
+            raw = lane.get()
+            if raw is None:
+                return
+            try:
+                dispatcher.process_new_updates([types.Update.de_json(raw)])
+            except Exception as e:
+                log.exception("Ошибка обработки обновления %s: %s", raw.get("update_id"), e)
+
+    lanes = [queue.SimpleQueue() for _ in range(THREADS)]
+    threads = [
+        threading.Thread(target=run, args=(lane,), name=f"worker-{index}-{n}")
+        for n, lane in enumerate(lanes)
+    ]
+    for t in threads:
+        t.start()
+    log.info("Рабочий процесс %s запущен, pid %s", index, os.getpid())
+    while True:
+        raw = inbox.get()
+        if raw is None:
+            break
+        # Все чаты этого процесса дают одинаковый остаток от деления на count,
+        # поэтому по потокам раскладывается частное
+        lanes[(chat_of(raw) // count) % THREADS].put(raw)
+    for lane in lanes:
+        lane.put(None)
+    for t in threads:
+        t.join()
+    handlers.shutdown()
+
+
+# ================================
+# ПРИЁМНИК
+# ================================
+
+class Ingress:
+    def __init__(self, count):
+        # spawn: у приёмника уже есть потоки, fork после них небезопасен
+        self.ctx = multiprocessing.get_context("spawn")
+        self.count = count
+        self.queues = [self.ctx.Queue(QUEUE_SIZE) for _ in range(count)]
+        self.procs = [None] * count
+        self._stopping = False
+
+    def _spawn(self, index):
+        proc = self.ctx.Process(
+            target=_worker_main, args=(index, self.count, self.queues[index]), name=f"worker-{index}"
+        )
+        proc.start()
+        self.procs[index] = proc
+
+    def start(self):
+        for index in range(self.count):
+            self._spawn(index)
+        threading.Thread(target=self._watch, name="watchdog", daemon=True).start()
+
+    def _watch(self):
+        while not self._stopping:
+            time.sleep(HEALTH_INTERVAL)
+            for index, proc in enumerate(self.procs):
+                if not self._stopping and not proc.is_alive():
+                    # Очередь процесса остаётся прежней, поэтому накопившиеся
+                    # обновления его чатов обработает новый процесс
+                    log.error("Рабочий процесс %s завершился с кодом %s, перезапуск", index, proc.exitcode)
+                    RESTARTS.inc(str(index))
+                    self._spawn(index)
+
+    def route(self, update):
+        index = chat_of(update) % self.count
+        self.queues[index].put(update)
+        ROUTED.inc(str(index))
+
+    def poll(self):
+        apihelper.delete_webhook(TOKEN)
+        offset = None
+        while True:
+            try:
+                updates = apihelper.get_updates(TOKEN, offset=offset, timeout=30, long_polling_timeout=20)
+            except Exception as e:
+                log.warning("Ошибка получения обновлений: %s", e)
+                time.sleep(3)
+                continue
+            for update in updates:
+                offset = update["update_id"] + 1
+                self.route(update)
+
+    def serve_webhook(self):
+        secret = WEBHOOK.get("secret_token")
+        path = WEBHOOK.get("path", "/bot")
+        route = self.route
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != path:
+                    self.send_error(404)
+                    return
+                if secret and self.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+                    self.send_error(403)
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    update = json.loads(body)
+                except ValueError:
+                    self.send_error(400)
+                    return
+                route(update)
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        address = (WEBHOOK.get("listen", "0.0.0.0"), int(WEBHOOK.get("port", 8080)))
+        server = ThreadingHTTPServer(address, Handler)
+        server.daemon_threads = True
+        apihelper.set_webhook(TOKEN, url=WEBHOOK["url"], secret_token=secret)
+        log.info("Вебхук слушает %s:%s%s", address[0], address[1], path)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    def stop(self):
+        """Рабочие процессы дообрабатывают свои очереди и завершаются."""
+        self._stopping = True
+        for q in self.queues:
+            q.put(None)
+        for proc in self.procs:
+            proc.join(timeout=STOP_TIMEOUT)
+            if proc.is_alive():
+                log.warning("Рабочий процесс %s не остановился, завершаем принудительно", proc.name)
+                proc.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Запуск бота в несколько рабочих процессов")
+    parser.add_argument("--webhook", action="store_true", help="принимать обновления через вебхук")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="число рабочих процессов")
+    args = parser.parse_args()
+    logs.setup()
+    if API_URL:
+        apihelper.API_URL = API_URL
+    address = metrics.start()
+    if address:
+        log.info("Метрики приёмника: http://%s:%s/metrics", *address)
+    ingress = Ingress(max(1, args.workers))
+    ingress.start()
+    log.info("Бот запущен, рабочих процессов: %s", ingress.count)
+    try:
+        if args.webhook:
+            ingress.serve_webhook()
+        else:
+            ingress.poll()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ingress.stop()
+
+
+if __name__ == "__main__":
+    main()
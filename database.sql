@@ -1,10 +1,18 @@
 -- Сброс схемы (при необходимости)
+DROP TABLE IF EXISTS gym.schema_migrations CASCADE;
+DROP TABLE IF EXISTS gym.digest_optout CASCADE;
+DROP TABLE IF EXISTS gym.digest_items CASCADE;
+DROP TABLE IF EXISTS gym.digest_runs CASCADE;
+DROP TABLE IF EXISTS gym.sessions CASCADE;
+DROP TABLE IF EXISTS gym.training_days CASCADE;
+DROP TABLE IF EXISTS gym.exercise_daily CASCADE;
 DROP TABLE IF EXISTS gym.supersets CASCADE;
 DROP TABLE IF EXISTS gym.workout_stats CASCADE;
 DROP TABLE IF EXISTS gym.exercises CASCADE;
 DROP TABLE IF EXISTS gym.muscle_groups CASCADE;
 DROP TABLE IF EXISTS gym.weights CASCADE;
 DROP TABLE IF EXISTS gym.repetitions CASCADE;
+DROP FUNCTION IF EXISTS gym.create_month_partitions(TEXT, DATE, DATE);
 
 -- =============================
 -- 1. Таблица: muscle_groups
@@ -24,6 +32,11 @@ CREATE TABLE gym.exercises (
     UNIQUE (muscle_group_id, name)
 );
 
+-- Поиск упражнений по названию (search.py): сходство и поиск по началу
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX idx_exercises_name_trgm ON gym.exercises
+    USING gin (replace(lower(name), 'ё', 'е') gin_trgm_ops);
+
 -- =============================
 -- 3. Таблица: weights (справочник весов)
 -- =============================
@@ -53,27 +66,69 @@ INSERT INTO gym.repetitions (reps_count) VALUES
 
 
 -- =============================
--- 5. Таблица: workout_stats (ссылка на exercises)
+-- 5. Таблица: workout_stats (ссылка на exercises), секции по месяцам
 -- =============================
+-- Секции на будущие месяцы создаёт бот при запуске (migrate.ensure_partitions),
+-- строки вне созданных секций попадают в DEFAULT.
+CREATE OR REPLACE FUNCTION gym.create_month_partitions(parent TEXT, from_month DATE, to_month DATE)
+RETURNS INT AS $$
+DECLARE
+    m DATE := date_trunc('month', from_month)::date;
+    part TEXT;
+    created INT := 0;
+BEGIN
+    WHILE m <= to_month LOOP
+        part := format('%s_%s', parent, to_char(m, 'YYYYMM'));
+        IF to_regclass(format('gym.%I', part)) IS NULL THEN
+            BEGIN
+                EXECUTE format(
+                    'CREATE TABLE gym.%I PARTITION OF gym.%I FOR VALUES FROM (%L) TO (%L)',
+                    part, parent, m, (m + interval '1 month')::date
+                );
+                created := created + 1;
+            EXCEPTION WHEN check_violation THEN
+                RAISE WARNING 'Секция % не создана: в DEFAULT есть строки за этот месяц', part;
+            END;
+        END IF;
+        m := (m + interval '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
 CREATE TABLE gym.workout_stats (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     chat_id BIGINT NOT NULL,
     date DATE NOT NULL,
     exercise_id INT REFERENCES gym.exercises(id) ON UPDATE CASCADE ON DELETE SET NULL,
     set_number SMALLINT NOT NULL CHECK (set_number > 0),
     weight_kg NUMERIC(6,2),
     reps_count SMALLINT CHECK (reps_count > 0),
-    created_at TIMESTAMPTZ DEFAULT NOW()
-);
+    message_id BIGINT,
+    flow_id BIGINT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
+
+SELECT gym.create_month_partitions('workout_stats', '2025-01-01', (CURRENT_DATE + interval '3 months')::date);
+CREATE TABLE gym.workout_stats_default PARTITION OF gym.workout_stats DEFAULT;
 
-CREATE INDEX idx_workout_stats_chat_date ON gym.workout_stats (chat_id, date);
+-- Сводка за день читает только индекс: ключ (chat_id, date), остальное в INCLUDE
+CREATE INDEX idx_workout_stats_chat_date ON gym.workout_stats (chat_id, date)
+    INCLUDE (created_at, exercise_id, set_number, weight_kg, reps_count);
 CREATE INDEX idx_workout_stats_exercise ON gym.workout_stats (exercise_id);
+CREATE INDEX brin_workout_stats_created_at ON gym.workout_stats USING brin (created_at);
+-- Повторное нажатие кнопки не создаёт второй подход (строки без message_id не ограничиваются)
+CREATE UNIQUE INDEX uq_workout_stats_update ON gym.workout_stats (chat_id, message_id, flow_id, set_number, date);
+-- Дочитывание истории упражнения для аналитики: новые строки после id
+CREATE INDEX idx_workout_stats_chat_exercise ON gym.workout_stats (chat_id, exercise_id, id)
+    INCLUDE (date, created_at, weight_kg, reps_count);
 
 -- =============================
--- 6. Таблица: supersets (ссылки на exercises)
+-- 6. Таблица: supersets (ссылки на exercises), секции по месяцам
 -- =============================
 CREATE TABLE gym.supersets (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     chat_id BIGINT NOT NULL,
     date DATE NOT NULL,
     first_exercise_id INT REFERENCES gym.exercises(id) ON UPDATE CASCADE ON DELETE SET NULL,
@@ -83,11 +138,109 @@ CREATE TABLE gym.supersets (
     first_reps_count SMALLINT CHECK (first_reps_count > 0),
     second_weight_kg NUMERIC(6,2),
     second_reps_count SMALLINT CHECK (second_reps_count > 0),
-    created_at TIMESTAMPTZ DEFAULT NOW()
-);
+    message_id BIGINT,
+    flow_id BIGINT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
+
+SELECT gym.create_month_partitions('supersets', '2025-01-01', (CURRENT_DATE + interval '3 months')::date);
+CREATE TABLE gym.supersets_default PARTITION OF gym.supersets DEFAULT;
 
-CREATE INDEX idx_supersets_chat_date ON gym.supersets (chat_id, date);
+CREATE INDEX idx_supersets_chat_date ON gym.supersets (chat_id, date)
+    INCLUDE (created_at, first_exercise_id, second_exercise_id, set_number,
+             first_weight_kg, first_reps_count, second_weight_kg, second_reps_count);
 CREATE INDEX idx_supersets_first_second ON gym.supersets (first_exercise_id, second_exercise_id);
+CREATE INDEX brin_supersets_created_at ON gym.supersets USING brin (created_at);
+CREATE UNIQUE INDEX uq_supersets_update ON gym.supersets (chat_id, message_id, flow_id, set_number, date);
+CREATE INDEX idx_supersets_chat_first ON gym.supersets (chat_id, first_exercise_id, id)
+    INCLUDE (date, created_at, first_weight_kg, first_reps_count);
+CREATE INDEX idx_supersets_chat_second ON gym.supersets (chat_id, second_exercise_id, id)
+    INCLUDE (date, created_at, second_weight_kg, second_reps_count);
+
+-- =============================
+-- 6a. Таблица: training_days (индекс тренировочных дней для календаря)
+-- =============================
+-- days - битовая маска: бит 0 соответствует 1-му числу месяца
+CREATE TABLE gym.training_days (
+    chat_id BIGINT NOT NULL,
+    month DATE NOT NULL,
+    days INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id, month)
+);
+
+-- =============================
+-- 6b. Таблица: exercise_daily (итоги по упражнению за день для статистики)
+-- =============================
+CREATE TABLE gym.exercise_daily (
+    chat_id BIGINT NOT NULL,
+    exercise_id INT NOT NULL REFERENCES gym.exercises(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    date DATE NOT NULL,
+    sets INT NOT NULL,
+    reps_sum INT NOT NULL,
+    weight_sum NUMERIC(12,2) NOT NULL,
+    max_weight NUMERIC(6,2),
+    volume NUMERIC(14,2) NOT NULL,
+    PRIMARY KEY (chat_id, exercise_id, date)
+);
+
+-- =============================
+-- 6c. Таблица: sessions (состояния чатов, SESSIONS['backend'] = 'postgres')
+-- =============================
+CREATE TABLE gym.sessions (
+    chat_id BIGINT PRIMARY KEY,
+    data JSONB NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- =============================
+-- 6d. Таблицы: digest_runs, digest_items и digest_optout (еженедельная сводка, digest.py)
+-- =============================
+-- last_chat_id NULL - рассылка с начала (id групп в Telegram отрицательные)
+CREATE TABLE gym.digest_runs (
+    week DATE PRIMARY KEY,
+    last_chat_id BIGINT,
+    chats INT NOT NULL DEFAULT 0,
+    total INT,
+    owner TEXT,
+    heartbeat_at TIMESTAMPTZ,
+    started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+
+CREATE TABLE gym.digest_items (
+    week DATE NOT NULL,
+    chat_id BIGINT NOT NULL,
+    sessions INT NOT NULL,
+    sets INT NOT NULL,
+    tonnage NUMERIC(14,2) NOT NULL,
+    records INT NOT NULL,
+    top_group_id INT,
+    PRIMARY KEY (week, chat_id)
+);
+
+CREATE TABLE gym.digest_optout (
+    chat_id BIGINT PRIMARY KEY,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- =============================
+-- 6e. Таблица: schema_migrations (применённые миграции из migrations/)
+-- =============================
+-- Этот файл уже содержит схему после всех перечисленных миграций. Новую
+-- миграцию добавляйте в migrations/ и отражайте здесь вместе с её номером.
+CREATE TABLE gym.schema_migrations (
+    version INT PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO gym.schema_migrations (version, name) VALUES
+(1, 'baseline'),
+(2, 'partition_workout_tables'),
+(3, 'exercise_history_indexes'),
+(4, 'exercise_search'),
+(5, 'weekly_digest');
 
 -- =============================
 -- 7. Примерные данные: группы и упражнения
@@ -220,4 +373,33 @@ SELECT 5873737, '2025-10-16', ex1.id, ex2.id, 1, 15.0, 10, NULL, 20
 FROM gym.exercises ex1 JOIN gym.muscle_groups g1 ON g1.id = ex1.muscle_group_id,
      gym.exercises ex2 JOIN gym.muscle_groups g2 ON g2.id = ex2.muscle_group_id
 WHERE g1.name = 'Спина' AND ex1.name = 'Тяга верхнего блока'
-  AND g2.name = 'Грудь' AND ex2.name = 'Отжимания на брусьях';
\ No newline at end of file
+  AND g2.name = 'Грудь' AND ex2.name = 'Отжимания на брусьях';
+
+-- =============================
+-- 10. Индекс тренировочных дней для примеров
+-- =============================
+INSERT INTO gym.training_days (chat_id, month, days)
+SELECT chat_id, date_trunc('month', date)::date, bit_or(1 << (extract(day FROM date)::int - 1))
+FROM (
+    SELECT chat_id, date FROM gym.workout_stats
+    UNION
+    SELECT chat_id, date FROM gym.supersets
+) t
+GROUP BY 1, 2;
+
+-- =============================
+-- 11. Итоги по упражнениям для примеров
+-- =============================
+INSERT INTO gym.exercise_daily (chat_id, exercise_id, date, sets, reps_sum, weight_sum, max_weight, volume)
+SELECT chat_id, exercise_id, date, count(*),
+       sum(coalesce(reps, 0)), sum(coalesce(weight, 0)), max(weight),
+       sum(coalesce(reps, 0) * coalesce(weight, 0))
+FROM (
+    SELECT chat_id, date, exercise_id, reps_count AS reps, weight_kg AS weight FROM gym.workout_stats
+    UNION ALL
+    SELECT chat_id, date, first_exercise_id, first_reps_count, first_weight_kg FROM gym.supersets
+    UNION ALL
+    SELECT chat_id, date, second_exercise_id, second_reps_count, second_weight_kg FROM gym.supersets
+) t
+WHERE exercise_id IS NOT NULL
+GROUP BY chat_id, exercise_id, date;
@@ -0,0 +1,195 @@
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import pool as pg_pool
+
+import metrics
+from config import DB_CONFIG
+
+# ================================
+# ПУЛ СОЕДИНЕНИЙ
+# ================================
+# Настройки пула читаются из DB_CONFIG и не передаются в psycopg2.connect:
+#   pool_min / pool_max              - границы пула (по умолчанию 1 и 10)
+#   async_pool_min / async_pool_max  - то же для асинхронного пула (adb.py)
+#   health_check_interval            - через сколько секунд простоя соединение
+#                                      проверяется запросом SELECT 1 перед выдачей
+
+POOL_KEYS = ("pool_min", "pool_max", "async_pool_min", "async_pool_max", "health_check_interval")
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+_last_used = {}
+_health_check_interval = 30.0
+
+log = logging.getLogger(__name__)
+
+_STATEMENT_RE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+([\w.]+)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def _label(head):
+    words = head.split(None, 2)
+    if not words:
+        return "?"
+    match = _STATEMENT_RE.search(head)
+    target = match.group(1) if match else (words[1] if len(words) > 1 else "")
+    return f"{words[0].upper()} {target.split('(')[0].rstrip(';')}".strip()
+
+
+def statement_label(query):
+    """Короткое имя запроса для метрик: команда и первая таблица."""
+    if isinstance(query, bytes):
+        # execute_values передаёт уже собранный запрос со значениями
+        query = query[:200].decode("utf-8", "ignore")
+    return _label(query[:200])
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """Курсор, который пишет время и ошибки каждого запроса в метрики."""
+
+    def execute(self, query, vars=None):
+        label = statement_label(query)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        except psycopg2.Error:
+            metrics.DB_ERRORS.inc(label)
+            raise
+        finally:
+            metrics.DB_QUERY_SECONDS.observe(time.perf_counter() - started, label)
+
+
+def _connect_params():
+    params = {k: v for k, v in DB_CONFIG.items() if k not in POOL_KEYS}
+    # TCP keepalive, чтобы оборванное соединение обнаруживалось, а не висело
+    params.setdefault("keepalives", 1)
+    params.setdefault("keepalives_idle", 30)
+    params.setdefault("keepalives_interval", 10)
+    params.setdefault("keepalives_count", 3)
+    params.setdefault("cursor_factory", TimedCursor)
+    return params
+
+
+def get_pool():
+    """Создаёт пул при первом обращении."""
+    global _pool, _slots, _health_check_interval
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                minconn = int(DB_CONFIG.get("pool_min", 1))
+                maxconn = int(DB_CONFIG.get("pool_max", 10))
+                _health_check_interval = float(DB_CONFIG.get("health_check_interval", 30))
+                _slots = threading.BoundedSemaphore(maxconn)
+                _pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, **_connect_params())
+    return _pool
+
+
+def _is_alive(conn):
+    if conn.closed:
+        return False
+    idle = time.monotonic() - _last_used.get(id(conn), 0.0)
+    if idle < _health_check_interval:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout():
+    pool = get_pool()
+    # Семафор ждёт свободное соединение вместо PoolError при исчерпании пула
+    _slots.acquire()
+    try:
+        for _ in range(2):
+            conn = pool.getconn()
+            if _is_alive(conn):
+                return conn
+            log.warning("Соединение с БД потеряно, переподключение")
+            _discard(conn)
+        return pool.getconn()
+    except Exception:
+        _slots.release()
+        raise
+
+
+def _discard(conn):
+    _last_used.pop(id(conn), None)
+    try:
+        get_pool().putconn(conn, close=True)
+    except pg_pool.PoolError:
+        pass
+
+
+def _release(conn, broken=False):
+    try:
+        if broken or conn.closed:
+            _discard(conn)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+            get_pool().putconn(conn)
+    finally:
+        _slots.release()
+
+
+@contextmanager
+def transaction(name=None):
+    """Единица работы: своё соединение из пула, commit при успехе, rollback при ошибке.
+
+    С name курсор серверный: строки результата выбираются порциями по
+    cur.itersize, и большой результат не загружается в память целиком.
+    """
+    conn = _checkout()
+    broken = False
+    try:
+        with conn.cursor(name=name) as cur:
+            yield cur
+        conn.commit()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    except Exception:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+        raise
+    finally:
+        _release(conn, broken)
+
+
+def fetchall(query, params=None):
+    with transaction() as cur:
+        cur.execute(query, params)
+        return cur.fetchall()
+
+
+def fetchone(query, params=None):
+    with transaction() as cur:
+        cur.execute(query, params)
+        return cur.fetchone()
+
+
+def execute(query, params=None):
+    with transaction() as cur:
+        cur.execute(query, params)
+
+
+def close_all():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
@@ -0,0 +1,320 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from datetime import time as day_time
+
+import catalog
+import config
+import db
+import keyboards
+import metrics
+import outbox
+
+# ================================
+# ЕЖЕНЕДЕЛЬНАЯ СВОДКА
+# ================================
+# Раз в неделю каждый чат, в котором были подходы, получает итоги прошедшей
+# недели (понедельник - воскресенье): тренировки, подходы, тоннаж, рекорды
+# веса и группу мышц, на которую пришлось больше всего подходов. Итоги всех
+# чатов считает один сгруппированный запрос по gym.workout_stats и
+# gym.supersets за неделю (секции за другие месяцы не читаются), а не тысячи
+# запросов экранов статистики. Он сразу складывает итоги в gym.digest_items,
+# и рассылка читает их оттуда короткими запросами по chunk чатов в порядке
+# chat_id: ни одна транзакция не остаётся открытой на время рассылки.
+# Сообщения уходят с лимитом rate в секунду - ниже общего лимита бота, чтобы
+# ответы на нажатия не ждали рассылку. Очередь исходящих (outbox.py) сводка
+# обходит: отправка ждёт ответа Telegram, поэтому заблокировавшие бота
+# чаты (403) учитываются, а 429 повторяется здесь же. С очередью rate
+# вместе с её global_rate не должен превышать лимит Telegram (30 в секунду).
+# Включается в config.py:
+#
+#   DIGEST = {
+#       'enabled': True,
+#       'weekday': 0,         # день отправки: 0 - понедельник
+#       'hour': 10,           # час отправки (время сервера)
+#       'catch_up_hours': 24, # сколько ещё отправлять опоздавшую сводку
+#       'rate': 10,           # сообщений в секунду
+#       'chunk': 500,         # чатов в одной порции рассылки
+#   }
+#
+# Рассылку за неделю ведёт один процесс: строка недели в gym.digest_runs
+# выдаётся процессу в аренду на LEASE секунд и продлевается с каждой
+# порцией, а аренду упавшего процесса забирает другой. Последний
+# обработанный chat_id записывается до отправки порции, поэтому после
+# перезапуска рассылка продолжается с места остановки и ни один чат не
+# получит сводку дважды. last_chat_id NULL - рассылка ещё не начата (id групп
+# в Telegram отрицательные, поэтому 0 началом служить не может). Команда
+# /digest отключает и снова включает сводку для чата (gym.digest_optout).
+
+SETTINGS = getattr(config, "DIGEST", {})
+ENABLED = bool(SETTINGS.get("enabled", False))
+WEEKDAY = int(SETTINGS.get("weekday", 0))
+HOUR = int(SETTINGS.get("hour", 10))
+CATCH_UP = timedelta(hours=float(SETTINGS.get("catch_up_hours", 24)))
+RATE = float(SETTINGS.get("rate", 10))
+CHUNK = int(SETTINGS.get("chunk", 500))
+
+CHECK_INTERVAL = 300
+# Аренда рассылки: с запасом больше времени отправки одной порции
+LEASE = max(600, int(3 * CHUNK / RATE))
+
+# Подход суперсета считается за два: по одному на каждое упражнение, как в
+# gym.exercise_daily. Рекорд веса - упражнение, лучший вес которого за
+# неделю выше, чем во всех прошлых тренировках (по gym.exercise_daily);
+# первое выполнение упражнения рекордом не считается.
+PREPARE_SQL = """
+    INSERT INTO gym.digest_items (week, chat_id, sessions, sets, tonnage, records, top_group_id)
+    WITH week_sets AS (
+        SELECT chat_id, date, exercise_id, weight_kg AS weight, reps_count AS reps
+        FROM gym.workout_stats
+        WHERE date >= %(start)s AND date < %(end)s
+        UNION ALL
+        SELECT chat_id, date, first_exercise_id, first_weight_kg, first_reps_count
+        FROM gym.supersets
+        WHERE date >= %(start)s AND date < %(end)s
+        UNION ALL
+        SELECT chat_id, date, second_exercise_id, second_weight_kg, second_reps_count
+        FROM gym.supersets
+        WHERE date >= %(start)s AND date < %(end)s
+    ),
+    records AS (
+        SELECT w.chat_id, count(*) AS records
+        FROM (
+            SELECT chat_id, exercise_id, max(weight) AS best
+            FROM week_sets
+            WHERE exercise_id IS NOT NULL
+            GROUP BY chat_id, exercise_id
+        ) w
+        CROSS JOIN LATERAL (
+            SELECT max(d.max_weight) AS best
+            FROM gym.exercise_daily d
+            WHERE d.chat_id = w.chat_id AND d.exercise_id = w.exercise_id AND d.date < %(start)s
+        ) before
+        WHERE w.best > before.best
+        GROUP BY w.chat_id
+    )
+    SELECT %(start)s::date,
+           s.chat_id,
+           count(DISTINCT s.date),
+           count(*),
+           coalesce(sum(s.weight * s.reps), 0),
+           coalesce(max(r.records), 0),
+           mode() WITHIN GROUP (ORDER BY e.muscle_group_id)
+    FROM week_sets s
+    LEFT JOIN gym.exercises e ON e.id = s.exercise_id
+    LEFT JOIN records r ON r.chat_id = s.chat_id
+    WHERE NOT EXISTS (SELECT 1 FROM gym.digest_optout o WHERE o.chat_id = s.chat_id)
+    GROUP BY s.chat_id
+    ON CONFLICT (week, chat_id) DO NOTHING;
+"""
+
+# Строку получает процесс, если она свободна, уже его или аренда истекла
+CLAIM_SQL = """
+    UPDATE gym.digest_runs SET owner = %(owner)s, heartbeat_at = NOW()
+    WHERE week = %(week)s AND finished_at IS NULL
+      AND (owner IS NULL OR owner = %(owner)s OR heartbeat_at < NOW() - %(lease)s * interval '1 second')
+    RETURNING last_chat_id, total;
+"""
+
+CHUNK_SQL = """
+    SELECT chat_id, sessions, sets, tonnage, records, top_group_id
+    FROM gym.digest_items
+    WHERE week = %(week)s AND (%(after)s::bigint IS NULL OR chat_id > %(after)s)
+    ORDER BY chat_id
+    LIMIT %(limit)s;
+"""
+
+# Продлевает аренду; 0 строк - аренду забрал другой процесс
+PROGRESS_SQL = """
+    UPDATE gym.digest_runs SET last_chat_id = %(last)s, chats = chats + %(count)s, heartbeat_at = NOW()
+    WHERE week = %(week)s AND owner = %(owner)s;
+"""
+
+MESSAGES = metrics.Counter("gym_digest_messages_total", "Сообщения еженедельной сводки", ("result",))
+
+_stop = threading.Event()
+_thread = None
+_done_week = None  # неделя, рассылка за которую уже закончена
+
+log = logging.getLogger(__name__)
+
+
+def due_week(now):
+    """Понедельник недели, сводку за которую пора отправлять, или None."""
+    monday = now.date() - timedelta(days=now.weekday())
+    send_at = datetime.combine(monday + timedelta(days=WEEKDAY), day_time(HOUR))
+    if send_at <= now < send_at + CATCH_UP:
+        return monday - timedelta(days=7)
+    return None
+
+
+def render(week, sessions, sets, tonnage, records, group_id):
+    end = week + timedelta(days=6)
+    lines = [
+        f"📅 Итоги недели {week:%d.%m}–{end:%d.%m.%Y}:",
+        f"Тренировок: {sessions}",
+        f"Подходов: {sets}",
+    ]
+    if tonnage:
+        lines.append(f"Тоннаж: {keyboards.format_weight(float(tonnage))} кг")
+    if records:
+        lines.append(f"🏆 Рекордов веса: {records}")
+    if group_id is not None:
+        lines.append(f"Больше всего подходов: {catalog.group_name(group_id)}")
+    lines.append("\nОтключить сводку: /digest")
+    return "\n".join(lines)
+
+
+def toggle(chat_id):
+    """Отключает сводку для чата или включает обратно; возвращает, включена ли она."""
+    with db.transaction() as cur:
+        cur.execute("DELETE FROM gym.digest_optout WHERE chat_id = %s;", (chat_id,))
+        if cur.rowcount:
+            return True
+        cur.execute("INSERT INTO gym.digest_optout (chat_id) VALUES (%s) ON CONFLICT DO NOTHING;", (chat_id,))
+        return False
+
+
+def _deliver(send, chat_id, text):
+    for attempt in range(2):
+        try:
+            result = send(chat_id, text)
+            # В asyncio-режиме отправка идёт в цикле событий
+            if isinstance(result, Future):
+                result.result()
+            MESSAGES.inc("sent")
+            return
+        except Exception as e:
+            code = getattr(e, "error_code", None)
+            if code == 429 and not attempt:
+                params = (getattr(e, "result_json", None) or {}).get("parameters") or {}
+                _stop.wait(float(params.get("retry_after", 1)))
+                continue
+            # 403 - пользователь остановил бота
+            MESSAGES.inc("blocked" if code == 403 else "failed")
+            log.debug("Сводка не отправлена chat=%s: %s", chat_id, e)
+            return
+
+
+def _claim(week, owner):
+    """Берёт рассылку за неделю; (last_chat_id, всего чатов) или None."""
+    with db.transaction() as cur:
+        cur.execute("INSERT INTO gym.digest_runs (week) VALUES (%s) ON CONFLICT (week) DO NOTHING;", (week,))
+        cur.execute(CLAIM_SQL, {"week": week, "owner": owner, "lease": LEASE})
+        return cur.fetchone()
+
+
+def _prepare(week, owner):
+    """Один проход по подходам недели: итоги всех чатов в gym.digest_items."""
+    with db.transaction() as cur:
+        cur.execute(PREPARE_SQL, {"start": week, "end": week + timedelta(days=7)})
+        total = cur.rowcount
+        cur.execute(
+            "UPDATE gym.digest_runs SET total = %s WHERE week = %s AND owner = %s;",
+            (total, week, owner),
+        )
+        if not cur.rowcount:
+            raise RuntimeError("аренда рассылки потеряна")
+    return total
+
+
+def _release(week, owner):
+    """Отдаёт аренду при остановке: после перезапуска рассылка продолжится сразу."""
+    db.execute("UPDATE gym.digest_runs SET owner = NULL WHERE week = %s AND owner = %s;", (week, owner))
+
+
+def _progress(week, owner, last, count):
+    with db.transaction() as cur:
+        cur.execute(PROGRESS_SQL, {"week": week, "owner": owner, "last": last, "count": count})
+        return cur.rowcount > 0
+
+
+def run(week, send):
+    """Рассылает сводку за неделю с понедельника week.
+
+    Возвращает число обработанных этим вызовом чатов или None, если
+    рассылку сейчас ведёт другой процесс (или она уже закончена).
+    """
+    owner = uuid.uuid4().hex
+    claimed = _claim(week, owner)
+    if claimed is None:
+        return None
+    after, total = claimed
+    started = time.monotonic()
+    if total is None:
+        total = _prepare(week, owner)
+        log.info("Сводка за %s: чатов %s, итоги посчитаны за %.1f с", week, total, time.monotonic() - started)
+    elif after is not None:
+        log.info("Сводка за %s: продолжение после chat=%s", week, after)
+    bucket = outbox.TokenBucket(RATE, 1)
+    done = 0
+    while not _stop.is_set():
+        chunk = db.fetchall(CHUNK_SQL, {"week": week, "after": after, "limit": CHUNK})
+        if not chunk:
+            break
+        # Сначала отметка, потом отправка: после сбоя порция не повторится
+        if not _progress(week, owner, chunk[-1][0], len(chunk)):
+            log.warning("Сводка за %s: рассылку продолжает другой процесс", week)
+            return done
+        for n, (chat_id, *summary) in enumerate(chunk):
+            if _stop.wait(bucket.wait_time(time.monotonic())):
+                # Остановка посреди порции: оставшиеся чаты - следующему запуску
+                _progress(week, owner, chunk[n - 1][0] if n else after, n - len(chunk))
+                _release(week, owner)
+                log.info("Сводка за %s прервана остановкой бота, чатов: %s", week, done)
+                return done
+            bucket.take()
+            _deliver(send, chat_id, render(week, *summary))
+            done += 1
+        after = chunk[-1][0]
+    if _stop.is_set():
+        _release(week, owner)
+        return done
+    with db.transaction() as cur:
+        cur.execute(
+            "UPDATE gym.digest_runs SET finished_at = NOW(), owner = NULL WHERE week = %s AND owner = %s;",
+            (week, owner),
+        )
+        cur.execute("DELETE FROM gym.digest_items WHERE week = %s;", (week,))
+    log.info("Сводка за %s разослана: чатов %s за %.0f с", week, done, time.monotonic() - started)
+    return done
+
+
+def _finished(week):
+    row = db.fetchone("SELECT finished_at FROM gym.digest_runs WHERE week = %s;", (week,))
+    return bool(row and row[0])
+
+
+def _run(send):
+    global _done_week
+    while not _stop.is_set():
+        week = due_week(datetime.now())
+        if week is not None and week != _done_week:
+            try:
+                result = run(week, send)
+                if not _stop.is_set() and (result is not None or _finished(week)):
+                    _done_week = week
+            except Exception as e:
+                log.error("Ошибка рассылки сводки за %s: %s", week, e)
+        _stop.wait(CHECK_INTERVAL)
+
+
+def start(send):
+    """Запускает планировщик; send(chat_id, text) отправляет сообщение."""
+    global _thread
+    if not ENABLED or _thread is not None:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, args=(send,), name="digest", daemon=True)
+    _thread.start()
+
+
+def stop():
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=10)
+        _thread = None
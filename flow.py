@@ -0,0 +1,144 @@
+import base64
+import hashlib
+import hmac
+import time
+
+import config
+from config import TOKEN
+
+# ================================
+# КОНТЕКСТ СЦЕНАРИЯ В CALLBACK_DATA
+# ================================
+# Всё, что нужно обработчикам одиночного подхода и суперсета (группа,
+# упражнение, номер подхода, уже выбранные повторения и вес), передаётся в
+# самой кнопке, а не хранится в памяти процесса: кнопку можно нажать после
+# перезапуска бота или в другом рабочем процессе. Поля упакованы varint'ами,
+# подписаны HMAC (ключ выводится из токена бота или задаётся FLOW_SECRET в
+# config.py) и закодированы base64url:
+#
+#   callback_data = "действие:значение:токен"   # не длиннее 64 байт
+#
+# Клавиатуры кэшируются с заполнителем keyboards.FLOW на месте токена, а
+# токен подставляется заменой строки.
+#
+# Бюджет токена - 36 байт: 6 байт подписи и до 30 байт полей. flow_id -
+# секунды от EPOCH (4 байта до 2033 года), поэтому суперсет помещается с
+# любыми допустимыми в схеме повторениями, весом и номером подхода при id
+# групп до 2^14 и упражнений до 2^21. Если контекст всё же не помещается,
+# encode бросает TooLong, а бот завершает сценарий главным меню.
+
+SINGLE = 1
+SUPERSET = 2
+
+FIELDS = {
+    SINGLE: ("flow_id", "set_number", "muscle_group_id", "exercise_id", "reps", "weight"),
+    SUPERSET: (
+        "flow_id", "set_number",
+        "s1_muscle_group_id", "s1_exercise_id", "s1_reps", "s1_weight",
+        "s2_muscle_group_id", "s2_exercise_id", "s2_reps", "s2_weight",
+    ),
+}
+# Вес хранится в сотых долях килограмма
+WEIGHT_FIELDS = frozenset(("weight", "s1_weight", "s2_weight"))
+
+MAC_SIZE = 6
+# 64 байта минус самый длинный префикс "действие:значение:" ("add_weight:12.5:")
+MAX_TOKEN = 48
+# Начало отсчёта flow_id: 2025-01-01 UTC
+EPOCH = 1735689600
+
+SECRET = getattr(config, "FLOW_SECRET", None) or hashlib.sha256(b"gym-flow:" + TOKEN.encode()).hexdigest()
+_key = SECRET.encode() if isinstance(SECRET, str) else SECRET
+
+
+class TooLong(ValueError):
+    """Контекст не помещается в callback_data."""
+
+
+def new_id():
+    """Номер сеанса ввода: секунды от EPOCH.
+
+    Новый сеанс в том же сообщении начинается не раньше чем через несколько
+    нажатий после предыдущего, поэтому секунд достаточно для различения.
+    """
+    return int(time.time()) - EPOCH
+
+
+class Flow(dict):
+    """Контекст сценария: поля из FIELDS[kind]; не выбранные - None."""
+
+    def __init__(self, kind, **fields):
+        super().__init__({name: fields.get(name) for name in FIELDS[kind]})
+        self.kind = kind
+
+    def replace(self, **changes):
+        return Flow(self.kind, **{**self, **changes})
+
+
+def _pack(values):
+    out = bytearray()
+    for v in values:
+        while v >= 0x80:
+            out.append(v & 0x7F | 0x80)
+            v >>= 7
+        out.append(v)
+    return bytes(out)
+
+
+def _unpack(data):
+    values, v, shift = [], 0, 0
+    for b in data:
+        v |= (b & 0x7F) << shift
+        if b & 0x80:
+            shift += 7
+        else:
+            values.append(v)
+            v = shift = 0
+    if shift:
+        raise ValueError("Обрезанный контекст")
+    return values
+
+
+def _to_int(name, value):
+    if value is None:
+        return 0
+    if name in WEIGHT_FIELDS:
+        return round(float(value) * 100) + 1
+    return int(value)
+
+
+def _from_int(name, value):
+    if value == 0:
+        return None
+    if name in WEIGHT_FIELDS:
+        return (value - 1) / 100
+    return value
+
+
+def _mac(payload):
+    return hmac.new(_key, payload, hashlib.sha256).digest()[:MAC_SIZE]
+
+
+def encode(ctx):
+    payload = _pack([ctx.kind] + [_to_int(name, ctx[name]) for name in FIELDS[ctx.kind]])
+    token = base64.urlsafe_b64encode(payload + _mac(payload)).rstrip(b"=").decode("ascii")
+    if len(token) > MAX_TOKEN:
+        raise TooLong(f"Контекст не помещается в callback_data: {len(token)} символов")
+    return token
+
+
+def decode(token):
+    """Разбирает и проверяет токен. ValueError - если он повреждён или подделан.
+
+    Подходит как тип аргумента router.route: некорректный токен отсеивается
+    так же, как любой некорректный callback.
+    """
+    data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    payload, mac = data[:-MAC_SIZE], data[-MAC_SIZE:]
+    if not payload or not hmac.compare_digest(mac, _mac(payload)):
+        raise ValueError("Неверная подпись контекста")
+    kind, *values = _unpack(payload)
+    names = FIELDS.get(kind)
+    if names is None or len(values) != len(names):
+        raise ValueError("Неизвестный формат контекста")
+    return Flow(kind, **{name: _from_int(name, v) for name, v in zip(names, values)})
@@ -0,0 +1,77 @@
+import json
+import sqlite3
+import threading
+from collections import Counter
+from datetime import date
+
+# ================================
+# ЖУРНАЛ ЗАПИСИ ПОДХОДОВ
+# ================================
+# Локальный журнал в SQLite (WAL, synchronous=FULL): append возвращается,
+# только когда строки уже на диске, поэтому записанный подход переживает
+# и недоступность Postgres, и падение процесса. Очередь разбирает writer.py:
+# читает строки пачками по порядку, вставляет их в БД и удаляет из журнала.
+# Повтор пачки после сбоя между commit в Postgres и удалением из журнала
+# безопасен: INSERT пропускает уже записанные подходы (ON CONFLICT по
+# чату, сообщению, сеансу ввода и номеру подхода).
+
+SET = 0
+SUPERSET = 1
+
+
+def _dump(row):
+    # Дата подхода - второй столбец строки (см. writer.INSERT_*_SQL)
+    return json.dumps([row[0], row[1].isoformat(), *row[2:]])
+
+
+def _load(data):
+    row = json.loads(data)
+    row[1] = date.fromisoformat(row[1])
+    return tuple(row)
+
+
+class Journal:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=FULL;")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS journal ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, kind INTEGER NOT NULL, chat_id INTEGER NOT NULL, row TEXT NOT NULL);"
+        )
+        # Чаты с незаписанными строками: по ним статистика ждёт сброса журнала
+        self._chats = Counter(dict(self._conn.execute("SELECT chat_id, COUNT(*) FROM journal GROUP BY chat_id;")))
+
+    def append(self, sets=(), supersets=()):
+        rows = [(SET, row[0], _dump(row)) for row in sets] + [(SUPERSET, row[0], _dump(row)) for row in supersets]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("INSERT INTO journal (kind, chat_id, row) VALUES (?, ?, ?);", rows)
+            self._chats.update(chat_id for _, chat_id, _ in rows)
+
+    def read(self, limit):
+        """Самые старые строки: (последний seq, подходы, суперсеты); seq None - журнал пуст."""
+        with self._lock:
+            rows = self._conn.execute("SELECT seq, kind, row FROM journal ORDER BY seq LIMIT ?;", (limit,)).fetchall()
+        sets = [_load(data) for _, kind, data in rows if kind == SET]
+        supersets = [_load(data) for _, kind, data in rows if kind == SUPERSET]
+        return (rows[-1][0] if rows else None), sets, supersets
+
+    def remove(self, upto, chats):
+        """Удаляет прочитанные строки до seq включительно; chats - их chat_id."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM journal WHERE seq <= ?;", (upto,))
+            self._chats.subtract(chats)
+            self._chats += Counter()
+
+    def has_chat(self, chat_id):
+        return self._chats[chat_id] > 0
+
+    def __len__(self):
+        return sum(self._chats.values())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
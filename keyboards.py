@@ -0,0 +1,260 @@
+import calendar
+import threading
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+import catalog
+
+# ================================
+# КЛАВИАТУРЫ
+# ================================
+# Меню строятся один раз и хранятся уже сериализованными в JSON: telebot
+# передаёт строку reply_markup как есть. Меню из справочников привязаны к
+# catalog.version и пересобираются только после изменения справочников.
+# В меню сценариев тренировки (flow=True) на месте контекста сценария стоит
+# заполнитель FLOW, который заменяется токеном из flow.encode (with_flow).
+#
+# Группы и упражнения показываются страницами по PAGE_SIZE. Страница задаётся
+# не номером, а соседним элементом (catalog.page): anchor > 0 - страница после
+# элемента с этим id, anchor < 0 - перед элементом -anchor, 0 - первая.
+# Кнопки ◀️/▶️ несут callback "pager:anchor", pager передаёт вызывающий код.
+
+RU_MONTHS = {
+    1: "Январь", 2: "Февраль", 3: "Март", 4: "Апрель", 5: "Май", 6: "Июнь",
+    7: "Июль", 8: "Август", 9: "Сентябрь", 10: "Октябрь", 11: "Ноябрь", 12: "Декабрь"
+}
+WEEKDAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+FLOW = "$flow"
+PAGE_SIZE = 8
+
+_cache = {}
+_cache_version = None
+_lock = threading.Lock()
+
+
+def _flow_suffix(flow):
+    return f":{FLOW}" if flow else ""
+
+
+def with_flow(markup, token):
+    """Подставляет токен контекста сценария в JSON клавиатуры."""
+    return markup.replace(FLOW, token)
+
+
+def build_keyboard(items, callback_prefix, back_callback=None, suffix="", nav_buttons=None):
+    kb = InlineKeyboardMarkup()
+    for item_id, name in items:
+        kb.add(InlineKeyboardButton(name, callback_data=f"{callback_prefix}:{item_id}{suffix}"))
+    if nav_buttons:
+        kb.row(*nav_buttons)
+    if back_callback:
+        kb.add(InlineKeyboardButton("🔙 Назад", callback_data=back_callback))
+    return kb
+
+
+def build_grid_keyboard(labels, callback_prefix, back_callback=None, columns=3, extra_buttons=None, suffix=""):
+    kb = InlineKeyboardMarkup()
+    row = []
+    for label in labels:
+        row.append(InlineKeyboardButton(str(label), callback_data=f"{callback_prefix}:{label}{suffix}"))
+        if len(row) == columns:
+            kb.row(*row)
+            row = []
+    if row:
+        kb.row(*row)
+    if extra_buttons:
+        kb.row(*extra_buttons)
+    if back_callback:
+        kb.add(InlineKeyboardButton("🔙 Назад", callback_data=back_callback))
+    return kb
+
+
+def cached(kind, key, build):
+    """Возвращает JSON клавиатуры из кэша, собирая её при первом обращении."""
+    global _cache_version
+    version = catalog.version
+    if _cache_version != version:
+        with _lock:
+            if _cache_version != version:
+                _cache.clear()
+                _cache_version = version
+    full_key = (kind, version) + key
+    markup = _cache.get(full_key)
+    if markup is None:
+        markup = build().to_json()
+        _cache[full_key] = markup
+    return markup
+
+
+@lru_cache(maxsize=None)
+def format_weight(w):
+    return f"{w:.2f}".rstrip('0').rstrip('.')
+
+
+# ================================
+# МЕНЮ ИЗ СПРАВОЧНИКОВ
+# ================================
+
+def _page(items, anchor, name_of, pager, suffix):
+    """Страница меню и кнопки перехода к соседним страницам."""
+    ref = (abs(anchor), name_of(abs(anchor))) if anchor else None
+    shown, has_prev, has_next = catalog.page(items, ref, anchor < 0, PAGE_SIZE)
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton("◀️", callback_data=f"{pager}:{-shown[0][0]}{suffix}"))
+    if has_next:
+        nav.append(InlineKeyboardButton("▶️", callback_data=f"{pager}:{shown[-1][0]}{suffix}"))
+    return shown, nav
+
+
+def groups_menu(prefix, back_callback, pager, with_add=True, flow=False, anchor=0):
+    def build():
+        suffix = _flow_suffix(flow)
+        items, nav = _page(catalog.get_muscle_groups(), anchor, catalog.group_name, pager, suffix)
+        kb = build_keyboard(items, prefix, back_callback, suffix=suffix, nav_buttons=nav)
+        if with_add:
+            kb.row(InlineKeyboardButton("➕", callback_data=f"add_group{suffix}"))
+        return kb
+    return cached("groups", (prefix, back_callback, pager, with_add, flow, anchor), build)
+
+
+def exercises_menu(group_id, prefix, back_callback, pager, with_add=True, flow=False, anchor=0):
+    def build():
+        suffix = _flow_suffix(flow)
+        items, nav = _page(catalog.get_exercises_by_group(group_id), anchor, catalog.exercise_name, pager, suffix)
+        kb = build_keyboard(items, prefix, back_callback, suffix=suffix, nav_buttons=nav)
+        if with_add:
+            kb.row(InlineKeyboardButton("➕", callback_data=f"add_exercise{suffix}"))
+        return kb
+    return cached("exercises", (group_id, prefix, back_callback, pager, with_add, flow, anchor), build)
+
+
+# Результаты поиска: кнопка ведёт сразу к подходу выбранного упражнения
+def search_results(items):
+    kb = InlineKeyboardMarkup()
+    for ex_id, group_id, name in items:
+        label = f"{name} · {catalog.group_name(group_id)}"
+        kb.add(InlineKeyboardButton(label, callback_data=f"found:{ex_id}:{FLOW}"))
+    kb.add(InlineKeyboardButton("🔙 Назад", callback_data="main_menu"))
+    return kb.to_json()
+
+
+# Кнопки меню повторений и веса всегда несут контекст сценария,
+# back_callback и no_weight_callback передаются уже с заполнителем FLOW
+def reps_menu(prefix, back_callback=None):
+    def build():
+        plus_btn = InlineKeyboardButton("➕", callback_data=f"add_reps_menu:{FLOW}")
+        return build_grid_keyboard(
+            catalog.get_all_reps(), prefix, back_callback=back_callback, columns=4,
+            extra_buttons=[plus_btn], suffix=_flow_suffix(True),
+        )
+    return cached("reps", (prefix, back_callback), build)
+
+
+def weights_menu(prefix, no_weight_callback, back_callback=None):
+    def build():
+        weights = [format_weight(w) for w in catalog.get_all_weights()]
+        plus_btn = InlineKeyboardButton("➕", callback_data=f"add_weight_menu:{FLOW}")
+        no_weight_btn = InlineKeyboardButton("⚪ Без веса", callback_data=no_weight_callback)
+        return build_grid_keyboard(
+            weights, prefix, back_callback=back_callback, columns=4,
+            extra_buttons=[plus_btn, no_weight_btn], suffix=_flow_suffix(True),
+        )
+    return cached("weights", (prefix, no_weight_callback, back_callback), build)
+
+
+# ================================
+# СТАТИЧЕСКИЕ МЕНЮ
+# ================================
+
+@lru_cache(maxsize=None)
+def main_menu():
+    kb = InlineKeyboardMarkup()
+    kb.add(InlineKeyboardButton("🏋️‍♂️ Одиночное упражнение", callback_data="single"))
+    kb.add(InlineKeyboardButton("🔥 Суперсет", callback_data="superset"))
+    kb.add(InlineKeyboardButton("📊 Статистика", callback_data="stats"))
+    kb.add(InlineKeyboardButton("🔍 Найти упражнение", switch_inline_query_current_chat=""))
+    return kb.to_json()
+
+
+@lru_cache(maxsize=None)
+def stats_menu():
+    kb = InlineKeyboardMarkup()
+    kb.add(
+        InlineKeyboardButton("📅 За день", callback_data="stats_day"),
+        InlineKeyboardButton("🏷 По упражнению", callback_data="stats_exercise"),
+    )
+    kb.add(InlineKeyboardButton("🔙 Назад", callback_data="main_menu"))
+    return kb.to_json()
+
+
+@lru_cache(maxsize=None)
+def next_or_finish(next_callback, next_text):
+    kb = InlineKeyboardMarkup()
+    kb.add(
+        InlineKeyboardButton(next_text, callback_data=next_callback),
+        InlineKeyboardButton("🏁 Закончить", callback_data="main_menu")
+    )
+    return kb.to_json()
+
+
+@lru_cache(maxsize=None)
+def back(callback):
+    kb = InlineKeyboardMarkup()
+    kb.add(InlineKeyboardButton("🔙 Назад", callback_data=callback))
+    return kb.to_json()
+
+
+@lru_cache(maxsize=None)
+def grid(labels, callback_prefix, columns=3, flow=False):
+    return build_grid_keyboard(
+        labels, callback_prefix, back_callback=None, columns=columns, suffix=_flow_suffix(flow)
+    ).to_json()
+
+
+STAT_WINDOW_BUTTONS = ((7, "7 дн"), (30, "30 дн"), (90, "90 дн"), (365, "Год"), (0, "Всё"))
+
+
+@lru_cache(maxsize=4096)
+def stats_windows(ex_id, current):
+    kb = InlineKeyboardMarkup()
+    kb.row(*[
+        InlineKeyboardButton(f"• {label}" if days == current else label, callback_data=f"stat_exw:{ex_id}:{days}")
+        for days, label in STAT_WINDOW_BUTTONS
+    ])
+    kb.add(InlineKeyboardButton("📈 Прогресс", callback_data=f"progress:{ex_id}"))
+    kb.add(InlineKeyboardButton("🔙 Назад", callback_data="stats_exercise"))
+    return kb.to_json()
+
+
+# ================================
+# КАЛЕНДАРЬ
+# ================================
+# Сетка месяца одинакова для всех пользователей, отличаются только ⭐,
+# поэтому ключ кэша - (год, месяц, набор тренировочных дней).
+
+@lru_cache(maxsize=4096)
+def calendar_menu(year, month, trained):
+    weeks = calendar.Calendar(firstweekday=0).monthdayscalendar(year, month)
+    kb = InlineKeyboardMarkup()
+    prev_month = (datetime(year, month, 15) - timedelta(days=31)).replace(day=1)
+    next_month = (datetime(year, month, 15) + timedelta(days=31)).replace(day=1)
+    kb.row(
+        InlineKeyboardButton("◀️", callback_data=f"cal:{prev_month.year}:{prev_month.month}"),
+        InlineKeyboardButton(f"{RU_MONTHS[month]} {year}", callback_data="noop"),
+        InlineKeyboardButton("▶️", callback_data=f"cal:{next_month.year}:{next_month.month}")
+    )
+    kb.row(*[InlineKeyboardButton(x, callback_data="noop") for x in WEEKDAYS])
+    for week in weeks:
+        row = []
+        for day in week:
+            if day == 0:
+                row.append(InlineKeyboardButton(" ", callback_data="noop"))
+            else:
+                label = f"{day}{'⭐' if day in trained else ''}"
+                row.append(InlineKeyboardButton(label, callback_data=f"day:{year}:{month}:{day}"))
+        kb.row(*row)
+    kb.add(InlineKeyboardButton("🔙 Назад", callback_data="stats"))
+    return kb.to_json()
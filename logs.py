@@ -0,0 +1,82 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+import config
+
+# ================================
+# ЛОГИРОВАНИЕ
+# ================================
+# Обработчики только кладут запись в очередь, а в stderr её пишет отдельный
+# поток, поэтому медленный вывод не задерживает ответы пользователям.
+# Пошаговые сообщения обработчиков идут на уровне DEBUG и при уровне INFO
+# отбрасываются без форматирования. Настройки в config.py:
+#
+#   LOGGING = {'level': 'INFO', 'format': 'text'}   # text | json
+
+SETTINGS = getattr(config, "LOGGING", {})
+
+# Атрибуты LogRecord, которые не считаются пользовательскими полями
+_STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+def _fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _STANDARD}
+
+
+class TextFormatter(logging.Formatter):
+    """time level logger: сообщение key=value ..."""
+
+    def format(self, record):
+        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.created))
+        line = f"{ts}.{int(record.msecs):03d} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        extra = _fields(record)
+        if extra:
+            line += " " + " ".join(f"{k}={v}" for k, v in extra.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        data.update(_fields(record))
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def setup():
+    """Направляет корневой логгер через очередь в фоновый поток вывода."""
+    global _listener
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if SETTINGS.get("format") == "json" else TextFormatter())
+    q = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(q)]
+    root.setLevel(SETTINGS.get("level", "INFO"))
+    _listener = logging.handlers.QueueListener(q, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop)
+
+
+def stop():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
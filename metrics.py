@@ -0,0 +1,159 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+# ================================
+# МЕТРИКИ
+# ================================
+# Счётчики и гистограммы собираются всегда (это несколько операций под
+# блокировкой), а HTTP-эндпоинт в текстовом формате Prometheus включается
+# в config.py:
+#
+#   METRICS = {'enabled': True, 'listen': '127.0.0.1', 'port': 9108}
+#
+#   curl http://127.0.0.1:9108/metrics
+
+SETTINGS = getattr(config, "METRICS", {})
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_server = None
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for values, total in items:
+            yield f"{self.name}{_labels(self.labels, values)} {total}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}  # значения меток -> [счётчики по корзинам..., сумма]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, seconds, *label_values):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            row = self._values.get(label_values)
+            if row is None:
+                row = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += seconds
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(values, row[:]) for values, row in self._values.items()]
+        for values, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), row):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(self.labels, values, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, values)} {row[-1]}"
+            yield f"{self.name}_count{_labels(self.labels, values)} {cumulative}"
+
+
+class Gauge:
+    """Значение снимается при каждом запросе /metrics вызовом func()."""
+
+    def __init__(self, name, help, func):
+        self.name = name
+        self.help = help
+        self.func = func
+        _registry.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.func()}"
+
+
+def gauge(name, help, func):
+    return Gauge(name, help, func)
+
+
+CALLBACK_SECONDS = Histogram("gym_callback_seconds", "Время обработки callback-запроса", ("action",))
+CALLBACK_ERRORS = Counter("gym_callback_errors_total", "Исключения в обработчиках callback", ("action",))
+DB_QUERY_SECONDS = Histogram("gym_db_query_seconds", "Время выполнения запроса к БД", ("statement",))
+DB_ERRORS = Counter("gym_db_errors_total", "Ошибки запросов к БД", ("statement",))
+TELEGRAM_SECONDS = Histogram("gym_telegram_request_seconds", "Время запроса к Telegram Bot API", ("method",))
+TELEGRAM_ERRORS = Counter("gym_telegram_errors_total", "Ошибки запросов к Telegram Bot API", ("method", "code"))
+
+
+def render():
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start():
+    """Поднимает HTTP-эндпоинт /metrics в фоновом потоке, если он включён."""
+    global _server
+    if not SETTINGS.get("enabled", False) or _server is not None:
+        return None
+    address = (SETTINGS.get("listen", "127.0.0.1"), int(SETTINGS.get("port", 9108)))
+    _server = ThreadingHTTPServer(address, _Handler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    return address
+
+
+def stop():
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
@@ -0,0 +1,140 @@
+import logging
+import os
+import re
+import threading
+import time
+
+import config
+import db
+
+# ================================
+# МИГРАЦИИ СХЕМЫ
+# ================================
+# Файлы migrations/NNNN_название.sql применяются по возрастанию номера,
+# каждый в своей транзакции; номера применённых хранятся в
+# gym.schema_migrations. Бот применяет недостающие миграции при запуске,
+# а несколько одновременно стартующих процессов не мешают друг другу:
+# на время применения миграций и создания секций берётся advisory lock. Настройки в config.py:
+#
+#   MIGRATIONS = {'on_startup': True, 'partitions_ahead': 3}
+#
+#   python cli.py migrate            # применить недостающие
+#   python cli.py migrate --status   # показать состояние
+
+SETTINGS = getattr(config, "MIGRATIONS", {})
+ON_STARTUP = bool(SETTINGS.get("on_startup", True))
+PARTITIONS_AHEAD = int(SETTINGS.get("partitions_ahead", 3))
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+PARTITIONED_TABLES = ("workout_stats", "supersets")
+# Ключ advisory lock: любое число, одинаковое для всех процессов бота
+LOCK_KEY = 7310042
+PARTITION_CHECK_INTERVAL = 24 * 3600
+
+CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS gym.schema_migrations (
+        version INT PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+"""
+
+_FILE_RE = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+_maintainer = None
+
+log = logging.getLogger(__name__)
+
+
+def available():
+    """Список (номер, название, путь) из migrations/ по возрастанию номера."""
+    found = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = _FILE_RE.match(filename)
+        if match:
+            found.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    found.sort()
+    versions = [v for v, _, _ in found]
+    if len(versions) != len(set(versions)):
+        raise ValueError("В migrations/ повторяются номера миграций")
+    return found
+
+
+def applied():
+    with db.transaction() as cur:
+        # CREATE TABLE IF NOT EXISTS не защищён от одновременного запуска:
+        # второй процесс упал бы на уникальности имени типа в pg_type
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (LOCK_KEY,))
+        cur.execute(CREATE_TABLE_SQL)
+        cur.execute("SELECT version FROM gym.schema_migrations;")
+        return {row[0] for row in cur.fetchall()}
+
+
+def pending():
+    done = applied()
+    return [m for m in available() if m[0] not in done]
+
+
+def apply():
+    """Применяет недостающие миграции. Возвращает список применённых номеров."""
+    done = []
+    for version, name, path in pending():
+        with open(path, encoding="utf-8") as f:
+            sql = f.read()
+        with db.transaction() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s);", (LOCK_KEY,))
+            # Пока ждали блокировку, миграцию мог применить другой процесс
+            cur.execute("SELECT 1 FROM gym.schema_migrations WHERE version = %s;", (version,))
+            if cur.fetchone():
+                continue
+            log.info("Применяется миграция %04d_%s", version, name)
+            cur.execute(sql)
+            cur.execute(
+                "INSERT INTO gym.schema_migrations (version, name) VALUES (%s, %s);",
+                (version, name),
+            )
+        done.append(version)
+    return done
+
+
+def ensure_partitions(ahead=None):
+    """Создаёт секции таблиц подходов на текущий и ahead следующих месяцев."""
+    ahead = PARTITIONS_AHEAD if ahead is None else ahead
+    created = 0
+    with db.transaction() as cur:
+        # Процессы кластера проверяют секции одновременно: без блокировки оба
+        # увидят, что секции нет, и второй CREATE TABLE упадёт на duplicate_table
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (LOCK_KEY,))
+        for table in PARTITIONED_TABLES:
+            cur.execute(
+                """
+                SELECT gym.create_month_partitions(
+                    %s, CURRENT_DATE, (date_trunc('month', CURRENT_DATE) + %s * interval '1 month')::date
+                );
+                """,
+                (table, ahead),
+            )
+            created += cur.fetchone()[0]
+    if created:
+        log.info("Создано секций: %s", created)
+    return created
+
+
+def _maintain():
+    while True:
+        time.sleep(PARTITION_CHECK_INTERVAL)
+        try:
+            ensure_partitions()
+        except Exception as e:
+            log.error("Ошибка создания секций: %s", e)
+
+
+def startup():
+    """Вызывается при запуске бота: миграции, секции и их ежедневная проверка."""
+    global _maintainer
+    if ON_STARTUP:
+        apply()
+    ensure_partitions()
+    if _maintainer is None:
+        _maintainer = threading.Thread(target=_maintain, name="partitions", daemon=True)
+        _maintainer.start()
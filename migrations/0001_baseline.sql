@@ -0,0 +1,64 @@
+-- Приводит базу, созданную по database.sql до появления миграций, к общей
+-- исходной точке. На базе, где всё уже есть, ничего не меняет.
+
+CREATE TABLE IF NOT EXISTS gym.training_days (
+    chat_id BIGINT NOT NULL,
+    month DATE NOT NULL,
+    days INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id, month)
+);
+
+CREATE TABLE IF NOT EXISTS gym.exercise_daily (
+    chat_id BIGINT NOT NULL,
+    exercise_id INT NOT NULL REFERENCES gym.exercises(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    date DATE NOT NULL,
+    sets INT NOT NULL,
+    reps_sum INT NOT NULL,
+    weight_sum NUMERIC(12,2) NOT NULL,
+    max_weight NUMERIC(6,2),
+    volume NUMERIC(14,2) NOT NULL,
+    PRIMARY KEY (chat_id, exercise_id, date)
+);
+
+-- Таблицы выше только что созданы пустыми, а подходы в базе уже есть:
+-- без заполнения календарь, статистика упражнений, рекорды и сводка будут
+-- неверны. Запросы те же, что stats.BACKFILL_DAYS_SQL и
+-- stats.BACKFILL_ROLLUPS_SQL (cli.py backfill-days / backfill-rollups);
+-- если таблица уже была заполнена, она не трогается.
+INSERT INTO gym.training_days (chat_id, month, days)
+SELECT chat_id, date_trunc('month', date)::date, bit_or(1 << (extract(day FROM date)::int - 1))
+FROM (
+    SELECT chat_id, date FROM gym.workout_stats
+    UNION
+    SELECT chat_id, date FROM gym.supersets
+) t
+WHERE NOT EXISTS (SELECT 1 FROM gym.training_days)
+GROUP BY 1, 2;
+
+INSERT INTO gym.exercise_daily (chat_id, exercise_id, date, sets, reps_sum, weight_sum, max_weight, volume)
+SELECT chat_id, exercise_id, date, count(*),
+       sum(coalesce(reps, 0)), sum(coalesce(weight, 0)), max(weight),
+       sum(coalesce(reps, 0) * coalesce(weight, 0))
+FROM (
+    SELECT chat_id, date, exercise_id, reps_count AS reps, weight_kg AS weight
+    FROM gym.workout_stats
+    UNION ALL
+    SELECT chat_id, date, first_exercise_id, first_reps_count, first_weight_kg
+    FROM gym.supersets
+    UNION ALL
+    SELECT chat_id, date, second_exercise_id, second_reps_count, second_weight_kg
+    FROM gym.supersets
+) t
+WHERE exercise_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM gym.exercise_daily)
+GROUP BY chat_id, exercise_id, date;
+
+CREATE TABLE IF NOT EXISTS gym.sessions (
+    chat_id BIGINT PRIMARY KEY,
+    data JSONB NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE gym.workout_stats ADD COLUMN IF NOT EXISTS message_id BIGINT, ADD COLUMN IF NOT EXISTS flow_id BIGINT;
+ALTER TABLE gym.supersets ADD COLUMN IF NOT EXISTS message_id BIGINT, ADD COLUMN IF NOT EXISTS flow_id BIGINT;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_workout_stats_update ON gym.workout_stats (chat_id, message_id, flow_id, set_number);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_supersets_update ON gym.supersets (chat_id, message_id, flow_id, set_number);
@@ -0,0 +1,140 @@
+-- Секционирование gym.workout_stats и gym.supersets по месяцам (RANGE по date).
+--
+-- Запросы бота всегда фильтруют по дате (сводка за день, итоги за период),
+-- поэтому читают одну-две секции. Секции на будущие месяцы создаёт
+-- gym.create_month_partitions (бот вызывает её при запуске и раз в сутки),
+-- а строки с датой вне созданных секций попадают в секцию DEFAULT.
+-- Первичный и уникальный ключи секционированной таблицы обязаны содержать
+-- ключ секционирования, поэтому в них добавлен date.
+
+CREATE OR REPLACE FUNCTION gym.create_month_partitions(parent TEXT, from_month DATE, to_month DATE)
+RETURNS INT AS $$
+DECLARE
+    m DATE := date_trunc('month', from_month)::date;
+    part TEXT;
+    created INT := 0;
+BEGIN
+    WHILE m <= to_month LOOP
+        part := format('%s_%s', parent, to_char(m, 'YYYYMM'));
+        IF to_regclass(format('gym.%I', part)) IS NULL THEN
+            BEGIN
+                EXECUTE format(
+                    'CREATE TABLE gym.%I PARTITION OF gym.%I FOR VALUES FROM (%L) TO (%L)',
+                    part, parent, m, (m + interval '1 month')::date
+                );
+                created := created + 1;
+            EXCEPTION WHEN check_violation THEN
+                -- В DEFAULT уже есть строки за этот месяц: секция не создаётся,
+                -- строки остаются в DEFAULT
+                RAISE WARNING 'Секция % не создана: в DEFAULT есть строки за этот месяц', part;
+            END;
+        END IF;
+        m := (m + interval '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ---------- workout_stats ----------
+
+DROP INDEX IF EXISTS gym.idx_workout_stats_chat_date;
+DROP INDEX IF EXISTS gym.idx_workout_stats_exercise;
+DROP INDEX IF EXISTS gym.uq_workout_stats_update;
+ALTER TABLE gym.workout_stats RENAME TO workout_stats_old;
+ALTER TABLE gym.workout_stats_old RENAME CONSTRAINT workout_stats_pkey TO workout_stats_old_pkey;
+ALTER SEQUENCE gym.workout_stats_id_seq OWNED BY NONE;
+
+CREATE TABLE gym.workout_stats (
+    id INT NOT NULL DEFAULT nextval('gym.workout_stats_id_seq'),
+    chat_id BIGINT NOT NULL,
+    date DATE NOT NULL,
+    exercise_id INT REFERENCES gym.exercises(id) ON UPDATE CASCADE ON DELETE SET NULL,
+    set_number SMALLINT NOT NULL CHECK (set_number > 0),
+    weight_kg NUMERIC(6,2),
+    reps_count SMALLINT CHECK (reps_count > 0),
+    message_id BIGINT,
+    flow_id BIGINT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
+
+ALTER SEQUENCE gym.workout_stats_id_seq OWNED BY gym.workout_stats.id;
+
+SELECT gym.create_month_partitions(
+    'workout_stats',
+    coalesce((SELECT min(date) FROM gym.workout_stats_old), CURRENT_DATE),
+    (CURRENT_DATE + interval '3 months')::date
+);
+CREATE TABLE gym.workout_stats_default PARTITION OF gym.workout_stats DEFAULT;
+
+INSERT INTO gym.workout_stats (
+    id, chat_id, date, exercise_id, set_number, weight_kg, reps_count, message_id, flow_id, created_at
+)
+SELECT id, chat_id, date, exercise_id, set_number, weight_kg, reps_count, message_id, flow_id, created_at
+FROM gym.workout_stats_old;
+
+DROP TABLE gym.workout_stats_old;
+
+-- Сводка за день читает только индекс: ключ (chat_id, date), остальное в INCLUDE
+CREATE INDEX idx_workout_stats_chat_date ON gym.workout_stats (chat_id, date)
+    INCLUDE (created_at, exercise_id, set_number, weight_kg, reps_count);
+CREATE INDEX idx_workout_stats_exercise ON gym.workout_stats (exercise_id);
+CREATE INDEX brin_workout_stats_created_at ON gym.workout_stats USING brin (created_at);
+CREATE UNIQUE INDEX uq_workout_stats_update ON gym.workout_stats (chat_id, message_id, flow_id, set_number, date);
+
+-- ---------- supersets ----------
+
+DROP INDEX IF EXISTS gym.idx_supersets_chat_date;
+DROP INDEX IF EXISTS gym.idx_supersets_first_second;
+DROP INDEX IF EXISTS gym.uq_supersets_update;
+ALTER TABLE gym.supersets RENAME TO supersets_old;
+ALTER TABLE gym.supersets_old RENAME CONSTRAINT supersets_pkey TO supersets_old_pkey;
+ALTER SEQUENCE gym.supersets_id_seq OWNED BY NONE;
+
+CREATE TABLE gym.supersets (
+    id INT NOT NULL DEFAULT nextval('gym.supersets_id_seq'),
+    chat_id BIGINT NOT NULL,
+    date DATE NOT NULL,
+    first_exercise_id INT REFERENCES gym.exercises(id) ON UPDATE CASCADE ON DELETE SET NULL,
+    second_exercise_id INT REFERENCES gym.exercises(id) ON UPDATE CASCADE ON DELETE SET NULL,
+    set_number SMALLINT NOT NULL CHECK (set_number > 0),
+    first_weight_kg NUMERIC(6,2),
+    first_reps_count SMALLINT CHECK (first_reps_count > 0),
+    second_weight_kg NUMERIC(6,2),
+    second_reps_count SMALLINT CHECK (second_reps_count > 0),
+    message_id BIGINT,
+    flow_id BIGINT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
+
+ALTER SEQUENCE gym.supersets_id_seq OWNED BY gym.supersets.id;
+
+SELECT gym.create_month_partitions(
+    'supersets',
+    coalesce((SELECT min(date) FROM gym.supersets_old), CURRENT_DATE),
+    (CURRENT_DATE + interval '3 months')::date
+);
+CREATE TABLE gym.supersets_default PARTITION OF gym.supersets DEFAULT;
+
+INSERT INTO gym.supersets (
+    id, chat_id, date, first_exercise_id, second_exercise_id, set_number,
+    first_weight_kg, first_reps_count, second_weight_kg, second_reps_count,
+    message_id, flow_id, created_at
+)
+SELECT id, chat_id, date, first_exercise_id, second_exercise_id, set_number,
+       first_weight_kg, first_reps_count, second_weight_kg, second_reps_count,
+       message_id, flow_id, created_at
+FROM gym.supersets_old;
+
+DROP TABLE gym.supersets_old;
+
+CREATE INDEX idx_supersets_chat_date ON gym.supersets (chat_id, date)
+    INCLUDE (created_at, first_exercise_id, second_exercise_id, set_number,
+             first_weight_kg, first_reps_count, second_weight_kg, second_reps_count);
+CREATE INDEX idx_supersets_first_second ON gym.supersets (first_exercise_id, second_exercise_id);
+CREATE INDEX brin_supersets_created_at ON gym.supersets USING brin (created_at);
+CREATE UNIQUE INDEX uq_supersets_update ON gym.supersets (chat_id, message_id, flow_id, set_number, date);
+
+ANALYZE gym.workout_stats;
+ANALYZE gym.supersets;
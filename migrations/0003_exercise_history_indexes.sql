@@ -0,0 +1,10 @@
+-- История упражнения для аналитики (analytics.py) дочитывается по
+-- (chat_id, упражнение, id больше последнего прочитанного): индексы отдают
+-- только новые строки и сразу нужные столбцы, не трогая остальную историю.
+
+CREATE INDEX IF NOT EXISTS idx_workout_stats_chat_exercise ON gym.workout_stats (chat_id, exercise_id, id)
+    INCLUDE (date, created_at, weight_kg, reps_count);
+CREATE INDEX IF NOT EXISTS idx_supersets_chat_first ON gym.supersets (chat_id, first_exercise_id, id)
+    INCLUDE (date, created_at, first_weight_kg, first_reps_count);
+CREATE INDEX IF NOT EXISTS idx_supersets_chat_second ON gym.supersets (chat_id, second_exercise_id, id)
+    INCLUDE (date, created_at, second_weight_kg, second_reps_count);
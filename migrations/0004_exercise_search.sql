@@ -0,0 +1,8 @@
+-- Поиск упражнений в БД (search.py): триграммный индекс по нормализованному
+-- названию обслуживает и сходство (%), и поиск по началу (LIKE 'жим%').
+-- Выражение должно совпадать с search.DB_NAME_EXPR.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_exercises_name_trgm ON gym.exercises
+    USING gin (replace(lower(name), 'ё', 'е') gin_trgm_ops);
@@ -0,0 +1,33 @@
+-- Еженедельная сводка (digest.py). digest_runs - ход рассылки за неделю:
+-- после перезапуска она продолжается после last_chat_id (NULL - с начала:
+-- id групп отрицательные) и не повторяется; owner и heartbeat_at - аренда
+-- рассылки одним процессом. digest_items - итоги недели по чатам, которые
+-- считаются одним запросом и читаются порциями по ключу.
+-- digest_optout - чаты, отключившие сводку командой /digest.
+
+CREATE TABLE IF NOT EXISTS gym.digest_runs (
+    week DATE PRIMARY KEY,
+    last_chat_id BIGINT,
+    chats INT NOT NULL DEFAULT 0,
+    total INT,
+    owner TEXT,
+    heartbeat_at TIMESTAMPTZ,
+    started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+
+CREATE TABLE IF NOT EXISTS gym.digest_items (
+    week DATE NOT NULL,
+    chat_id BIGINT NOT NULL,
+    sessions INT NOT NULL,
+    sets INT NOT NULL,
+    tonnage NUMERIC(14,2) NOT NULL,
+    records INT NOT NULL,
+    top_group_id INT,
+    PRIMARY KEY (week, chat_id)
+);
+
+CREATE TABLE IF NOT EXISTS gym.digest_optout (
+    chat_id BIGINT PRIMARY KEY,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,287 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import config
+import metrics
+
+# ================================
+# ОЧЕРЕДЬ ИСХОДЯЩИХ СООБЩЕНИЙ
+# ================================
+# Обработчики не ждут Telegram: send_message и edit_message_text ставятся в
+# очередь и сразу возвращают None, а отправляют их фоновые потоки.
+#   - лимиты: общий token bucket на бота и отдельный на каждый чат;
+#   - сообщения одного чата уходят строго по порядку;
+#   - правка, поставленная сразу за ещё не отправленной правкой того же
+#     сообщения, сливается с ней;
+#   - правка, которая не меняет текст и клавиатуру, не отправляется;
+#   - 429 ждёт retry_after, сетевые ошибки и 5xx повторяются с растущей
+#     паузой; всё это происходит вне потока обработчика. Операция, которая
+#     после max_retries попыток или max_wait секунд ожидания так и не ушла,
+#     отбрасывается, чтобы не держать очередь своего чата.
+# Остальные методы бота вызываются напрямую. Включается в config.py:
+#
+#   OUTBOX = {
+#       'enabled': True,
+#       'global_rate': 30,     # сообщений в секунду на бота
+#       'chat_rate': 1,        # сообщений в секунду на чат...
+#       'chat_burst': 3,       # ...с допустимой пачкой
+#       'workers': 4,
+#       'max_retries': 5,      # попыток после сетевых ошибок и 5xx
+#       'max_429_retries': 10, # попыток после 429
+#       'max_wait': 120,       # секунд ожидания по retry_after на одну операцию
+#   }
+
+SETTINGS = getattr(config, "OUTBOX", {})
+ENABLED = bool(SETTINGS.get("enabled", False))
+GLOBAL_RATE = float(SETTINGS.get("global_rate", 30))
+CHAT_RATE = float(SETTINGS.get("chat_rate", 1))
+CHAT_BURST = float(SETTINGS.get("chat_burst", 3))
+WORKERS = int(SETTINGS.get("workers", 4))
+MAX_RETRIES = int(SETTINGS.get("max_retries", 5))
+MAX_429_RETRIES = int(SETTINGS.get("max_429_retries", 10))
+MAX_WAIT = float(SETTINGS.get("max_wait", 120))
+
+QUEUED = ("send_message", "edit_message_text")
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+# Сколько последних отрисованных сообщений помнить для отсева пустых правок
+RENDERED_CACHE_SIZE = 100000
+CHAT_BUCKETS_SIZE = 100000
+
+DROPPED = metrics.Counter("gym_outbox_dropped_total", "Исходящие, которые не были отправлены", ("reason",))
+RETRIES = metrics.Counter("gym_outbox_retries_total", "Повторные попытки отправки", ("reason",))
+
+log = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, now):
+        """Через сколько секунд будет доступен токен (0 - уже есть)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class _Op:
+    __slots__ = ("name", "args", "kwargs", "chat_id", "message_id", "attempts", "waited")
+
+    def __init__(self, name, args, kwargs):
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        self.attempts = 0
+        self.waited = 0.0  # секунд ожидания по retry_after
+        if name == "edit_message_text":
+            # edit_message_text(text, chat_id, message_id, ...)
+            self.chat_id = kwargs.get("chat_id", args[1] if len(args) > 1 else None)
+            self.message_id = kwargs.get("message_id", args[2] if len(args) > 2 else None)
+        else:
+            self.chat_id = kwargs.get("chat_id", args[0] if args else None)
+            self.message_id = None
+
+    def digest(self):
+        """Отпечаток содержимого: текст, клавиатура и режим разметки."""
+        text = self.kwargs.get("text")
+        if text is None:
+            pos = 0 if self.name == "edit_message_text" else 1
+            text = self.args[pos] if len(self.args) > pos else None
+        markup = self.kwargs.get("reply_markup")
+        if markup is not None and not isinstance(markup, str):
+            markup = markup.to_json()
+        return hash((text, markup, self.kwargs.get("parse_mode")))
+
+
+class Outbox:
+    """Обёртка над ботом: исходящие сообщения идут через очередь с лимитами."""
+
+    def __init__(self, target):
+        self._target = target
+        self._cond = threading.Condition()
+        self._chats = {}  # chat_id -> deque ожидающих операций
+        self._busy = set()  # чаты, чья операция сейчас отправляется
+        self._heap = []  # (когда можно отправлять, порядковый номер, chat_id)
+        self._seq = itertools.count()
+        self._global = TokenBucket(GLOBAL_RATE, max(GLOBAL_RATE, 1))
+        self._buckets = OrderedDict()
+        self._rendered = OrderedDict()  # (chat_id, message_id) -> отпечаток
+        self._rendered_lock = threading.Lock()
+        self._threads = []
+        self._stopping = False
+        metrics.gauge("gym_outbox_pending", "Исходящих в очереди", self.pending)
+
+    def __getattr__(self, name):
+        if name in QUEUED:
+            return lambda *args, **kwargs: self._enqueue(_Op(name, args, kwargs))
+        return getattr(self._target, name)
+
+    def pending(self):
+        return sum(len(q) for q in list(self._chats.values()))
+
+    # ---------- очередь ----------
+
+    def _schedule(self, chat_id, at):
+        heapq.heappush(self._heap, (at, next(self._seq), chat_id))
+        self._cond.notify()
+
+    def _enqueue(self, op):
+        with self._cond:
+            queue = self._chats.get(op.chat_id)
+            if queue is None:
+                queue = self._chats[op.chat_id] = deque()
+                if op.chat_id not in self._busy:
+                    self._schedule(op.chat_id, time.monotonic())
+            elif op.message_id is not None and queue:
+                last = queue[-1]
+                # Правка ещё не ушла и после неё ничего не поставлено: отправим
+                # сразу последнюю версию. Более ранняя правка не трогается,
+                # иначе новый текст обогнал бы сообщения, поставленные после неё.
+                if last.name == op.name and last.message_id == op.message_id:
+                    last.args, last.kwargs = op.args, op.kwargs
+                    DROPPED.inc("coalesced")
+                    return
+            queue.append(op)
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(CHAT_RATE, max(CHAT_BURST, 1))
+            if len(self._buckets) > CHAT_BUCKETS_SIZE:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(chat_id)
+        return bucket
+
+    def _next(self):
+        """Ждёт чат, которому можно отправлять, и забирает его первую операцию."""
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                at, _, chat_id = self._heap[0]
+                now = time.monotonic()
+                if at > now:
+                    self._cond.wait(at - now)
+                    continue
+                heapq.heappop(self._heap)
+                bucket = self._bucket(chat_id)
+                wait = max(bucket.wait_time(now), self._global.wait_time(now))
+                if wait > 0:
+                    self._schedule(chat_id, now + wait)
+                    continue
+                bucket.take()
+                self._global.take()
+                self._busy.add(chat_id)
+                return self._chats[chat_id].popleft()
+
+    def _done(self, op, retry_after=None):
+        with self._cond:
+            self._busy.discard(op.chat_id)
+            queue = self._chats[op.chat_id]
+            if retry_after is not None:
+                queue.appendleft(op)
+                self._schedule(op.chat_id, time.monotonic() + retry_after)
+            elif queue:
+                self._schedule(op.chat_id, time.monotonic())
+            else:
+                del self._chats[op.chat_id]
+                self._cond.notify_all()
+
+    # ---------- отправка ----------
+
+    def _remember(self, key, digest):
+        with self._rendered_lock:
+            self._rendered[key] = digest
+            self._rendered.move_to_end(key)
+            if len(self._rendered) > RENDERED_CACHE_SIZE:
+                self._rendered.popitem(last=False)
+
+    def _send(self, op):
+        """Отправляет операцию; возвращает паузу перед повтором или None."""
+        digest = op.digest()
+        if op.message_id is not None and self._rendered.get((op.chat_id, op.message_id)) == digest:
+            DROPPED.inc("unchanged")
+            return None
+        op.attempts += 1
+        try:
+            result = getattr(self._target, op.name)(*op.args, **op.kwargs)
+            if isinstance(result, Future):
+                result = result.result()
+        except Exception as e:
+            code = getattr(e, "error_code", None)
+            description = str(getattr(e, "description", "") or e)
+            if code == 400 and "message is not modified" in description:
+                self._remember((op.chat_id, op.message_id), digest)
+                DROPPED.inc("unchanged")
+                return None
+            if code == 429:
+                params = (getattr(e, "result_json", None) or {}).get("parameters") or {}
+                retry_after = float(params.get("retry_after", 1))
+                if op.attempts < MAX_429_RETRIES and op.waited + retry_after <= MAX_WAIT:
+                    op.waited += retry_after
+                    RETRIES.inc("429")
+                    return retry_after
+                DROPPED.inc("throttled")
+                log.warning("%s chat=%s не отправлено: 429 после %s попыток", op.name, op.chat_id, op.attempts)
+                return None
+            if (code is None or code >= 500) and op.attempts < MAX_RETRIES:
+                RETRIES.inc(str(code or type(e).__name__))
+                return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (op.attempts - 1))
+            DROPPED.inc("failed")
+            log.warning("Не удалось выполнить %s chat=%s: %s", op.name, op.chat_id, e)
+            return None
+        message_id = op.message_id or getattr(result, "message_id", None)
+        if message_id is not None:
+            self._remember((op.chat_id, message_id), digest)
+        return None
+
+    def _run(self):
+        while True:
+            op = self._next()
+            if op is None:
+                return
+            retry_after = None
+            try:
+                retry_after = self._send(op)
+            except Exception:
+                log.exception("Ошибка очереди исходящих chat=%s", op.chat_id)
+            finally:
+                self._done(op, retry_after)
+
+    def start(self):
+        if not self._threads:
+            for n in range(WORKERS):
+                t = threading.Thread(target=self._run, name=f"outbox-{n}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout=10.0):
+        """Дожидается отправки очереди (не дольше timeout секунд) и останавливает потоки."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while (self._chats or self._busy) and time.monotonic() < deadline:
+                self._cond.wait(0.1)
+            self._stopping = True
+            self._heap.clear()
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=1.0)
+        self._threads = []
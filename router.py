@@ -0,0 +1,65 @@
+import logging
+import time
+
+import metrics
+
+# ================================
+# МАРШРУТИЗАЦИЯ CALLBACK-ЗАПРОСОВ
+# ================================
+# callback_data имеет вид "действие:арг1:арг2". Строка разбирается один раз,
+# обработчик ищется по действию в словаре, аргументы приводятся к типам,
+# объявленным при регистрации:
+#
+#   @router.route("day", int, int, int)
+#   def stats_day_pick(call, y, m, d): ...
+
+_routes = {}
+
+log = logging.getLogger(__name__)
+
+
+def route(action, *arg_types):
+    def decorator(func):
+        if action in _routes:
+            raise ValueError(f"Обработчик для '{action}' уже зарегистрирован")
+        _routes[action] = (func, arg_types)
+        return func
+    return decorator
+
+
+def parse(data):
+    """Разбирает callback_data в (действие, [аргументы])."""
+    action, _, rest = (data or "").partition(":")
+    return action, rest.split(":") if rest else []
+
+
+def dispatch(call):
+    """Вызывает обработчик для call.data. Возвращает False, если обработчика нет."""
+    action, raw_args = parse(call.data)
+    entry = _routes.get(action)
+    if entry is None:
+        return False
+    func, arg_types = entry
+    if len(raw_args) != len(arg_types):
+        log.warning("Некорректный callback %r chat=%s", call.data, call.message.chat.id)
+        return False
+    try:
+        args = [t(a) for t, a in zip(arg_types, raw_args)]
+    except ValueError:
+        log.warning("Некорректный callback %r chat=%s", call.data, call.message.chat.id)
+        return False
+    # Время обработчика попадает в гистограмму по действию; неизвестные
+    # действия отсеяны выше, поэтому число меток ограничено
+    started = time.perf_counter()
+    try:
+        func(call, *args)
+    except Exception:
+        metrics.CALLBACK_ERRORS.inc(action)
+        raise
+    finally:
+        metrics.CALLBACK_SECONDS.observe(time.perf_counter() - started, action)
+    return True
+
+
+def actions():
+    return sorted(_routes)
@@ -0,0 +1,148 @@
+import bisect
+import itertools
+import re
+import threading
+
+import catalog
+import db
+
+# ================================
+# ПОИСК УПРАЖНЕНИЙ
+# ================================
+# Индекс строится по кэшу справочников и пересобирается при изменении
+# catalog.version. Названия нормализуются так же, как для сортировки меню
+# (без регистра, ё = е), и разбиваются на слова. Сначала ищется совпадение
+# по началам слов: каждое слово запроса - начало какого-то слова названия,
+# так "жим лёж" находит "Жим лёжа". Если так ничего нет - по триграммам
+# (как pg_trgm), это прощает опечатки. Если пусто и в памяти, запрос уходит
+# в БД по индексу pg_trgm (миграция 0004): упражнение могло появиться в
+# другом процессе, а уведомление о нём потеряться.
+
+MIN_SIMILARITY = 0.3
+# Нормализация в БД: то же выражение, что в индексе idx_exercises_name_trgm
+DB_NAME_EXPR = "replace(lower(name), 'ё', 'е')"
+
+SEARCH_SQL = f"""
+    SELECT id, muscle_group_id, name
+    FROM gym.exercises
+    WHERE {DB_NAME_EXPR} %% %(query)s OR {DB_NAME_EXPR} LIKE %(prefix)s
+    ORDER BY similarity({DB_NAME_EXPR}, %(query)s) DESC, name
+    LIMIT %(limit)s;
+"""
+
+_WORD_RE = re.compile(r"\w+")
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+
+
+def normalize(text):
+    return " ".join(_WORD_RE.findall(text.casefold().replace("ё", "е")))
+
+
+def trigrams(text):
+    """Триграммы слов, как их считает pg_trgm: слово дополняется двумя
+    пробелами слева и одним справа."""
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class Index:
+    def __init__(self, exercises):
+        ordered = sorted(exercises, key=lambda e: catalog.sort_key((e[0], e[2])))
+        self.rank = {ex_id: n for n, (ex_id, _, _) in enumerate(ordered)}
+        self.items = {ex_id: (ex_id, group_id, name) for ex_id, group_id, name in ordered}
+        self.names = {ex_id: normalize(name) for ex_id, _, name in ordered}
+        # Отсортированные пары (слово, id): слова с данным началом - отрезок
+        pairs = sorted({(word, ex_id) for ex_id, text in self.names.items() for word in text.split()})
+        self.words = [word for word, _ in pairs]
+        self.word_ids = [ex_id for _, ex_id in pairs]
+        self.grams = {}
+        self.gram_counts = {}
+        for ex_id, text in self.names.items():
+            grams = trigrams(text)
+            self.gram_counts[ex_id] = len(grams)
+            for gram in grams:
+                self.grams.setdefault(gram, []).append(ex_id)
+
+    def by_prefix(self, words):
+        found = None
+        for word in words:
+            lo = bisect.bisect_left(self.words, word)
+            hi = bisect.bisect_left(self.words, word + "\uffff")
+            ids = set(self.word_ids[lo:hi])
+            found = ids if found is None else found & ids
+            if not found:
+                return []
+        return list(found)
+
+    def by_trigrams(self, query):
+        grams = trigrams(query)
+        if not grams:
+            return []
+        shared = {}
+        for gram in grams:
+            for ex_id in self.grams.get(gram, ()):
+                shared[ex_id] = shared.get(ex_id, 0) + 1
+        scored = []
+        for ex_id, n in shared.items():
+            similarity = n / (len(grams) + self.gram_counts[ex_id] - n)
+            if similarity >= MIN_SIMILARITY:
+                scored.append((-similarity, self.rank[ex_id], ex_id))
+        return [ex_id for _, _, ex_id in sorted(scored)]
+
+    def search(self, query, limit):
+        text = normalize(query)
+        if not text:
+            return []
+        ids = self.by_prefix(text.split())
+        if ids:
+            # Сначала точное совпадение, затем названия, которые начинаются
+            # с запроса, затем остальные в порядке меню
+            ids.sort(key=lambda ex_id: (
+                self.names[ex_id] != text, not self.names[ex_id].startswith(text), self.rank[ex_id],
+            ))
+        else:
+            ids = self.by_trigrams(text)
+        return [self.items[ex_id] for ex_id in ids[:limit]]
+
+
+def _current():
+    global _index, _index_version
+    version = catalog.version
+    if _index_version != version or _index is None:
+        exercises = catalog.get_all_exercises()
+        with _lock:
+            if _index_version != version or _index is None:
+                _index = Index(exercises)
+                _index_version = version
+    return _index
+
+
+def _search_db(query, limit):
+    text = normalize(query)
+    prefix = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    rows = db.fetchall(SEARCH_SQL, {"query": text, "prefix": prefix, "limit": limit})
+    for ex_id, group_id, name in rows:
+        catalog.add_exercise(ex_id, group_id, name)
+    return [tuple(row) for row in rows]
+
+
+def search(query, limit=20):
+    """Упражнения по запросу: [(id, группа, название)], лучшие совпадения первыми."""
+    if not normalize(query):
+        return []
+    return _current().search(query, limit) or _search_db(query, limit)
+
+
+def is_exact(query, item):
+    return normalize(query) == normalize(item[2])
+
+
+def browse(limit=20):
+    """Первые упражнения в порядке меню - для пустого запроса."""
+    return list(itertools.islice(_current().items.values(), limit))
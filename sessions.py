@@ -0,0 +1,236 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import config
+import db
+import metrics
+
+# ================================
+# СОСТОЯНИЯ ПОЛЬЗОВАТЕЛЕЙ
+# ================================
+# Состояние чата - компактная запись со слотами. В памяти держится LRU-кэш
+# активных чатов с вытеснением по размеру и по времени простоя; при
+# постоянном хранилище каждое изменение состояния сразу записывается в него,
+# поэтому ожидаемый ввод названия переживает перезапуск. Настройка в config.py:
+#
+#   SESSIONS = {
+#       'backend': 'memory',      # memory | sqlite | postgres
+#       'path': 'sessions.db',    # файл для sqlite
+#       'max_size': 10000,        # сколько чатов держать в памяти
+#       'ttl': 6 * 3600,          # через сколько секунд простоя чат вытесняется
+#   }
+
+SETTINGS = getattr(config, "SESSIONS", {})
+
+# Ход тренировки передаётся в кнопках (flow.py); здесь остаётся только то,
+# что нужно между сообщениями: ожидаемый текстовый ввод и его контекст, а
+# также выбранное упражнение (суперсет) для записи подходов текстом (bulk.py)
+# и день, когда оно выбрано
+FIELDS = ("mode", "awaiting_input", "flow", "active_flow", "active_day", "stat_group_id")
+
+
+class ChatState:
+    """Состояние одного чата. Поддерживает обращение как к словарю: state["reps"]."""
+
+    __slots__ = FIELDS + ("dirty",)
+
+    def __init__(self, data=None):
+        self.dirty = False
+        for key, value in (data or {}).items():
+            if key in FIELDS:
+                setattr(self, key, value)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+        self.dirty = True
+
+    def __contains__(self, key):
+        return key in FIELDS and hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in FIELDS else default
+
+    def clear(self):
+        for key in FIELDS:
+            if hasattr(self, key):
+                delattr(self, key)
+        self.dirty = True
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in FIELDS if hasattr(self, key)}
+
+
+# ================================
+# ХРАНИЛИЩА
+# ================================
+
+class MemoryBackend:
+    """Без постоянного хранения: состояние живёт только в памяти процесса."""
+
+    def load(self, chat_id):
+        return None
+
+    def save(self, chat_id, data):
+        pass
+
+
+class SqliteBackend:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (chat_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL);"
+        )
+
+    def load(self, chat_id):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM sessions WHERE chat_id = ?;", (chat_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, chat_id, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (chat_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (chat_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at;",
+                (chat_id, json.dumps(data), time.time()),
+            )
+
+
+class PostgresBackend:
+    """Таблица gym.sessions - общее состояние для нескольких процессов бота."""
+
+    def load(self, chat_id):
+        row = db.fetchone("SELECT data FROM gym.sessions WHERE chat_id = %s;", (chat_id,))
+        return row[0] if row else None
+
+    def save(self, chat_id, data):
+        db.execute(
+            """
+            INSERT INTO gym.sessions (chat_id, data, updated_at) VALUES (%s, %s, NOW())
+            ON CONFLICT (chat_id) DO UPDATE SET data = EXCLUDED.data, updated_at = EXCLUDED.updated_at;
+            """,
+            (chat_id, json.dumps(data)),
+        )
+
+
+def _make_backend():
+    kind = SETTINGS.get("backend", "memory")
+    if kind == "sqlite":
+        return SqliteBackend(SETTINGS.get("path", "sessions.db"))
+    if kind == "postgres":
+        return PostgresBackend()
+    return MemoryBackend()
+
+
+# ================================
+# LRU-КЭШ АКТИВНЫХ ЧАТОВ
+# ================================
+
+MAX_SIZE = int(SETTINGS.get("max_size", 10000))
+TTL = float(SETTINGS.get("ttl", 6 * 3600))
+
+_backend = _make_backend()
+# Состояние хранится не только в памяти: get и save могут обращаться к диску или БД
+PERSISTENT = not isinstance(_backend, MemoryBackend)
+_lock = threading.Lock()
+_cache = OrderedDict()  # chat_id -> (ChatState, время последнего обращения)
+# Вытесненные состояния, изменения которых ещё не записаны: обработчик
+# мог изменить состояние, а кэш - вытеснить его до вызова save
+_unsaved = {}
+# Чаты без сохранённого состояния: peek не ходит за ними в хранилище до TTL
+_missing = OrderedDict()  # chat_id -> время проверки
+
+
+def _evict(now):
+    while _cache:
+        chat_id, (state, touched) = next(iter(_cache.items()))
+        if len(_cache) > MAX_SIZE or now - touched > TTL:
+            del _cache[chat_id]
+            if state.dirty:
+                _unsaved[chat_id] = state
+        else:
+            break
+    while _missing:
+        chat_id, checked = next(iter(_missing.items()))
+        if len(_missing) > MAX_SIZE or now - checked > TTL:
+            del _missing[chat_id]
+        else:
+            break
+
+
+def get(chat_id, create=True):
+    """Возвращает состояние чата; при create=False не создаёт новое."""
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(chat_id)
+        if entry is not None:
+            _cache[chat_id] = (entry[0], now)
+            _cache.move_to_end(chat_id)
+            return entry[0]
+        state = _unsaved.pop(chat_id, None)
+        if state is None and not create:
+            checked = _missing.get(chat_id)
+            if checked is not None and now - checked <= TTL:
+                return None
+    if state is None:
+        data = _backend.load(chat_id)
+        if data is None and not create:
+            with _lock:
+                _missing[chat_id] = now
+                _missing.move_to_end(chat_id)
+                _evict(now)
+            return None
+        state = ChatState(data)
+    with _lock:
+        # Другой поток мог успеть загрузить то же состояние
+        entry = _cache.get(chat_id)
+        if entry is not None:
+            state = entry[0]
+        _missing.pop(chat_id, None)
+        _cache[chat_id] = (state, now)
+        _cache.move_to_end(chat_id)
+        _evict(now)
+    return state
+
+
+def peek(chat_id):
+    return get(chat_id, create=False)
+
+
+def save(chat_id):
+    """Записывает изменённое состояние в хранилище (write-through после обработчика)."""
+    with _lock:
+        entry = _cache.get(chat_id)
+        # Вытесненное после изменения состояние записывается всё равно
+        state = _unsaved.pop(chat_id, None) if entry is None else entry[0]
+    if state is None or not state.dirty:
+        return
+    state.dirty = False
+    try:
+        _backend.save(chat_id, state.to_dict())
+    except Exception:
+        state.dirty = True
+        with _lock:
+            if chat_id not in _cache:
+                _unsaved.setdefault(chat_id, state)
+        raise
+
+
+def size():
+    return len(_cache)
+
+
+metrics.gauge("gym_sessions_active", "Чатов с состоянием в памяти", size)
@@ -0,0 +1,418 @@
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from psycopg2.extras import execute_values
+
+import adb
+import catalog
+import db
+
+# ================================
+# ИНДЕКС ТРЕНИРОВОЧНЫХ ДНЕЙ
+# ================================
+# gym.training_days хранит для каждого чата и месяца битовую маску дней,
+# в которые были подходы (бит 0 - 1-е число). Маска обновляется в той же
+# транзакции, что и вставка подходов, а календарь читает её из кэша процесса.
+# Для истории, записанной до появления индекса: python cli.py backfill-days
+#
+# Функции с суффиксом _async - то же для asyncio-режима: запросы идут через
+# асинхронный пул (adb.py), кэши общие.
+
+DAYS_CACHE_SIZE = 50000
+
+TRAINED_DAYS_SQL = "SELECT days FROM gym.training_days WHERE chat_id = %s AND month = %s;"
+
+UPSERT_DAYS_SQL = """
+    INSERT INTO gym.training_days (chat_id, month, days) VALUES %s
+    ON CONFLICT (chat_id, month) DO UPDATE SET days = gym.training_days.days | EXCLUDED.days;
+"""
+
+BACKFILL_DAYS_SQL = """
+    INSERT INTO gym.training_days (chat_id, month, days)
+    SELECT chat_id, date_trunc('month', date)::date, bit_or(1 << (extract(day FROM date)::int - 1))
+    FROM (
+        SELECT chat_id, date FROM gym.workout_stats
+        WHERE %(chat_id)s::bigint IS NULL OR chat_id = %(chat_id)s
+        UNION
+        SELECT chat_id, date FROM gym.supersets
+        WHERE %(chat_id)s::bigint IS NULL OR chat_id = %(chat_id)s
+    ) t
+    GROUP BY 1, 2
+    ON CONFLICT (chat_id, month) DO UPDATE SET days = EXCLUDED.days;
+"""
+
+_days_lock = threading.Lock()
+_days_cache = OrderedDict()  # (chat_id, год, месяц) -> маска
+# Растёт при каждой записи дней: маска, прочитанная до записи, не попадёт в кэш
+_days_epoch = 0
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def _days_from_mask(mask):
+    return frozenset(d for d in range(1, 32) if mask & (1 << (d - 1)))
+
+
+def _cache_put(key, mask, epoch):
+    with _days_lock:
+        if epoch != _days_epoch:
+            return
+        _days_cache[key] = mask
+        _days_cache.move_to_end(key)
+        while len(_days_cache) > DAYS_CACHE_SIZE:
+            _days_cache.popitem(last=False)
+
+
+def trained_days(chat_id, year, month):
+    """Множество чисел месяца, в которые у чата были тренировки."""
+    key = (chat_id, year, month)
+    mask = _days_cache.get(key)
+    if mask is None:
+        epoch = _days_epoch
+        row = db.fetchone(TRAINED_DAYS_SQL, (chat_id, date(year, month, 1)))
+        mask = row[0] if row else 0
+        _cache_put(key, mask, epoch)
+    return _days_from_mask(mask)
+
+
+async def trained_days_async(chat_id, year, month):
+    key = (chat_id, year, month)
+    mask = _days_cache.get(key)
+    if mask is None:
+        epoch = _days_epoch
+        row = await adb.fetchone(TRAINED_DAYS_SQL, (chat_id, date(year, month, 1)))
+        mask = row[0] if row else 0
+        _cache_put(key, mask, epoch)
+    return _days_from_mask(mask)
+
+
+def _masks(pairs):
+    masks = {}
+    for chat_id, day in pairs:
+        key = (chat_id, day.year, day.month)
+        masks[key] = masks.get(key, 0) | (1 << (day.day - 1))
+    return masks
+
+
+def _days_rows(pairs):
+    return [(chat_id, date(y, m, 1), mask) for (chat_id, y, m), mask in _masks(pairs).items()]
+
+
+def record_days(cur, pairs):
+    """Отмечает дни (chat_id, date) в индексе; вызывается внутри транзакции вставки."""
+    rows = _days_rows(pairs)
+    if rows:
+        execute_values(cur, UPSERT_DAYS_SQL, rows)
+
+
+async def record_days_async(cur, pairs):
+    rows = _days_rows(pairs)
+    if rows:
+        await adb.insert_values(cur, UPSERT_DAYS_SQL, rows)
+
+
+def note_days(pairs):
+    """Обновляет кэш после фиксации транзакции."""
+    global _days_epoch
+    masks = _masks(pairs)
+    with _days_lock:
+        _days_epoch += 1
+        for key, mask in masks.items():
+            if key in _days_cache:
+                _days_cache[key] |= mask
+
+
+def backfill_days():
+    global _days_epoch
+    with db.transaction() as cur:
+        cur.execute(BACKFILL_DAYS_SQL, {"chat_id": None})
+        count = cur.rowcount
+    with _days_lock:
+        _days_epoch += 1
+        _days_cache.clear()
+    return count
+
+
+# ================================
+# СВОДКА ЗА ДЕНЬ
+# ================================
+# Готовый текст сводки кэшируется по (chat_id, дата) и сбрасывается только
+# при записи подхода этого чата за этот день. Подходы и суперсеты читаются
+# одним запросом, названия берутся из кэша справочников.
+
+SUMMARY_CACHE_SIZE = 20000
+
+DAY_ROWS_SQL = """
+    SELECT created_at, FALSE, exercise_id, NULL::int, set_number,
+           weight_kg, reps_count, NULL::numeric, NULL::smallint
+    FROM gym.workout_stats
+    WHERE chat_id = %(chat_id)s AND date = %(day)s AND exercise_id IS NOT NULL
+    UNION ALL
+    SELECT created_at, TRUE, first_exercise_id, second_exercise_id, set_number,
+           first_weight_kg, first_reps_count, second_weight_kg, second_reps_count
+    FROM gym.supersets
+    WHERE chat_id = %(chat_id)s AND date = %(day)s
+      AND first_exercise_id IS NOT NULL AND second_exercise_id IS NOT NULL
+    ORDER BY 1
+"""
+
+_summary_lock = threading.Lock()
+_summary_cache = OrderedDict()  # (chat_id, дата) -> текст
+# Растёт при каждой инвалидации: сводка, прочитанная до записи, не попадёт в кэш
+_summary_epoch = 0
+
+
+def format_weight_text(w):
+    if w is None:
+        return "нет кг"
+    s = ("{:g}".format(w)).replace('.', ',')
+    return f"{s} кг"
+
+
+def format_pair(reps, weight):
+    reps_txt = f"{reps}" if reps is not None else "–"
+    weight_txt = format_weight_text(weight)
+    return f"{reps_txt} x {weight_txt}"
+
+
+def _exercise_label(ex_id):
+    return catalog.group_name(catalog.exercise_group(ex_id)), catalog.exercise_name(ex_id)
+
+
+def render_day_summary(the_day, rows):
+    singles_grouped = {}
+    supers = []
+    for created, is_superset, ex1, ex2, set_no, w1, r1, w2, r2 in rows:
+        if is_superset:
+            supers.append((_exercise_label(ex1), _exercise_label(ex2), set_no, w1, r1, w2, r2))
+        else:
+            singles_grouped.setdefault(_exercise_label(ex1), []).append((set_no, r1, w1))
+    lines = [f"Статистика за {the_day.strftime('%d.%m.%Y')}:\n"]
+    if singles_grouped:
+        lines.append("Одиночные упражнения:")
+        for (gname, exname), sets in singles_grouped.items():
+            lines.append(f"- ({gname}) {exname}:")
+            for set_no, r, w in sets:
+                lines.append(f"{set_no}) {format_pair(r, w)}")
+            lines.append("")
+    if supers:
+        lines.append("Суперсеты:\n")
+        for (g1, n1), (g2, n2), set_no, w1, r1, w2, r2 in supers:
+            lines.append(f"- Сет {set_no}:")
+            lines.append(f"1) ({g1}) {n1}: {format_pair(r1, w1)};")
+            lines.append(f"2) ({g2}) {n2}: {format_pair(r2, w2)}")
+    if not singles_grouped and not supers:
+        lines.append("Нет данных за выбранный день.")
+    return "\n".join(lines).rstrip()
+
+
+def _summary_put(key, text, epoch):
+    with _summary_lock:
+        if epoch == _summary_epoch:
+            _summary_cache[key] = text
+            while len(_summary_cache) > SUMMARY_CACHE_SIZE:
+                _summary_cache.popitem(last=False)
+
+
+def day_summary(chat_id, the_day):
+    """Текст сводки за день: из кэша или одним запросом к БД."""
+    key = (chat_id, the_day)
+    text = _summary_cache.get(key)
+    if text is not None:
+        return text
+    epoch = _summary_epoch
+    rows = db.fetchall(DAY_ROWS_SQL, {"chat_id": chat_id, "day": the_day})
+    text = render_day_summary(the_day, rows)
+    _summary_put(key, text, epoch)
+    return text
+
+
+async def day_summary_async(chat_id, the_day):
+    key = (chat_id, the_day)
+    text = _summary_cache.get(key)
+    if text is not None:
+        return text
+    epoch = _summary_epoch
+    rows = await adb.fetchall(DAY_ROWS_SQL, {"chat_id": chat_id, "day": the_day})
+    text = render_day_summary(the_day, rows)
+    _summary_put(key, text, epoch)
+    return text
+
+
+def invalidate_summaries(pairs):
+    """Сбрасывает сводки для (chat_id, дата), в которые записаны подходы."""
+    global _summary_epoch
+    with _summary_lock:
+        _summary_epoch += 1
+        for key in set(pairs):
+            _summary_cache.pop(key, None)
+
+
+# ================================
+# СВОДКИ ПО УПРАЖНЕНИЯМ
+# ================================
+# gym.exercise_daily - накопительные итоги по (чат, упражнение, день):
+# число подходов, сумма повторений, сумма весов, максимальный вес и объём
+# (повторения x вес). Обе половины суперсета учитываются как подходы своих
+# упражнений. Итоги обновляются в транзакции вставки, статистика за любой
+# период считается по ним, а не по сырым подходам.
+# Для истории, записанной до появления таблицы: python cli.py backfill-rollups
+
+# Периоды статистики в днях (0 - за всё время) и их подписи
+WINDOWS = {7: "неделю", 30: "месяц", 90: "3 месяца", 365: "год", 0: "всё время"}
+
+UPSERT_ROLLUPS_SQL = """
+    INSERT INTO gym.exercise_daily (chat_id, exercise_id, date, sets, reps_sum, weight_sum, max_weight, volume)
+    VALUES %s
+    ON CONFLICT (chat_id, exercise_id, date) DO UPDATE SET
+        sets = gym.exercise_daily.sets + EXCLUDED.sets,
+        reps_sum = gym.exercise_daily.reps_sum + EXCLUDED.reps_sum,
+        weight_sum = gym.exercise_daily.weight_sum + EXCLUDED.weight_sum,
+        max_weight = GREATEST(gym.exercise_daily.max_weight, EXCLUDED.max_weight),
+        volume = gym.exercise_daily.volume + EXCLUDED.volume;
+"""
+
+BACKFILL_ROLLUPS_SQL = """
+    INSERT INTO gym.exercise_daily (chat_id, exercise_id, date, sets, reps_sum, weight_sum, max_weight, volume)
+    SELECT chat_id, exercise_id, date, count(*),
+           sum(coalesce(reps, 0)), sum(coalesce(weight, 0)), max(weight),
+           sum(coalesce(reps, 0) * coalesce(weight, 0))
+    FROM (
+        SELECT chat_id, date, exercise_id, reps_count AS reps, weight_kg AS weight
+        FROM gym.workout_stats
+        UNION ALL
+        SELECT chat_id, date, first_exercise_id, first_reps_count, first_weight_kg
+        FROM gym.supersets
+        UNION ALL
+        SELECT chat_id, date, second_exercise_id, second_reps_count, second_weight_kg
+        FROM gym.supersets
+    ) t
+    WHERE exercise_id IS NOT NULL AND (%(chat_id)s::bigint IS NULL OR chat_id = %(chat_id)s)
+    GROUP BY chat_id, exercise_id, date
+    ON CONFLICT (chat_id, exercise_id, date) DO UPDATE SET
+        sets = EXCLUDED.sets,
+        reps_sum = EXCLUDED.reps_sum,
+        weight_sum = EXCLUDED.weight_sum,
+        max_weight = EXCLUDED.max_weight,
+        volume = EXCLUDED.volume;
+"""
+
+EXERCISE_STATS_SQL = """
+    SELECT coalesce(sum(sets), 0), coalesce(sum(reps_sum), 0), coalesce(sum(weight_sum), 0),
+           max(max_weight), coalesce(sum(volume), 0)
+    FROM gym.exercise_daily
+    WHERE chat_id = %s AND exercise_id = %s AND date >= %s;
+"""
+
+
+def _exercise_sets(sets, supersets):
+    """Разворачивает строки вставки в (chat_id, exercise_id, дата, повторения, вес)."""
+    for chat_id, day, ex_id, _, weight, reps in sets:
+        yield chat_id, ex_id, day, reps, weight
+    for chat_id, day, ex1, ex2, _, w1, r1, w2, r2 in supersets:
+        yield chat_id, ex1, day, r1, w1
+        yield chat_id, ex2, day, r2, w2
+
+
+def _rollup_rows(sets, supersets):
+    totals = {}
+    for chat_id, ex_id, day, reps, weight in _exercise_sets(sets, supersets):
+        if ex_id is None:
+            continue
+        key = (chat_id, ex_id, day)
+        n, reps_sum, weight_sum, max_weight, volume = totals.get(key, (0, 0, 0.0, None, 0.0))
+        reps = reps or 0
+        if weight is not None:
+            weight = float(weight)
+            if max_weight is None or weight > max_weight:
+                max_weight = weight
+        totals[key] = (
+            n + 1,
+            reps_sum + reps,
+            weight_sum + (weight or 0.0),
+            max_weight,
+            volume + reps * (weight or 0.0),
+        )
+    return [key + value for key, value in totals.items()]
+
+
+def record_rollups(cur, sets, supersets):
+    """Добавляет вставленные подходы к итогам; вызывается внутри транзакции вставки."""
+    rows = _rollup_rows(sets, supersets)
+    if rows:
+        execute_values(cur, UPSERT_ROLLUPS_SQL, rows)
+
+
+async def record_rollups_async(cur, sets, supersets):
+    rows = _rollup_rows(sets, supersets)
+    if rows:
+        await adb.insert_values(cur, UPSERT_ROLLUPS_SQL, rows)
+
+
+def _since(days):
+    return date.min if days == 0 else date.today() - timedelta(days=days)
+
+
+def _exercise_result(row):
+    num_sets, reps_sum, weight_sum, max_weight, volume = row
+    return {
+        "sets": num_sets,
+        "avg_reps": round(reps_sum / num_sets, 2) if num_sets else 0,
+        "avg_weight": round(float(weight_sum) / num_sets, 2) if num_sets else 0,
+        "max_weight": float(max_weight) if max_weight is not None else None,
+        "volume": round(float(volume), 2),
+    }
+
+
+def exercise_stats(chat_id, ex_id, days):
+    """Итоги по упражнению за последние days дней (0 - за всё время)."""
+    return _exercise_result(db.fetchone(EXERCISE_STATS_SQL, (chat_id, ex_id, _since(days))))
+
+
+async def exercise_stats_async(chat_id, ex_id, days):
+    return _exercise_result(await adb.fetchone(EXERCISE_STATS_SQL, (chat_id, ex_id, _since(days))))
+
+
+def backfill_rollups():
+    with db.transaction() as cur:
+        cur.execute(BACKFILL_ROLLUPS_SQL, {"chat_id": None})
+        return cur.rowcount
+
+
+# ================================
+# ПЕРЕСЧЁТ ПО ЧАТУ
+# ================================
+# После массовой загрузки истории проще пересчитать индекс дней и итоги
+# чата целиком, чем разбирать вставленные строки.
+
+CHAT_CHANNEL = "gym_chat_data"
+
+
+def notify_chat(cur, chat_id):
+    """Просит все процессы бота сбросить кэши чата (внутри транзакции записи)."""
+    cur.execute("SELECT pg_notify(%s, %s);", (CHAT_CHANNEL, str(chat_id)))
+
+
+def rebuild_chat(cur, chat_id):
+    """Пересчитывает training_days и exercise_daily чата внутри транзакции загрузки."""
+    cur.execute(BACKFILL_DAYS_SQL, {"chat_id": chat_id})
+    cur.execute(BACKFILL_ROLLUPS_SQL, {"chat_id": chat_id})
+
+
+def forget_chat(chat_id):
+    """Сбрасывает кэши чата после фиксации транзакции загрузки."""
+    global _summary_epoch, _days_epoch
+    with _days_lock:
+        _days_epoch += 1
+        for key in [k for k in _days_cache if k[0] == chat_id]:
+            del _days_cache[key]
+    with _summary_lock:
+        _summary_epoch += 1
+        for key in [k for k in _summary_cache if k[0] == chat_id]:
+            del _summary_cache[key]
+
+
+catalog.subscribe(CHAT_CHANNEL, lambda payload: forget_chat(int(payload)))
@@ -0,0 +1,15 @@
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Тестам нужен только токен (ключ подписи flow.py): config.py с настройками
+# бота и БД в репозитории не хранится
+try:
+    import config  # noqa: F401
+except ImportError:
+    config = types.ModuleType("config")
+    config.TOKEN = "123456:test"
+    config.DB_CONFIG = {}
+    sys.modules["config"] = config
@@ -0,0 +1,59 @@
+import pytest
+
+import bulk
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("10x50, 8x55, 6x60", [(10, 50.0), (8, 55.0), (6, 60.0)]),
+    ("10х52,5; 8*55", [(10, 52.5), (8, 55.0)]),
+    ("10x50,8x55", [(10, 50.0), (8, 55.0)]),
+    ("3x10@40", [(10, 40.0)] * 3),
+    ("12, 10 8", [(12, None), (10, None), (8, None)]),
+    ("3x15@0", [(15, None)] * 3),
+])
+def test_parse_single(text, expected):
+    assert bulk.parse(text) == expected
+
+
+def test_parse_superset():
+    assert bulk.parse("10x50+12x20, 8x55+12", superset=True) == [((10, 50.0), (12, 20.0)), ((8, 55.0), (12, None))]
+    assert bulk.parse("3x10@40+12", superset=True) == [((10, 40.0), (12, None))] * 3
+
+
+def test_parse_superset_needs_both_sides():
+    with pytest.raises(ValueError):
+        bulk.parse("10x50, 8x55", superset=True)
+    with pytest.raises(ValueError):
+        bulk.parse("3x10@40+2x12@20", superset=True)
+
+
+@pytest.mark.parametrize("text", [
+    f"{bulk.MAX_SETS + 1}x10@40",
+    ", ".join(["10x50"] * (bulk.MAX_SETS + 1)),
+    f"{bulk.MAX_REPS + 1}x50",
+    "0x50",
+    f"10x{bulk.MAX_WEIGHT + 1}",
+    "10x50.125",
+    "0x10@40",
+])
+def test_parse_limits(text):
+    with pytest.raises(ValueError):
+        bulk.parse(text)
+
+
+def test_parse_max_values_accepted():
+    sets = bulk.parse(f"{bulk.MAX_SETS}x{bulk.MAX_REPS}@{bulk.MAX_WEIGHT}")
+    assert sets == [(bulk.MAX_REPS, float(bulk.MAX_WEIGHT))] * bulk.MAX_SETS
+
+
+@pytest.mark.parametrize("text", ["", "   ", "10x", "10x50 abc", "x50", "10x50 ,, 8x55", "@40"])
+def test_parse_garbage(text):
+    with pytest.raises(ValueError):
+        bulk.parse(text)
+
+
+def test_looks_like():
+    assert bulk.looks_like("10x50, 8x55")
+    assert bulk.looks_like("3х10@40")
+    assert not bulk.looks_like("жим лёжа")
+    assert not bulk.looks_like("3 жим")
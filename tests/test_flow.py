@@ -0,0 +1,44 @@
+import pytest
+
+import flow
+
+# Наибольшие значения, которые должны помещаться в кнопку: повторения и
+# номер подхода - SMALLINT, вес - NUMERIC(6,2), id - см. комментарий в flow.py
+MAX_GROUP_ID = 2 ** 14 - 1
+MAX_EXERCISE_ID = 2 ** 21 - 1
+MAX_REPS = 32767
+MAX_WEIGHT = 9999.99
+# flow_id в 2033 году
+LATE_FLOW_ID = 2 ** 28 - 1
+
+
+def worst_superset():
+    return flow.Flow(
+        flow.SUPERSET, flow_id=LATE_FLOW_ID, set_number=32767,
+        s1_muscle_group_id=MAX_GROUP_ID, s1_exercise_id=MAX_EXERCISE_ID, s1_reps=MAX_REPS, s1_weight=MAX_WEIGHT,
+        s2_muscle_group_id=MAX_GROUP_ID, s2_exercise_id=MAX_EXERCISE_ID, s2_reps=MAX_REPS, s2_weight=MAX_WEIGHT,
+    )
+
+
+def test_worst_case_superset_fits():
+    ctx = worst_superset()
+    token = flow.encode(ctx)
+    assert len(token) <= flow.MAX_TOKEN
+    assert len("add_weight:12.5:" + token) <= 64
+    assert flow.decode(token) == ctx
+
+
+def test_new_id_is_compact():
+    assert 0 < flow.new_id() < LATE_FLOW_ID
+
+
+def test_overflow_raises_too_long():
+    ctx = worst_superset().replace(s1_exercise_id=2 ** 31 - 1, s2_exercise_id=2 ** 31 - 1, flow_id=2 ** 40)
+    with pytest.raises(flow.TooLong):
+        flow.encode(ctx)
+
+
+def test_tampered_token_rejected():
+    token = flow.encode(flow.Flow(flow.SINGLE, flow_id=flow.new_id(), set_number=1, exercise_id=5))
+    with pytest.raises(ValueError):
+        flow.decode(token[:-2] + ("AA" if token[-2:] != "AA" else "BB"))
@@ -0,0 +1,53 @@
+import search
+
+EXERCISES = [
+    (1, 1, "Жим лёжа"),
+    (2, 1, "Жим гантелей лёжа"),
+    (3, 1, "Разводка гантелей"),
+    (4, 2, "Приседания со штангой"),
+    (5, 3, "Тяга штанги в наклоне"),
+    (6, 1, "Жим"),
+]
+
+
+def index():
+    return search.Index(EXERCISES)
+
+
+def names(found):
+    return [name for _, _, name in found]
+
+
+def test_prefix_hit():
+    assert names(index().search("жим лёж", 10)) == ["Жим лёжа", "Жим гантелей лёжа"]
+
+
+def test_prefix_ignores_case_and_yo():
+    assert names(index().search("ЖИМ ЛЕЖА", 10)) == ["Жим лёжа", "Жим гантелей лёжа"]
+
+
+def test_exact_name_first():
+    found = index().search("жим", 10)
+    assert names(found) == ["Жим", "Жим гантелей лёжа", "Жим лёжа"]
+    assert search.is_exact("жим", found[0])
+
+
+def test_typo_hit_by_trigrams():
+    idx = index()
+    assert idx.by_prefix(["присидания"]) == []
+    assert names(idx.search("присидания", 10)) == ["Приседания со штангой"]
+
+
+def test_limit():
+    assert len(index().search("жим", 2)) == 2
+
+
+def test_empty_query():
+    idx = index()
+    assert idx.search("", 10) == []
+    assert idx.search("  !? ", 10) == []
+    assert search.search("") == []
+
+
+def test_no_match():
+    assert index().search("бёрпи", 10) == []
@@ -0,0 +1,206 @@
+import json
+
+import db
+import stats
+import writer
+
+# ================================
+# ВЫГРУЗКА И ЗАГРУЗКА ИСТОРИИ
+# ================================
+# Выгрузка идёт потоком: CSV - через COPY ... TO STDOUT, JSON (по объекту на
+# строку) - через серверный курсор, поэтому память не зависит от объёма
+# истории. Загрузка копирует CSV через COPY во временную таблицу и одним
+# запросом на таблицу переносит строки в gym.workout_stats / gym.supersets,
+# сопоставляя названия упражнений со справочником.
+#
+# Формат CSV (заголовок обязателен, лишние столбцы не допускаются):
+#   date, kind, muscle_group, exercise, set_number, weight_kg, reps_count,
+#   muscle_group_2, exercise_2, weight_kg_2, reps_count_2, created_at
+# Для загрузки достаточно date, exercise и reps_count; kind - set (по
+# умолчанию) или superset, тогда заполняются и столбцы *_2. Дата - ГГГГ-ММ-ДД
+# или ДД.ММ.ГГГГ, вес можно писать с запятой.
+
+COLUMNS = (
+    "date", "kind", "muscle_group", "exercise", "set_number", "weight_kg", "reps_count",
+    "muscle_group_2", "exercise_2", "weight_kg_2", "reps_count_2", "created_at",
+)
+REQUIRED = ("date", "exercise", "reps_count")
+JSON_ITERSIZE = 2000
+
+EXPORT_SQL = """
+    SELECT s.date, 'set' AS kind, g.name AS muscle_group, e.name AS exercise, s.set_number,
+           s.weight_kg, s.reps_count, NULL AS muscle_group_2, NULL AS exercise_2,
+           NULL::numeric AS weight_kg_2, NULL::smallint AS reps_count_2, s.created_at
+    FROM gym.workout_stats s
+    LEFT JOIN gym.exercises e ON e.id = s.exercise_id
+    LEFT JOIN gym.muscle_groups g ON g.id = e.muscle_group_id
+    WHERE s.chat_id = %(chat_id)s
+    UNION ALL
+    SELECT ss.date, 'superset', g1.name, e1.name, ss.set_number,
+           ss.first_weight_kg, ss.first_reps_count, g2.name, e2.name,
+           ss.second_weight_kg, ss.second_reps_count, ss.created_at
+    FROM gym.supersets ss
+    LEFT JOIN gym.exercises e1 ON e1.id = ss.first_exercise_id
+    LEFT JOIN gym.muscle_groups g1 ON g1.id = e1.muscle_group_id
+    LEFT JOIN gym.exercises e2 ON e2.id = ss.second_exercise_id
+    LEFT JOIN gym.muscle_groups g2 ON g2.id = e2.muscle_group_id
+    WHERE ss.chat_id = %(chat_id)s
+    ORDER BY date, created_at
+"""
+
+
+def _norm(expr):
+    # То же сравнение названий, что и в catalog.sort_key: без регистра, ё = е
+    return f"replace(lower(trim({expr})), 'ё', 'е')"
+
+
+STAGE_SQL = """
+    CREATE TEMP TABLE import_rows (
+        n BIGSERIAL,
+        {columns}
+    ) ON COMMIT DROP;
+""".format(columns=",\n        ".join(f"{c} TEXT" for c in COLUMNS))
+
+# Каждое различное (группа, упражнение) из файла сопоставляется один раз.
+# Без группы берётся упражнение с таким названием с наименьшим id.
+RESOLVE_SQL = f"""
+    CREATE TEMP TABLE import_names ON COMMIT DROP AS
+    SELECT n.grp, n.ex, (
+        SELECT e.id
+        FROM gym.exercises e
+        JOIN gym.muscle_groups g ON g.id = e.muscle_group_id
+        WHERE {_norm("e.name")} = n.ex AND (coalesce(n.grp, '') = '' OR {_norm("g.name")} = n.grp)
+        ORDER BY e.id
+        LIMIT 1
+    ) AS exercise_id
+    FROM (
+        SELECT {_norm("muscle_group")} AS grp, {_norm("exercise")} AS ex FROM import_rows
+        UNION
+        SELECT {_norm("muscle_group_2")}, {_norm("exercise_2")} FROM import_rows
+        WHERE trim(kind) = 'superset'
+    ) n;
+"""
+
+
+def _exercise_join(alias, group_col, exercise_col):
+    return (
+        f"JOIN import_names {alias} ON {alias}.grp IS NOT DISTINCT FROM {_norm(group_col)} "
+        f"AND {alias}.ex = {_norm(exercise_col)} AND {alias}.exercise_id IS NOT NULL"
+    )
+
+
+def _num(col):
+    return f"nullif(replace(trim({col}), ',', '.'), '')::numeric"
+
+
+def _int(col):
+    return f"nullif(trim({col}), '')::smallint"
+
+
+# Номер подхода, если его нет в файле, - порядок строки среди подходов
+# того же упражнения за тот же день. Уже существующие подходы (тот же день,
+# упражнение и номер) пропускаются, поэтому повторная загрузка файла ничего
+# не дублирует.
+IMPORT_SETS_SQL = f"""
+    INSERT INTO gym.workout_stats (chat_id, date, exercise_id, set_number, weight_kg, reps_count)
+    SELECT %(chat_id)s, t.date, t.exercise_id, t.set_number, t.weight_kg, t.reps_count
+    FROM (
+        SELECT r.date::date AS date, x.exercise_id,
+               coalesce({_int("r.set_number")},
+                        row_number() OVER (PARTITION BY r.date::date, x.exercise_id ORDER BY r.n))::smallint AS set_number,
+               {_num("r.weight_kg")} AS weight_kg, {_int("r.reps_count")} AS reps_count
+        FROM import_rows r
+        {_exercise_join("x", "r.muscle_group", "r.exercise")}
+        WHERE coalesce(nullif(trim(r.kind), ''), 'set') = 'set'
+    ) t
+    WHERE NOT EXISTS (
+        SELECT 1 FROM gym.workout_stats w
+        WHERE w.chat_id = %(chat_id)s AND w.date = t.date
+          AND w.exercise_id = t.exercise_id AND w.set_number = t.set_number
+    );
+"""
+
+IMPORT_SUPERSETS_SQL = f"""
+    INSERT INTO gym.supersets (
+        chat_id, date, first_exercise_id, second_exercise_id, set_number,
+        first_weight_kg, first_reps_count, second_weight_kg, second_reps_count
+    )
+    SELECT %(chat_id)s, t.date, t.ex1, t.ex2, t.set_number, t.w1, t.r1, t.w2, t.r2
+    FROM (
+        SELECT r.date::date AS date, x1.exercise_id AS ex1, x2.exercise_id AS ex2,
+               coalesce({_int("r.set_number")},
+                        row_number() OVER (PARTITION BY r.date::date, x1.exercise_id, x2.exercise_id ORDER BY r.n))::smallint AS set_number,
+               {_num("r.weight_kg")} AS w1, {_int("r.reps_count")} AS r1,
+               {_num("r.weight_kg_2")} AS w2, {_int("r.reps_count_2")} AS r2
+        FROM import_rows r
+        {_exercise_join("x1", "r.muscle_group", "r.exercise")}
+        {_exercise_join("x2", "r.muscle_group_2", "r.exercise_2")}
+        WHERE trim(r.kind) = 'superset'
+    ) t
+    WHERE NOT EXISTS (
+        SELECT 1 FROM gym.supersets w
+        WHERE w.chat_id = %(chat_id)s AND w.date = t.date AND w.first_exercise_id = t.ex1
+          AND w.second_exercise_id = t.ex2 AND w.set_number = t.set_number
+    );
+"""
+
+
+def export_csv(chat_id, out):
+    """Пишет историю чата в CSV (в бинарный поток out). Возвращает число строк."""
+    writer.flush_chat(chat_id)
+    with db.transaction() as cur:
+        query = cur.mogrify(EXPORT_SQL, {"chat_id": chat_id}).decode("utf-8")
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", out)
+        return cur.rowcount
+
+
+def export_json(chat_id, out):
+    """Пишет историю чата в JSON Lines (в бинарный поток out). Возвращает число строк."""
+    writer.flush_chat(chat_id)
+    count = 0
+    with db.transaction(name=f"export_{chat_id}") as cur:
+        cur.itersize = JSON_ITERSIZE
+        cur.execute(EXPORT_SQL, {"chat_id": chat_id})
+        for row in cur:
+            record = {k: v for k, v in zip(COLUMNS, row) if v is not None}
+            out.write(json.dumps(record, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+            count += 1
+    return count
+
+
+def import_csv(chat_id, src, dry_run=False):
+    """Загружает CSV из бинарного потока src.
+
+    Возвращает словарь: rows - строк в файле, sets / supersets - добавлено,
+    unknown - названия упражнений, которых нет в справочнике.
+    """
+    header = src.readline().decode("utf-8-sig").strip()
+    columns = [c.strip().lower() for c in header.split(",")]
+    unknown_columns = [c for c in columns if c not in COLUMNS]
+    if unknown_columns:
+        raise ValueError(f"Неизвестные столбцы: {', '.join(unknown_columns)}")
+    missing = [c for c in REQUIRED if c not in columns]
+    if missing:
+        raise ValueError(f"Нет обязательных столбцов: {', '.join(missing)}")
+    writer.flush_chat(chat_id)
+    params = {"chat_id": chat_id}
+    with db.transaction() as cur:
+        cur.execute("SET LOCAL datestyle = 'ISO, DMY';")
+        cur.execute(STAGE_SQL)
+        cur.copy_expert(f"COPY import_rows ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", src)
+        rows = cur.rowcount
+        cur.execute(RESOLVE_SQL)
+        cur.execute("SELECT grp, ex FROM import_names WHERE exercise_id IS NULL ORDER BY ex;")
+        unknown = [f"({grp}) {ex}" if grp else ex for grp, ex in cur.fetchall()]
+        cur.execute(IMPORT_SETS_SQL, params)
+        sets = cur.rowcount
+        cur.execute(IMPORT_SUPERSETS_SQL, params)
+        supersets = cur.rowcount
+        if dry_run:
+            cur.connection.rollback()
+        elif sets or supersets:
+            stats.rebuild_chat(cur, chat_id)
+            stats.notify_chat(cur, chat_id)
+    if not dry_run and (sets or supersets):
+        stats.forget_chat(chat_id)
+    return {"rows": rows, "sets": sets, "supersets": supersets, "unknown": unknown}
@@ -0,0 +1,383 @@
+import asyncio
+import atexit
+import logging
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+import adb
+import config
+import db
+import journal
+import metrics
+import stats
+
+# ================================
+# ОТЛОЖЕННАЯ ЗАПИСЬ ПОДХОДОВ
+# ================================
+# Подходы и суперсеты всех чатов копятся в памяти и пишутся в БД одним
+# многострочным INSERT, когда набралось max_batch строк или прошло
+# max_delay секунд с первой неподтверждённой строки. Включается в config.py:
+#
+#   WRITE_BEHIND = {'enabled': True, 'max_batch': 200, 'max_delay': 1.0, 'max_pending': 10000}
+#
+# Гарантии: при остановке бота очередь сбрасывается; при падении процесса
+# теряется не больше max_delay секунд записей; экраны статистики вызывают
+# flush_chat, поэтому пользователь всегда видит свои только что записанные
+# подходы. Если БД недоступна, строки возвращаются в очередь, а при
+# переполнении max_pending запись выполняется синхронно в потоке обработчика.
+#
+# С журналом (journal.py) подход сначала записывается на локальный диск, и
+# обработчик на этом заканчивает: ни задержка, ни недоступность Postgres на
+# запись подхода не влияют. Фоновый поток переносит журнал в БД пачками по
+# max_batch строк, а пока БД недоступна - повторяет попытки с нарастающей
+# паузой. Журнал заменяет очередь в памяти (WRITE_BEHIND тогда не нужен):
+#
+#   WRITE_JOURNAL = {'enabled': True, 'path': 'journal.db', 'max_batch': 500}
+#
+# При запуске в несколько процессов (cluster.py) у каждого рабочего процесса
+# свой файл журнала: к пути добавляется номер процесса.
+#
+# В asyncio-режиме обработчики вызывают add_set_async и add_superset_async:
+# без журнала и очереди строки пишутся через асинхронный пул (adb.py) в
+# цикле событий. Журнал (локальный диск с fsync) и сброс переполненной
+# очереди выполняются в потоке, чтобы цикл событий их не ждал.
+
+SETTINGS = getattr(config, "WRITE_BEHIND", {})
+ENABLED = bool(SETTINGS.get("enabled", False))
+MAX_BATCH = int(SETTINGS.get("max_batch", 200))
+MAX_DELAY = float(SETTINGS.get("max_delay", 1.0))
+MAX_PENDING = int(SETTINGS.get("max_pending", 10000))
+
+JOURNAL = getattr(config, "WRITE_JOURNAL", {})
+JOURNAL_ENABLED = bool(JOURNAL.get("enabled", False))
+JOURNAL_PATH = JOURNAL.get("path", "journal.db")
+JOURNAL_BATCH = int(JOURNAL.get("max_batch", 500))
+# Пауза между попытками, пока БД недоступна: от 1 до RETRY_MAX секунд
+RETRY_MAX = 30.0
+
+# Повтор уже записанного подхода (тот же чат, сообщение, сеанс ввода и
+# номер) пропускается; RETURNING отдаёт только действительно вставленные
+# строки, и только они попадают в индекс дней и итоги по упражнениям.
+INSERT_SETS_SQL = """
+    INSERT INTO gym.workout_stats (
+        chat_id, date, exercise_id, set_number, weight_kg, reps_count, message_id, flow_id
+    ) VALUES %s
+    ON CONFLICT (chat_id, message_id, flow_id, set_number, date) DO NOTHING
+    RETURNING chat_id, date, exercise_id, set_number, weight_kg, reps_count;
+"""
+
+INSERT_SUPERSETS_SQL = """
+    INSERT INTO gym.supersets (
+        chat_id, date, first_exercise_id, second_exercise_id,
+        set_number, first_weight_kg, first_reps_count, second_weight_kg, second_reps_count,
+        message_id, flow_id
+    ) VALUES %s
+    ON CONFLICT (chat_id, message_id, flow_id, set_number, date) DO NOTHING
+    RETURNING chat_id, date, first_exercise_id, second_exercise_id,
+              set_number, first_weight_kg, first_reps_count, second_weight_kg, second_reps_count;
+"""
+
+_cond = threading.Condition()
+_flush_lock = threading.Lock()
+_sets = []
+_supersets = []
+_pending_chats = set()
+_inflight_chats = set()
+_first_pending_at = None
+_stopping = False
+_thread = None
+_journal = None
+_journal_ready = False  # в журнале появились строки, поток переноса разбудить
+
+log = logging.getLogger(__name__)
+
+
+def _write(sets, supersets):
+    with db.transaction() as cur:
+        if sets:
+            sets = execute_values(cur, INSERT_SETS_SQL, sets, page_size=len(sets), fetch=True)
+        if supersets:
+            supersets = execute_values(cur, INSERT_SUPERSETS_SQL, supersets, page_size=len(supersets), fetch=True)
+        days = [(row[0], row[1]) for row in sets] + [(row[0], row[1]) for row in supersets]
+        stats.record_days(cur, days)
+        stats.record_rollups(cur, sets, supersets)
+    stats.note_days(days)
+    stats.invalidate_summaries(days)
+
+
+async def _write_async(sets, supersets):
+    async with adb.transaction() as cur:
+        if sets:
+            sets = await adb.insert_values(cur, INSERT_SETS_SQL, sets, fetch=True)
+        if supersets:
+            supersets = await adb.insert_values(cur, INSERT_SUPERSETS_SQL, supersets, fetch=True)
+        days = [(row[0], row[1]) for row in sets] + [(row[0], row[1]) for row in supersets]
+        await stats.record_days_async(cur, days)
+        await stats.record_rollups_async(cur, sets, supersets)
+    stats.note_days(days)
+    stats.invalidate_summaries(days)
+
+
+def _append(sets=(), supersets=()):
+    """Пишет строки в журнал; False, если журнал не используется."""
+    global _journal_ready
+    if _journal is None:
+        return False
+    _journal.append(sets, supersets)
+    with _cond:
+        _journal_ready = True
+        _cond.notify()
+    return True
+
+
+def _enqueue(queue, rows):
+    """Ставит строки в очередь; True, если очередь переполнена и её пора сбросить."""
+    global _first_pending_at
+    with _cond:
+        queue.extend(rows)
+        _pending_chats.update(row[0] for row in rows)
+        size = len(_sets) + len(_supersets)
+        if _first_pending_at is None:
+            # Будим поток сброса: с этой строки пошёл отсчёт max_delay
+            _first_pending_at = time.monotonic()
+            _cond.notify()
+        elif size >= MAX_BATCH:
+            _cond.notify()
+    return size >= MAX_PENDING
+
+
+def add_set(chat_id, day, exercise_id, set_number, weight, reps, message_id=None, flow_id=None):
+    row = (chat_id, day, exercise_id, set_number, weight, reps, message_id, flow_id)
+    if _append(sets=[row]):
+        return
+    if not ENABLED:
+        _write([row], [])
+        return
+    if _enqueue(_sets, [row]):
+        flush()
+
+
+def add_sets(chat_id, day, exercise_id, sets, message_id=None, flow_id=None):
+    """Несколько подходов одного упражнения: sets - [(номер, вес, повторения)].
+
+    Без отложенной записи они вставляются одним многострочным INSERT, с ней -
+    попадают в очередь разом и уходят в одном пакете.
+    """
+    rows = [(chat_id, day, exercise_id, n, weight, reps, message_id, flow_id) for n, weight, reps in sets]
+    if _append(sets=rows):
+        return
+    if not ENABLED:
+        _write(rows, [])
+        return
+    if _enqueue(_sets, rows):
+        flush()
+
+
+def add_superset(chat_id, day, first_exercise_id, second_exercise_id, set_number,
+                 first_weight, first_reps, second_weight, second_reps, message_id=None, flow_id=None):
+    row = (
+        chat_id, day, first_exercise_id, second_exercise_id, set_number,
+        first_weight, first_reps, second_weight, second_reps, message_id, flow_id,
+    )
+    if _append(supersets=[row]):
+        return
+    if not ENABLED:
+        _write([], [row])
+        return
+    if _enqueue(_supersets, [row]):
+        flush()
+
+
+def add_supersets(chat_id, day, first_exercise_id, second_exercise_id, sets, message_id=None, flow_id=None):
+    """Несколько сетов суперсета: sets - [(номер, вес1, повт1, вес2, повт2)], как add_sets."""
+    rows = [
+        (chat_id, day, first_exercise_id, second_exercise_id, n, w1, r1, w2, r2, message_id, flow_id)
+        for n, w1, r1, w2, r2 in sets
+    ]
+    if _append(supersets=rows):
+        return
+    if not ENABLED:
+        _write([], rows)
+        return
+    if _enqueue(_supersets, rows):
+        flush()
+
+
+async def _add_async(sets=(), supersets=()):
+    if _journal is not None:
+        await asyncio.to_thread(_append, sets, supersets)
+    elif ENABLED:
+        full = False
+        if sets:
+            full = _enqueue(_sets, sets)
+        if supersets:
+            full = _enqueue(_supersets, supersets) or full
+        if full:
+            await asyncio.to_thread(flush)
+    else:
+        await _write_async(list(sets), list(supersets))
+
+
+async def add_set_async(chat_id, day, exercise_id, set_number, weight, reps, message_id=None, flow_id=None):
+    """add_set для asyncio-режима."""
+    await _add_async(sets=[(chat_id, day, exercise_id, set_number, weight, reps, message_id, flow_id)])
+
+
+async def add_superset_async(chat_id, day, first_exercise_id, second_exercise_id, set_number,
+                             first_weight, first_reps, second_weight, second_reps, message_id=None, flow_id=None):
+    """add_superset для asyncio-режима."""
+    await _add_async(supersets=[(
+        chat_id, day, first_exercise_id, second_exercise_id, set_number,
+        first_weight, first_reps, second_weight, second_reps, message_id, flow_id,
+    )])
+
+
+def _drain_journal():
+    """Переносит журнал в БД пачками; при ошибке БД строки остаются в журнале."""
+    global _journal_ready
+    with _flush_lock:
+        with _cond:
+            _journal_ready = False
+        while True:
+            upto, sets, supersets = _journal.read(JOURNAL_BATCH)
+            if upto is None:
+                return
+            _write(sets, supersets)
+            _journal.remove(upto, [row[0] for row in sets] + [row[0] for row in supersets])
+            log.debug("Из журнала записано подходов: %s, суперсетов: %s", len(sets), len(supersets))
+
+
+def flush():
+    """Записывает всё накопленное одной транзакцией."""
+    global _first_pending_at
+    if _journal is not None:
+        _drain_journal()
+        return
+    with _flush_lock:
+        with _cond:
+            sets, supersets = _sets[:], _supersets[:]
+            del _sets[:], _supersets[:]
+            _inflight_chats.update(_pending_chats)
+            _pending_chats.clear()
+            _first_pending_at = None
+        if not sets and not supersets:
+            return
+        try:
+            _write(sets, supersets)
+        except Exception:
+            with _cond:
+                _sets[:0] = sets
+                _supersets[:0] = supersets
+                _pending_chats.update(_inflight_chats)
+                _first_pending_at = time.monotonic()
+            raise
+        finally:
+            with _cond:
+                _inflight_chats.clear()
+        log.debug("Записано подходов: %s, суперсетов: %s", len(sets), len(supersets))
+
+
+def flush_chat(chat_id):
+    """Чтение своих записей: перед показом статистики сбрасывает очередь, если в ней есть строки чата."""
+    if _journal is not None:
+        if _journal.has_chat(chat_id):
+            _drain_journal()
+    elif chat_id in _pending_chats or chat_id in _inflight_chats:
+        flush()
+
+
+async def flush_chat_async(chat_id):
+    """flush_chat для asyncio-режима: сброс в потоке, только если у чата есть незаписанные строки."""
+    if _journal is not None:
+        pending = _journal.has_chat(chat_id)
+    else:
+        pending = chat_id in _pending_chats or chat_id in _inflight_chats
+    if pending:
+        await asyncio.to_thread(flush_chat, chat_id)
+
+
+def _run_journal():
+    delay = 0.0
+    while True:
+        with _cond:
+            while not _stopping and not _journal_ready and not delay:
+                _cond.wait()
+            if _stopping:
+                return
+            if delay:
+                # Новые строки не ускоряют повтор: БД ещё недоступна
+                _cond.wait(delay)
+                if _stopping:
+                    return
+        try:
+            _drain_journal()
+            if delay:
+                log.info("Запись в БД восстановлена, в журнале строк: %s", len(_journal))
+            delay = 0.0
+        except Exception as e:
+            if not delay:
+                log.error("Ошибка записи журнала в БД, строки остаются в журнале: %s", e)
+            delay = min(RETRY_MAX, max(1.0, delay * 2))
+
+
+def _run():
+    while True:
+        with _cond:
+            while not _stopping:
+                if len(_sets) + len(_supersets) >= MAX_BATCH:
+                    break
+                if _first_pending_at is None:
+                    _cond.wait()
+                    continue
+                remaining = _first_pending_at + MAX_DELAY - time.monotonic()
+                if remaining <= 0:
+                    break
+                _cond.wait(remaining)
+            if _stopping:
+                return
+        try:
+            flush()
+        except Exception as e:
+            log.error("Ошибка отложенной записи: %s", e)
+            time.sleep(1)
+
+
+def start():
+    global _thread, _journal, _journal_ready
+    if _thread is not None:
+        return
+    if JOURNAL_ENABLED:
+        _journal = journal.Journal(JOURNAL_PATH)
+        if len(_journal):
+            log.info("В журнале незаписанных строк: %s", len(_journal))
+            _journal_ready = True
+        _thread = threading.Thread(target=_run_journal, name="write-journal", daemon=True)
+    elif ENABLED:
+        _thread = threading.Thread(target=_run, name="write-behind", daemon=True)
+    else:
+        return
+    _thread.start()
+    atexit.register(stop)
+
+
+def stop():
+    global _stopping, _thread
+    with _cond:
+        _stopping = True
+        _cond.notify_all()
+    if _thread is not None:
+        _thread.join()
+        _thread = None
+    if _journal is None:
+        flush()
+        return
+    try:
+        _drain_journal()
+    except Exception as e:
+        log.warning("Журнал не перенесён в БД, строк: %s (будут записаны при следующем запуске): %s", len(_journal), e)
+
+
+metrics.gauge("gym_write_behind_pending", "Строк в очереди отложенной записи", lambda: len(_sets) + len(_supersets))
+metrics.gauge("gym_write_journal_pending", "Строк в журнале, ещё не записанных в БД", lambda: len(_journal) if _journal else 0)